@@ -1,65 +1,211 @@
-import os
+import click
+from flask.cli import with_appcontext
 from dotenv import load_dotenv
 from flask import Flask, jsonify
-from flask_debugtoolbar import DebugToolbarExtension
-from models.models import connect_db
+from models.models import db, connect_db
 from flask_cors import CORS
-from flask_jwt_extended import (
-    verify_jwt_in_request,
-    JWTManager
-)
-from models.User import User
+from flask_jwt_extended import JWTManager
+from jwt_auth import verify_jwt_once
+from json_provider import FastJSONProvider
+import metrics
+from config import get_config
+from engine import instrument
+from cache import TTLCache
+from replica import ReadReplica
+from models.User import User, UserIdentity
+from hashing import PasswordHasher, password_hasher, calibrate, HashingBusy
+from models.UserHoursSummary import UserHoursSummary
+from models.RefreshToken import RefreshToken
 from routes.users import users
 from routes.auth import auth
 from routes.experiences import experiences
 
 load_dotenv()
 
-app = Flask(__name__)
-
-app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-
-# enable cors
-CORS(app)
-
-# Setup the Flask-JWT-Extended extension
-app.config["JWT_SECRET_KEY"] = os.environ["JWT_SECRET_KEY"]
-jwt = JWTManager(app)
-
-connect_db(app)
-debug = DebugToolbarExtension(app)  # debug
-
 # from sqlalchemy.exc import IntegrityError
 
+jwt = JWTManager()
+
 @jwt.user_identity_loader
 def user_identity_lookup(user):
     return user.id
 
+@jwt.additional_claims_loader
+def add_claims_to_token(user):
+    """Embed what authorization checks need, so they skip the database"""
+
+    return UserIdentity.get_claims(user)
+
 @jwt.user_lookup_loader
 def user_lookup_callback(_jwt_header, jwt_data):
-    identity = jwt_data["sub"]
-    return User.query.filter_by(id=identity).one_or_none()
+    """Load current_user: a UserIdentity, from the token's claims"""
+
+    return UserIdentity.from_claims(jwt_data)
+
+@jwt.token_in_blocklist_loader
+def check_token_version(_jwt_header, jwt_data):
+    """
+    Reject access tokens minted before the user's admin rights or status
+    last changed. The current version is served from identity_cache.
+    Refresh tokens are checked against refresh_tokens instead.
+    """
+
+    if jwt_data["type"] == "refresh":
+        return False
+
+    identity = User.get_identity(jwt_data["sub"])
+    return identity is None or identity.token_version != jwt_data.get("ver")
 
-@app.before_request
 def verify_jwt():
     """
     Check that a token is valid, if it is provided.
     Token is optional in this route - authentication only.
+    Verified once per request; skipped for preflights and public routes.
     If invalid token received, returns JSON:
     { "errors": "Invalid token" }
     """
 
     try:
-        jwt = verify_jwt_in_request(locations=['headers', 'cookies'], optional=True)
-        print("JWT VERIFIED as ", jwt)
+        verify_jwt_once()
     except Exception:
         return jsonify(errors="Invalid token"), 401
 
 
-app.register_blueprint(auth, url_prefix="/auth")
-app.register_blueprint(users, url_prefix="/users")
-app.register_blueprint(experiences, url_prefix="/experiences")
+def hashing_busy(error):
+    """
+    Password hashing is saturated: fail fast so the client retries later.
+    Returns JSON: { "errors": "Server busy, try again shortly" }
+    """
+
+    return (
+        jsonify(errors="Server busy, try again shortly"),
+        503,
+        {"Retry-After": str(error.retry_after)}
+    )
+
+
+@click.command("rebuild-hours-summary")
+@with_appcontext
+@click.option(
+    "--verify-only",
+    is_flag=True,
+    help="Report drift without rebuilding the summary."
+)
+def rebuild_hours_summary(verify_only):
+    """
+    Recompute user_hours_summary from experiences and report any drift
+    between the stored and recomputed summaries.
+    """
+
+    drift = UserHoursSummary.verify()
+    for d in drift:
+        click.echo(
+            f"user {d['user_id']}: stored={d['stored']} computed={d['computed']}"
+        )
+    click.echo(f"{len(drift)} user(s) with drifted hours summary")
+
+    if not verify_only:
+        UserHoursSummary.rebuild()
+        db.session.commit()
+        click.echo("Rebuilt user_hours_summary")
+    elif drift:
+        raise click.exceptions.Exit(1)
+
+
+@click.command("prune-refresh-tokens")
+@with_appcontext
+def prune_refresh_tokens():
+    """Delete expired refresh tokens, revoked or not."""
+
+    pruned = RefreshToken.prune()
+    db.session.commit()
+    click.echo(f"Deleted {pruned} expired refresh token(s)")
+
+
+@click.command("calibrate-bcrypt")
+@with_appcontext
+@click.option(
+    "--budget-ms",
+    default=250,
+    show_default=True,
+    help="Latency budget for checking one password, in milliseconds."
+)
+def calibrate_bcrypt(budget_ms):
+    """
+    Time bcrypt on this host at increasing costs and recommend the highest
+    BCRYPT_LOG_ROUNDS that checks a password within the latency budget.
+    """
+
+    timings, recommended = calibrate(budget_ms / 1000)
+    for rounds, seconds in timings:
+        click.echo(f"rounds={rounds:<3} {seconds * 1000:9.1f} ms")
+
+    click.echo(f"Current BCRYPT_LOG_ROUNDS={password_hasher.rounds}")
+    if recommended is None:
+        click.echo(f"No cost checks a password within {budget_ms} ms")
+        raise click.exceptions.Exit(1)
+
+    click.echo(f"Recommended BCRYPT_LOG_ROUNDS={recommended}")
+
+
+def create_app(config=None):
+    """
+    Create the app. config is a profile name in config.PROFILES, or a dict
+    of settings over the APP_ENV profile's.
+
+    No app context is pushed and no connection opened, so the app can be
+    created once before forking workers (gunicorn --preload). Each app has
+    its own caches, hashing pool, replica and engines, in app.extensions.
+    """
+
+    if isinstance(config, str):
+        settings = get_config(config)
+    else:
+        settings = {**get_config(), **(config or {})}
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.update(settings)
+
+    # enable cors
+    CORS(app)
+
+    # Setup the Flask-JWT-Extended extension
+    jwt.init_app(app)
+
+    identity_cache = app.extensions["identity_cache"] = TTLCache(
+        maxsize=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL']
+    )
+    PasswordHasher().init_app(app)
+
+    connect_db(app)
+    with app.app_context():
+        instrument(db.engine)
+        app.extensions["engines"] = {"primary": db.engine}
+    ReadReplica().init_app(app)
+
+    if app.config['DEBUG_TOOLBAR']:
+        # Imported here, so production workers never load it
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    # Server-Timing header and /metrics; before verify_jwt, so it is timed too
+    metrics.init_app(app, caches={"user_identity": identity_cache})
+
+    app.before_request(verify_jwt)
+    app.register_error_handler(HashingBusy, hashing_busy)
+
+    app.register_blueprint(auth, url_prefix="/auth")
+    app.register_blueprint(users, url_prefix="/users")
+    app.register_blueprint(experiences, url_prefix="/experiences")
+
+    app.cli.add_command(rebuild_hours_summary)
+    app.cli.add_command(prune_refresh_tokens)
+    app.cli.add_command(calibrate_bcrypt)
+
+    return app
+
 
+# For `flask run`, gunicorn app:app, scripts and tests
+app = create_app()
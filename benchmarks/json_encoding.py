@@ -0,0 +1,91 @@
+"""
+Benchmark encoding large list responses with each JSON provider.
+
+Compares Flask's default provider (the standard library encoder, with
+sorted keys) against FastJSONProvider, on the users and experiences list
+payloads for 100k seeded users and 100k experiences. Reports encode time
+and response body size. Rows are inserted in a transaction that is rolled
+back at the end.
+
+Run from the project root against a scratch database:
+    python -m benchmarks.json_encoding > /dev/null
+Results are written to stderr.
+"""
+
+import sys
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import app
+from json_provider import FastJSONProvider
+from models.models import db
+from models.User import User
+from models.Experience import Experience
+from models.UserHoursSummary import UserHoursSummary
+from routes.users import USER_ROW_COLUMNS, serialize_user_row
+from benchmarks.list_serialization import seed
+
+RUNS = 3
+
+
+def encode(provider, payload):
+    """Best of RUNS seconds to build a response, and its body size in bytes"""
+
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        response = provider.response(payload)
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, len(response.get_data())
+
+
+def main():
+    # The database is used outside of requests
+    app.app_context().push()
+    db.engine.echo = False
+
+    try:
+        seed()
+
+        bench_users = User.email.like("bench%@mail.com")
+
+        users = [serialize_user_row(row) for row in (db.session
+            .query(*USER_ROW_COLUMNS.values())
+            .outerjoin(UserHoursSummary, UserHoursSummary.user_id == User.id)
+            .filter(bench_users)
+            .order_by(User.id))]
+
+        experiences = [Experience.serialize_row(row) for row in (db.session
+            .query(*Experience.get_row_columns())
+            .join(User)
+            .filter(bench_users)
+            .order_by(Experience.id))]
+
+        payloads = [
+            ("users", {"users": users}),
+            ("experiences", {"experiences": experiences}),
+        ]
+        providers = [
+            ("stdlib", DefaultJSONProvider(app)),
+            ("fast", FastJSONProvider(app)),
+        ]
+
+        with app.app_context():
+            for payload_name, payload in payloads:
+                for provider_name, provider in providers:
+                    seconds, size = encode(provider, payload)
+                    print(
+                        f"{payload_name + ', ' + provider_name:<20} "
+                        f"{seconds * 1000:8.1f} ms {size / 1e6:6.2f} MB",
+                        file=sys.stderr
+                    )
+    finally:
+        db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark the per-request cost of JWT verification.
+
+Times authenticated, CORS preflight and public requests through the test
+client, and counts current_user lookups per request (with the identity
+cache disabled, each lookup is a query).
+
+Run from the project root against a scratch database:
+    python -m benchmarks.jwt_overhead > /dev/null
+Results are written to stderr.
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from flask_jwt_extended import create_access_token
+
+from app import app
+from models.models import db
+from models.User import User, identity_cache
+
+REQUESTS = 2000
+
+
+def timed(client, method, url, headers):
+    """Mean microseconds per request over REQUESTS requests"""
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.open(url, method=method, headers=headers)
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+def main():
+    # The database is used outside of requests
+    app.app_context().push()
+    db.engine.echo = False
+
+    User.query.filter_by(email="bench@mail.com").delete()
+    user = User.signup(
+        badge_number=None,
+        email="bench@mail.com",
+        password="password",
+        first_name="bench",
+        last_name="user",
+        dob=datetime(year=2000, month=1, day=1).isoformat(),
+        gender="Prefer not to say",
+        address="1 Cherry lane",
+        city="New York",
+        state="NY",
+        zip_code="11001",
+        phone_number="9991234567",
+        is_student=False,
+        is_healthcare_provider=False,
+        is_multilingual=False
+    )
+    db.session.commit()
+
+    token = create_access_token(identity=user)
+    auth = {"Authorization": f"Bearer {token}"}
+    preflight = {
+        "Origin": "http://localhost:3000",
+        "Access-Control-Request-Method": "GET",
+        "Access-Control-Request-Headers": "Authorization",
+    }
+    client = app.test_client()
+
+    cases = [
+        ("GET /users/<id>", "GET", f"/users/{user.id}", auth),
+        ("OPTIONS /users", "OPTIONS", "/users", preflight),
+        ("GET race-ethnicity-options", "GET", "/users/race-ethnicity-options", {}),
+    ]
+
+    try:
+        for maxsize in (0, 1024):
+            identity_cache.configure(maxsize=maxsize, ttl=30)
+            for name, method, url, headers in cases:
+                before = identity_cache.stats()
+                mean = timed(client, method, url, headers)
+                after = identity_cache.stats()
+                lookups = (
+                    after["hits"] + after["misses"]
+                    - before["hits"] - before["misses"]
+                ) / REQUESTS
+                print(
+                    f"cache={maxsize:<5} {name:<28} "
+                    f"{mean:8.1f} us/request  {lookups:.1f} lookups/request",
+                    file=sys.stderr
+                )
+    finally:
+        db.session.delete(user)
+        db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
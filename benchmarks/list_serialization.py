@@ -0,0 +1,155 @@
+"""
+Benchmark the per-row cost of reading and serializing list endpoints.
+
+Compares hydrating ORM instances and calling serialize() against selecting
+only the returned columns as rows and serializing those, for 100k users
+and 100k experiences. Rows are inserted in a transaction that is rolled
+back at the end.
+
+Run from the project root against a scratch database:
+    python -m benchmarks.list_serialization > /dev/null
+Results are written to stderr.
+"""
+
+import sys
+import time
+
+from app import app
+from models.models import db
+from models.User import User
+from models.Experience import Experience
+from models.UserHoursSummary import UserHoursSummary
+from routes.users import USER_ROW_COLUMNS, serialize_user_row
+
+ROWS = 100000
+RUNS = 3
+
+
+def serialize_user_instance(row):
+    """How a (User, total_hours) row was serialized before projections"""
+
+    u, hours = row
+
+    return {
+        "id": u.id,
+        "badge_number": u.badge_number,
+        "email": u.email,
+        "experience_hours": float(hours) if hours else 0,
+        "first_name": u.first_name,
+        "is_admin": u.is_admin,
+        "is_student": u.is_student,
+        "is_healthcare_provider": u.is_healthcare_provider,
+        "is_multilingual": u.is_multilingual,
+        "last_name": u.last_name,
+        "status": u.status,
+    }
+
+
+def per_row(get_rows, serialize):
+    """Best of RUNS microseconds per row to fetch and serialize every row"""
+
+    best = None
+    for _ in range(RUNS):
+        db.session.expunge_all()
+
+        start = time.perf_counter()
+        serialized = [serialize(row) for row in get_rows()]
+        elapsed = time.perf_counter() - start
+
+        assert len(serialized) == ROWS
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best / ROWS * 1e6
+
+
+def seed():
+    db.session.execute(db.text("""
+        INSERT INTO users (
+            badge_number, email, password, status, first_name, last_name,
+            dob, gender, address, city, state, zip_code, phone_number,
+            is_student, is_healthcare_provider, is_multilingual, is_admin,
+            created_at
+        )
+        SELECT 1000000 + n, 'bench' || n || '@mail.com', 'password', 'active',
+            'u' || n, 'bench', '2000-01-01', 'Prefer not to say',
+            '1 Cherry lane', 'New York', 'NY', '11001', '9991234567',
+            false, false, false, false, now()
+        FROM generate_series(1, :rows) AS n
+    """), {"rows": ROWS})
+
+    db.session.execute(db.text("""
+        INSERT INTO experiences (
+            date, sign_in_time, sign_out_time, department, user_id
+        )
+        SELECT start::date, start, start + interval '4 hours', 'lab', id
+        FROM users,
+            LATERAL (
+                SELECT timestamp '2020-01-01' + id * interval '1 minute' AS start
+            ) AS times
+        WHERE email LIKE 'bench%@mail.com'
+    """))
+
+
+def main():
+    # The database is used outside of requests
+    app.app_context().push()
+    db.engine.echo = False
+
+    try:
+        seed()
+
+        bench_users = User.email.like("bench%@mail.com")
+        bench_experiences = Experience.department == "lab"
+        cases = [
+            (
+                "users, instances",
+                lambda: (User.query
+                    .add_columns(UserHoursSummary.total_hours)
+                    .outerjoin(UserHoursSummary)
+                    .filter(bench_users)
+                    .order_by(User.id)
+                    .all()),
+                serialize_user_instance,
+            ),
+            (
+                "users, rows",
+                lambda: (db.session
+                    .query(*USER_ROW_COLUMNS.values())
+                    .outerjoin(UserHoursSummary, UserHoursSummary.user_id == User.id)
+                    .filter(bench_users)
+                    .order_by(User.id)
+                    .all()),
+                serialize_user_row,
+            ),
+            (
+                "experiences, instances",
+                lambda: (Experience.query
+                    .join(User)
+                    .filter(bench_users, bench_experiences)
+                    .order_by(Experience.id)
+                    .all()),
+                Experience.serialize,
+            ),
+            (
+                "experiences, rows",
+                lambda: (db.session
+                    .query(*Experience.get_row_columns())
+                    .join(User)
+                    .filter(bench_users, bench_experiences)
+                    .order_by(Experience.id)
+                    .all()),
+                Experience.serialize_row,
+            ),
+        ]
+
+        for name, get_rows, serialize in cases:
+            print(
+                f"{name:<24} {per_row(get_rows, serialize):6.2f} us/row",
+                file=sys.stderr
+            )
+    finally:
+        db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
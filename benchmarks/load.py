@@ -0,0 +1,389 @@
+"""
+Load test the API over HTTP with the clinic's traffic patterns.
+
+Seeds volunteers and an admin, then runs two phases:
+- shift change: every volunteer logs in and signs in (POST /experiences)
+  at once, while admins poll GET /users and GET /experiences?incomplete
+- end of shift: every volunteer signs out (PATCH /experiences/<id>) at
+  once, while admins keep polling
+
+Reports p50/p95/p99 latency, throughput and errors per endpoint, then
+checks them against the SLOs in benchmarks/slo.json (or --slo), exiting
+with status 1 if any is missed. Seeded rows are deleted at the end.
+
+Unless given --url, starts the app under gunicorn on a free local port,
+with the same environment. Run from the project root against a scratch
+database:
+    python -m benchmarks.load --volunteers 50 > /dev/null
+Results are written to stderr.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from app import app
+from hashing import password_hasher
+from models.models import db
+
+SLO_PATH = os.path.join(os.path.dirname(__file__), "slo.json")
+
+EMAIL_PATTERN = "load%@mail.com"
+PASSWORD = "password"
+BADGE_OFFSET = 2000000
+
+START_TIMEOUT = 30
+
+
+class Recorder:
+    """Thread-safe latencies and error counts, per endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def request(self, session, name, method, url, **kwargs):
+        """Send a request, recording its latency under `name`"""
+
+        start = time.perf_counter()
+        try:
+            resp = session.request(method, url, **kwargs)
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            resp = None
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+
+        return resp if ok else None
+
+    def add_phase(self, names, seconds):
+        """Count a phase's wall time towards the throughput of `names`"""
+
+        with self._lock:
+            for name in names:
+                self.seconds[name] += seconds
+
+    def summary(self):
+        """Get count, errors, throughput and percentiles (ms) per endpoint"""
+
+        results = {}
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            results[name] = {
+                "count": len(latencies),
+                "error_rate": self.errors[name] / len(latencies),
+                "rps": len(latencies) / self.seconds[name],
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+        return results
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of a sorted, non-empty list"""
+
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def seed(volunteers):
+    """Insert `volunteers` volunteers and one admin, sharing one hash"""
+
+    pw_hash = password_hasher.generate_password_hash(PASSWORD)
+
+    db.session.execute(db.text("""
+        INSERT INTO users (
+            badge_number, email, password, status, first_name, last_name,
+            dob, gender, address, city, state, zip_code, phone_number,
+            is_student, is_healthcare_provider, is_multilingual, is_admin,
+            created_at
+        )
+        SELECT :offset + n, 'load' || n || '@mail.com', :password, 'active',
+            'u' || n, 'load', '2000-01-01', 'Prefer not to say',
+            '1 Cherry lane', 'New York', 'NY', '11001', '9991234567',
+            false, false, false, n = 0, now()
+        FROM generate_series(0, :volunteers) AS n
+    """), {
+        "offset": BADGE_OFFSET,
+        "password": pw_hash,
+        "volunteers": volunteers,
+    })
+    db.session.commit()
+
+    rows = db.session.execute(db.text("""
+        SELECT id, email, is_admin FROM users
+        WHERE email LIKE :pattern
+        ORDER BY id
+    """), {"pattern": EMAIL_PATTERN}).all()
+
+    admin = next(row for row in rows if row.is_admin)
+    return admin, [row for row in rows if not row.is_admin]
+
+
+def clean_up():
+    """Delete seeded users and everything referencing them"""
+
+    users = "SELECT id FROM users WHERE email LIKE :pattern"
+    for table in ("experiences", "languages"):
+        db.session.execute(
+            db.text(f"DELETE FROM {table} WHERE user_id IN ({users})"),
+            {"pattern": EMAIL_PATTERN}
+        )
+    db.session.execute(
+        db.text("DELETE FROM users WHERE email LIKE :pattern"),
+        {"pattern": EMAIL_PATTERN}
+    )
+    db.session.commit()
+
+
+def start_server(workers):
+    """Start the app under gunicorn on a free port, returning (process, url)"""
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--threads", "4",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}/users/race-ethnicity-options", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f"App did not start within {START_TIMEOUT}s")
+
+
+def now():
+    """Current time in the format the experience forms accept"""
+
+    return datetime.now().isoformat(timespec="microseconds")
+
+
+def run_phase(recorder, volunteer_task, volunteers, admins, poll_interval):
+    """
+    Run volunteer_task for every volunteer at once, while admins poll the
+    user and incomplete experience lists until all volunteers are done.
+    """
+
+    done = threading.Event()
+    start_line = threading.Barrier(len(volunteers))
+
+    def admin_task(admin):
+        while not done.is_set():
+            recorder.request(
+                admin["session"], "GET /users", "GET",
+                f"{admin['url']}/users",
+                headers=admin["headers"]
+            )
+            recorder.request(
+                admin["session"], "GET /experiences?incomplete", "GET",
+                f"{admin['url']}/experiences?incomplete",
+                headers=admin["headers"]
+            )
+            done.wait(poll_interval)
+
+    def volunteer_run(volunteer):
+        start_line.wait()
+        volunteer_task(volunteer)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(admins)) as admin_pool:
+        polls = [admin_pool.submit(admin_task, admin) for admin in admins]
+
+        with ThreadPoolExecutor(len(volunteers)) as pool:
+            list(pool.map(volunteer_run, volunteers))
+
+        done.set()
+        for poll in polls:
+            poll.result()
+
+    return time.perf_counter() - start
+
+
+def check_slos(results, slos):
+    """
+    Get a message for each SLO missed by results. SLO keys are result keys
+    prefixed "max_" or "min_", e.g. "max_p95_ms" or "min_rps".
+    """
+
+    failures = []
+    for name, slo in sorted(slos.items()):
+        result = results.get(name)
+        if result is None:
+            failures.append(f"{name}: no requests")
+            continue
+
+        for key, limit in sorted(slo.items()):
+            bound, _, metric = key.partition("_")
+            value = result[metric]
+
+            if value > limit if bound == "max" else value < limit:
+                failures.append(f"{name}: {key} {limit}, got {value:.3f}")
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Base URL of a running app.")
+    parser.add_argument("--workers", type=int, default=2,
+        help="gunicorn workers, when starting the app.")
+    parser.add_argument("--volunteers", type=int, default=20)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--poll-interval", type=float, default=0.5,
+        help="Seconds between each admin's polls.")
+    parser.add_argument("--slo", default=SLO_PATH,
+        help="JSON file of SLOs per endpoint.")
+    parser.add_argument("--output", help="Write results as JSON to a file.")
+    args = parser.parse_args()
+
+    # The database is used outside of requests
+    app.app_context().push()
+    db.engine.echo = False
+
+    with open(args.slo) as f:
+        slos = json.load(f)
+
+    clean_up()
+    admin_row, volunteer_rows = seed(args.volunteers)
+
+    process = None
+    try:
+        if args.url:
+            url = args.url
+        else:
+            process, url = start_server(args.workers)
+
+        recorder = Recorder()
+
+        admins = []
+        for _ in range(args.admins):
+            session = requests.Session()
+            resp = session.post(
+                f"{url}/auth/login",
+                json={"email": admin_row.email, "password": PASSWORD}
+            )
+            admins.append({
+                "session": session,
+                "url": url,
+                "headers": {"Authorization": f"Bearer {resp.json()['token']}"},
+            })
+
+        volunteers = [
+            {"id": row.id, "email": row.email, "session": requests.Session()}
+            for row in volunteer_rows
+        ]
+
+        def sign_in(volunteer):
+            resp = recorder.request(
+                volunteer["session"], "POST /auth/login", "POST",
+                f"{url}/auth/login",
+                json={"email": volunteer["email"], "password": PASSWORD}
+            )
+            if resp is None:
+                return
+
+            volunteer["headers"] = {
+                "Authorization": f"Bearer {resp.json()['token']}"
+            }
+            resp = recorder.request(
+                volunteer["session"], "POST /experiences", "POST",
+                f"{url}/experiences",
+                headers=volunteer["headers"],
+                json={
+                    "date": now(),
+                    "sign_in_time": now(),
+                    "department": "lab",
+                    "user_id": volunteer["id"],
+                }
+            )
+            if resp is not None:
+                volunteer["experience_id"] = resp.json()["user_experience"]["id"]
+
+        def sign_out(volunteer):
+            if "experience_id" not in volunteer:
+                return
+
+            recorder.request(
+                volunteer["session"], "PATCH /experiences/<id>", "PATCH",
+                f"{url}/experiences/{volunteer['experience_id']}",
+                headers=volunteer["headers"],
+                json={"sign_out_time": now()}
+            )
+
+        polls = ["GET /users", "GET /experiences?incomplete"]
+
+        seconds = run_phase(
+            recorder, sign_in, volunteers, admins, args.poll_interval
+        )
+        recorder.add_phase(
+            ["POST /auth/login", "POST /experiences", *polls],
+            seconds
+        )
+
+        seconds = run_phase(
+            recorder, sign_out, volunteers, admins, args.poll_interval
+        )
+        recorder.add_phase(["PATCH /experiences/<id>", *polls], seconds)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        clean_up()
+
+    results = recorder.summary()
+    for name, result in results.items():
+        print(
+            f"{name:<28} n={result['count']:<5} "
+            f"err={result['error_rate']:6.1%} {result['rps']:7.1f} req/s "
+            f"p50={result['p50_ms']:7.1f} p95={result['p95_ms']:7.1f} "
+            f"p99={result['p99_ms']:7.1f} ms",
+            file=sys.stderr
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = check_slos(results, slos)
+    for failure in failures:
+        print(f"SLO missed: {failure}", file=sys.stderr)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
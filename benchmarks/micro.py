@@ -0,0 +1,269 @@
+"""
+Microbenchmarks for the per-row and per-request hot paths.
+
+Times model serialization, form validation, JSON encoding of list
+payloads and token creation and decoding, without touching the database.
+Results are saved as JSON so two runs can be compared, e.g. before and
+after an optimization:
+
+    python -m benchmarks.micro run --output before.json > /dev/null
+    python -m benchmarks.micro run --output after.json > /dev/null
+    python -m benchmarks.micro compare before.json after.json
+
+compare exits with status 1 if any benchmark got slower by more than
+--threshold (default 10%). Results are written to stderr.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token, decode_token
+
+from app import app
+from forms.SignUpForm import SignUpForm
+from forms.CreateExperienceForm import CreateExperienceForm
+from forms.UpdateExperienceForm import UpdateExperienceForm
+from models.User import User
+from models.Experience import Experience
+from routes.users import serialize_user_row
+
+REPEAT = 5
+LIST_ROWS = 1000
+
+SIGN_IN = datetime(year=2022, month=1, day=5, hour=8)
+
+SIGNUP_DATA = {
+    "badge_number": "2",
+    "email": "u2@mail.com",
+    "password": "password",
+    "first_name": "u2",
+    "last_name": "test",
+    "dob": "2000-01-01 00:00:00",
+    "gender": "Prefer not to say",
+    "address": "2 Cherry lane",
+    "city": "New York",
+    "state": "NY",
+    "zip_code": "11001",
+    "phone_number": "9991234567",
+    "is_student": True,
+    "is_multilingual": False,
+}
+
+CREATE_EXPERIENCE_DATA = {
+    "date": SIGN_IN.isoformat(timespec="microseconds"),
+    "sign_in_time": SIGN_IN.isoformat(timespec="microseconds"),
+    "department": "lab",
+    "user_id": 1,
+}
+
+UPDATE_EXPERIENCE_DATA = {
+    "sign_out_time": (SIGN_IN + timedelta(hours=4))
+        .isoformat(timespec="microseconds"),
+    "department": "pharmacy",
+}
+
+
+def make_user(id=1):
+    """A transient user with every serialized field set"""
+
+    return User(
+        id=id,
+        badge_number=id,
+        email=f"u{id}@mail.com",
+        password="password",
+        status="active",
+        first_name=f"u{id}",
+        last_name="test",
+        dob=datetime(year=2000, month=1, day=1),
+        gender="Prefer not to say",
+        address="1 Cherry lane",
+        city="New York",
+        state="NY",
+        zip_code="11001",
+        phone_number="9991234567",
+        is_student=True,
+        is_healthcare_provider=False,
+        is_multilingual=False,
+        is_admin=False,
+        token_version=0,
+        created_at=datetime(year=2023, month=1, day=1),
+    )
+
+
+def make_experience(id=1):
+    """A transient, signed out experience"""
+
+    return Experience(
+        id=id,
+        date=SIGN_IN,
+        sign_in_time=SIGN_IN,
+        sign_out_time=SIGN_IN + timedelta(hours=4),
+        department="lab",
+        user_id=1,
+    )
+
+
+def validate(form_class, data):
+    """Validate data with a form, as its route does, within a request"""
+
+    with app.test_request_context(method="POST", json=data):
+        return form_class(csrf_enabled=False, data=data).validate()
+
+
+def get_benchmarks():
+    """Get (name, fn) for every benchmark; fn is called with no arguments"""
+
+    user = make_user()
+    experience = make_experience()
+    experience_row = tuple(
+        getattr(experience, key) for key in Experience.SERIALIZE_KEYS
+    )
+    user_row = (1, 1, "u1@mail.com", 6.0, "u1", False, True, False, False,
+        "test", "active")
+
+    users_payload = {
+        "users": [serialize_user_row(user_row) for _ in range(LIST_ROWS)]
+    }
+    experiences_payload = {
+        "experiences": [
+            Experience.serialize_row(experience_row) for _ in range(LIST_ROWS)
+        ]
+    }
+
+    token = create_access_token(identity=user)
+
+    return [
+        ("User.serialize", user.serialize),
+        ("Experience.serialize", experience.serialize),
+        ("Experience.serialize_row",
+            lambda: Experience.serialize_row(experience_row)),
+        ("Experience.get_duration", experience.get_duration),
+        ("serialize_user_row", lambda: serialize_user_row(user_row)),
+        ("SignUpForm.validate",
+            lambda: validate(SignUpForm, SIGNUP_DATA)),
+        ("CreateExperienceForm.validate",
+            lambda: validate(CreateExperienceForm, CREATE_EXPERIENCE_DATA)),
+        ("UpdateExperienceForm.validate",
+            lambda: validate(UpdateExperienceForm, UPDATE_EXPERIENCE_DATA)),
+        (f"json users x{LIST_ROWS}",
+            lambda: app.json.response(users_payload)),
+        (f"json experiences x{LIST_ROWS}",
+            lambda: app.json.response(experiences_payload)),
+        ("create_access_token", lambda: create_access_token(identity=user)),
+        ("decode_token", lambda: decode_token(token)),
+    ]
+
+
+def measure(fn):
+    """Best and median of REPEAT runs, in microseconds per call"""
+
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = [t / number * 1e6 for t in timer.repeat(REPEAT, number)]
+
+    return {
+        "best_us": min(runs),
+        "median_us": statistics.median(runs),
+        "calls": number,
+    }
+
+
+def get_commit():
+    """Current git commit, or None outside a checkout"""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    results = {}
+
+    # A request context for the token benchmarks, as in a route
+    with app.test_request_context():
+        for name, fn in get_benchmarks():
+            if args.filter and args.filter not in name:
+                continue
+
+            results[name] = measure(fn)
+            print(
+                f"{name:<32} {results[name]['best_us']:10.2f} us",
+                file=sys.stderr
+            )
+
+    report = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)["results"]
+    with open(args.after) as f:
+        after = json.load(f)["results"]
+
+    regressed = []
+    for name in before:
+        if name not in after:
+            continue
+
+        old = before[name]["best_us"]
+        new = after[name]["best_us"]
+        change = new / old - 1
+
+        print(
+            f"{name:<32} {old:10.2f} -> {new:10.2f} us {change:+8.1%}",
+            file=sys.stderr
+        )
+        if change > args.threshold:
+            regressed.append(name)
+
+    for name in regressed:
+        print(f"Regressed: {name}", file=sys.stderr)
+
+    if regressed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument("--output", help="Write results as JSON to a file.")
+    run_parser.add_argument("--filter",
+        help="Run only benchmarks whose name contains this.")
+    run_parser.set_defaults(fn=run)
+
+    compare_parser = commands.add_parser("compare",
+        help="Compare two saved runs.")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+        help="Slowdown that counts as a regression, e.g. 0.1 for 10%%.")
+    compare_parser.set_defaults(fn=compare)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""App settings per environment, read from the environment"""
+
+import os
+from engine import get_engine_options
+
+# Settings that differ by environment, by APP_ENV
+PROFILES = {
+    "development": {
+        "DEBUG_TOOLBAR": True,
+    },
+    "testing": {
+        "TESTING": True,
+        "DEBUG_TOOLBAR": False,
+        "WTF_CSRF_ENABLED": False,
+    },
+    # SQLALCHEMY_ECHO is ignored: logging every statement costs too much
+    "production": {
+        "DEBUG_TOOLBAR": False,
+        "SQLALCHEMY_ECHO": False,
+    },
+}
+
+DEFAULT_PROFILE = "development"
+
+
+def get_config(profile=None, environ=os.environ):
+    """
+    Get the app's settings for a profile in PROFILES (APP_ENV by default),
+    from the environment.
+    """
+
+    profile = profile or environ.get("APP_ENV", DEFAULT_PROFILE)
+    if profile not in PROFILES:
+        raise ValueError(
+            f"Unknown APP_ENV {profile!r}, expected one of {', '.join(PROFILES)}"
+        )
+
+    database_url = environ["DATABASE_URL"]
+
+    config = {
+        "APP_ENV": profile,
+        "SECRET_KEY": environ["SECRET_KEY"],
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        # Pool size, recycling, pre-ping and PgBouncer mode, from DB_* variables
+        "SQLALCHEMY_ENGINE_OPTIONS": get_engine_options(database_url, environ),
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SQLALCHEMY_ECHO": environ.get("SQLALCHEMY_ECHO") == "true",
+
+        "JWT_SECRET_KEY": environ["JWT_SECRET_KEY"],
+        "JWT_TOKEN_LOCATION": ["headers", "cookies"],
+
+        # Per-worker cache of current_user lookups
+        "USER_CACHE_SIZE": int(environ.get("USER_CACHE_SIZE", 1024)),
+        "USER_CACHE_TTL": float(environ.get("USER_CACHE_TTL", 30)),
+
+        # Per-worker pool for bcrypt, so logins can't pin every request thread
+        "BCRYPT_MAX_CONCURRENCY": int(
+            environ.get("BCRYPT_MAX_CONCURRENCY", os.cpu_count() or 1)
+        ),
+        "BCRYPT_QUEUE_TIMEOUT": float(environ.get("BCRYPT_QUEUE_TIMEOUT", 1)),
+        "BCRYPT_RETRY_AFTER": int(environ.get("BCRYPT_RETRY_AFTER", 1)),
+        # Target cost; see `flask calibrate-bcrypt`. Older hashes are redone
+        # at login
+        "BCRYPT_LOG_ROUNDS": int(environ.get("BCRYPT_LOG_ROUNDS", 12)),
+
+        # Optional read replica for the GET views marked replica_reads. Reads
+        # fall back to the primary when it lags more than REPLICA_MAX_LAG
+        # seconds, and for REPLICA_PIN_SECONDS after a client's last write
+        "REPLICA_DATABASE_URL": environ.get("REPLICA_DATABASE_URL"),
+        "REPLICA_MAX_LAG": float(environ.get("REPLICA_MAX_LAG", 5)),
+        "REPLICA_CHECK_INTERVAL": float(
+            environ.get("REPLICA_CHECK_INTERVAL", 5)
+        ),
+        "REPLICA_PIN_SECONDS": float(environ.get("REPLICA_PIN_SECONDS", 10)),
+
+        # /metrics answers requests with the bearer token METRICS_TOKEN, or
+        # from METRICS_ALLOWED_NETWORKS (comma-separated CIDRs); no one else
+        "METRICS_TOKEN": environ.get("METRICS_TOKEN"),
+        "METRICS_ALLOWED_NETWORKS": environ.get("METRICS_ALLOWED_NETWORKS", ""),
+        # Directory where workers share metrics, so /metrics reports them
+        # all; set by gunicorn.conf.py
+        "METRICS_DIR": environ.get("METRICS_DIR"),
+        "METRICS_WRITE_INTERVAL": float(
+            environ.get("METRICS_WRITE_INTERVAL", 1)
+        ),
+    }
+
+    config.update(PROFILES[profile])
+    return config
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from engine import create_engine
 import os
 import dotenv
 
@@ -9,4 +9,8 @@ DATABASE = "volunteer_management"
 
 conn_str = f'postgresql://{USERNAME}:{PASSWORD}@{HOST}/{DATABASE}?sslmode=require'
 
-engine = create_engine(conn_str)
\ No newline at end of file
+# A "-pooler" host is PgBouncer in transaction mode
+engine = create_engine(
+    conn_str,
+    environ={**os.environ, "DB_PGBOUNCER": "true"}
+)
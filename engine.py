@@ -0,0 +1,146 @@
+"""SQLAlchemy engine options and pool instrumentation, shared by app and scripts"""
+
+import os
+import threading
+import weakref
+from collections import Counter
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Environment variables for engine options, with their defaults
+POOL_DEFAULTS = {
+    "DB_POOL_SIZE": 5,
+    "DB_MAX_OVERFLOW": 10,
+    "DB_POOL_TIMEOUT": 30,
+    # Below the idle timeout of Neon and most proxies, in seconds
+    "DB_POOL_RECYCLE": 1800,
+    "DB_POOL_PRE_PING": True,
+    # Compiled statements cached per engine
+    "DB_QUERY_CACHE_SIZE": 500,
+    # Transaction-mode PgBouncer (e.g. a Neon "-pooler" host)
+    "DB_PGBOUNCER": False,
+}
+
+# Pool events counted per instrumented engine
+POOL_EVENTS = ("connect", "checkout", "checkin", "invalidate")
+
+# Counts by instrumented engine, dropped with the engine. Apps list the
+# engines they report, by name, in app.extensions["engines"].
+_pool_counters = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_setting(environ, name):
+    """Get an engine setting from environ, as the type of its default"""
+
+    default = POOL_DEFAULTS[name]
+    value = environ.get(name)
+
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    return type(default)(value)
+
+
+def get_engine_options(url, environ=os.environ):
+    """
+    Get create_engine keyword arguments (besides the URL) from the DB_*
+    environment variables.
+
+    With DB_PGBOUNCER set, server-side prepared statements are turned off,
+    since a transaction pooler may run each transaction on another server
+    connection. psycopg2 never prepares statements, so this only changes
+    psycopg (3) connections.
+    """
+
+    options = {
+        "pool_size": get_setting(environ, "DB_POOL_SIZE"),
+        "max_overflow": get_setting(environ, "DB_MAX_OVERFLOW"),
+        "pool_timeout": get_setting(environ, "DB_POOL_TIMEOUT"),
+        "pool_recycle": get_setting(environ, "DB_POOL_RECYCLE"),
+        "pool_pre_ping": get_setting(environ, "DB_POOL_PRE_PING"),
+        "query_cache_size": get_setting(environ, "DB_QUERY_CACHE_SIZE"),
+    }
+
+    if (get_setting(environ, "DB_PGBOUNCER")
+            and make_url(url).get_driver_name() == "psycopg"):
+        options["connect_args"] = {"prepare_threshold": None}
+
+    return options
+
+
+def create_engine(url=None, environ=os.environ, **kwargs):
+    """
+    Create an engine for url (DATABASE_URL by default) with the options
+    from the environment, overridden by kwargs, and instrument its pool.
+    """
+
+    url = url or environ["DATABASE_URL"]
+    options = {**get_engine_options(url, environ), **kwargs}
+
+    engine = sqlalchemy.create_engine(url, **options)
+    instrument(engine)
+    return engine
+
+
+def instrument(engine):
+    """Count the pool events of engine, once"""
+
+    with _lock:
+        if engine in _pool_counters:
+            return
+        counters = _pool_counters[engine] = Counter(
+            dict.fromkeys(POOL_EVENTS, 0)
+        )
+
+    def count(pool_event):
+        def listener(*args):
+            with _lock:
+                counters[pool_event] += 1
+        return listener
+
+    # Listening on the engine keeps counting if its pool is recreated
+    for pool_event in POOL_EVENTS:
+        event.listen(engine, pool_event, count(pool_event))
+
+
+def dispose_pools(engines=None):
+    """
+    Replace the pool of engines (every instrumented one by default), in a
+    forked worker. Connections inherited from the parent are left open for
+    it to use, never shared; the worker opens its own.
+    """
+
+    if engines is None:
+        with _lock:
+            engines = list(_pool_counters.keys())
+
+    for engine in engines:
+        engine.dispose(close=False)
+
+
+def get_pool_stats(engines):
+    """
+    Get the state and event counts of the pools of engines, by name:
+    { "primary": { "size": 5, "checked_out": 1, "overflow": 0,
+                   "connect": 3, "checkout": 120, ... } }
+    """
+
+    stats = {}
+
+    with _lock:
+        for name, engine in engines.items():
+            pool = engine.pool
+            stats[name] = dict(_pool_counters.get(engine, {}))
+
+            if hasattr(pool, "checkedout"):
+                stats[name].update(
+                    size=pool.size(),
+                    checked_out=pool.checkedout(),
+                    # overflow() counts up from -size while the pool fills
+                    overflow=max(pool.overflow(), 0),
+                )
+
+    return stats
@@ -0,0 +1,30 @@
+from flask_wtf import FlaskForm
+from wtforms import DateField, StringField
+from wtforms.validators import Optional
+
+
+class ExportForm(FlaskForm):
+    """
+    Form for validation of query parameters filtering a CSV export:
+    experiences from "start" to "end" (inclusive dates) in "department"
+    """
+
+    class Meta:
+        csrf = False
+
+    start = DateField(
+        "Start date",
+        validators=[Optional()],
+        format="%Y-%m-%d",
+    )
+
+    end = DateField(
+        "End date",
+        validators=[Optional()],
+        format="%Y-%m-%d",
+    )
+
+    department = StringField(
+        "Department",
+        validators=[Optional()]
+    )
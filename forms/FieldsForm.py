@@ -0,0 +1,44 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField
+from wtforms.validators import Optional, ValidationError
+
+
+def allowed_fields():
+    message = 'Invalid field(s): {}'
+
+    def _allowed_fields(form, field):
+        invalid = set(field.data.split(",")) - set(form.allowed)
+        if invalid:
+            raise ValidationError(message.format(", ".join(sorted(invalid))))
+
+    return _allowed_fields
+
+class FieldsForm(FlaskForm):
+    """
+    Form for validation of the "fields" query parameter: a comma separated
+    list of the fields to return, out of the `allowed` ones
+    """
+
+    class Meta:
+        csrf = False
+
+    fields = StringField(
+        "Fields",
+        validators=[Optional(), allowed_fields()]
+    )
+
+    def __init__(self, *args, allowed=(), **kwargs):
+        self.allowed = allowed
+        super().__init__(*args, **kwargs)
+
+    def get_keys(self):
+        """
+        Get the requested fields, in the order of `allowed`, always
+        including "id". All `allowed` fields if none were requested.
+        """
+
+        if not self.fields.data:
+            return tuple(self.allowed)
+
+        requested = set(self.fields.data.split(",")) | {"id"}
+        return tuple(key for key in self.allowed if key in requested)
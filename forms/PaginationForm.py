@@ -0,0 +1,40 @@
+from flask_wtf import FlaskForm
+from wtforms import IntegerField, StringField
+from wtforms.validators import Optional, NumberRange, ValidationError
+from pagination import decode_cursor
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def valid_cursor():
+    message = 'Invalid cursor'
+
+    def _valid_cursor(form, field):
+        try:
+            decode_cursor(field.data)
+        except ValueError:
+            raise ValidationError(message)
+
+    return _valid_cursor
+
+class PaginationForm(FlaskForm):
+    """
+    Form for validation of query parameters for a page of a list:
+    "limit" (page size) and "cursor" (next_cursor of the previous page)
+    """
+
+    class Meta:
+        csrf = False
+
+    # A blank "?limit=" passes Optional() with no data: use the default
+    limit = IntegerField(
+        "Limit",
+        validators=[Optional(), NumberRange(min=1, max=MAX_PAGE_SIZE)],
+        default=DEFAULT_PAGE_SIZE,
+        filters=[lambda v: DEFAULT_PAGE_SIZE if v is None else v],
+    )
+
+    cursor = StringField(
+        "Cursor",
+        validators=[Optional(), valid_cursor()]
+    )
@@ -0,0 +1,69 @@
+"""
+gunicorn settings, read from the working directory by default.
+
+The app is imported and created once, in the master, then workers are
+forked from it: they start without importing anything and share the
+master's memory copy-on-write. Run with:
+    APP_ENV=production gunicorn app:app
+"""
+
+import gc
+import glob
+import os
+import tempfile
+from engine import dispose_pools
+from metrics import mark_process_dead
+
+preload_app = True
+
+# Threaded workers, so a worker keeps serving while some of its requests
+# wait on bcrypt, and logins beyond its hashing pool get a 503 rather than
+# a place in the queue
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Set before the app is loaded, which reads it. At least one thread per
+# worker must be left for requests that don't hash.
+os.environ.setdefault(
+    "BCRYPT_MAX_CONCURRENCY",
+    str(max(1, min(os.cpu_count() or 1, threads - 1)))
+)
+if int(os.environ["BCRYPT_MAX_CONCURRENCY"]) >= threads:
+    raise RuntimeError(
+        f"BCRYPT_MAX_CONCURRENCY must be below GUNICORN_THREADS ({threads})"
+    )
+
+# Workers share their metrics here, so /metrics reports all of them. Set
+# before the app is loaded, which reads it.
+os.environ.setdefault(
+    "METRICS_DIR", tempfile.mkdtemp(prefix="volunteer-metrics-")
+)
+
+
+def on_starting(server):
+    # Counters start from 0 again: drop a previous server's
+    os.makedirs(os.environ["METRICS_DIR"], exist_ok=True)
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+# Collections write to every object they visit, copying the pages holding
+# them into each worker. None run in the master while the app loads, and
+# once loaded it is frozen: workers' collections then skip it.
+gc.disable()
+
+
+def when_ready(server):
+    # The app is loaded; workers are forked next
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Never share the master's connections, should it have opened any
+    dispose_pools()
+    gc.enable()
+
+
+def child_exit(server, worker):
+    # Keep its counters, which would otherwise go down, but not its gauges
+    mark_process_dead(os.environ["METRICS_DIR"], worker.pid)
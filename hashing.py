@@ -0,0 +1,174 @@
+"""Password hashing on a bounded thread pool, one per worker"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from flask_bcrypt import Bcrypt
+from werkzeug.local import LocalProxy
+from metrics import timed
+
+bcrypt = Bcrypt()
+
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+
+class HashingBusy(Exception):
+    """Raised when no hashing slot frees up within the queue timeout"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs bcrypt on a thread pool of at most max_workers threads.
+
+    bcrypt releases the GIL, so hashing on the pool leaves the worker's
+    other threads free. A request waits at most queue_timeout seconds for
+    a free slot, then gets HashingBusy rather than queueing behind every
+    other login.
+
+    New hashes use a cost of `rounds` (bcrypt's log2 work factor).
+    """
+
+    def __init__(self, max_workers=os.cpu_count() or 1, queue_timeout=1,
+                 retry_after=1, rounds=DEFAULT_ROUNDS):
+        self.max_workers = max_workers
+        self.rounds = rounds
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_workers, queue_timeout, retry_after,
+                  rounds=DEFAULT_ROUNDS):
+        """Change concurrency and timeout bounds and cost, replacing the pool"""
+
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+            self.max_workers = max_workers
+            self.queue_timeout = queue_timeout
+            self.retry_after = retry_after
+            self.rounds = rounds
+            self._slots = threading.BoundedSemaphore(max_workers)
+
+    def init_app(self, app):
+        """Configure from the app's BCRYPT_* settings, as the app's hasher"""
+
+        self.configure(
+            max_workers=app.config['BCRYPT_MAX_CONCURRENCY'],
+            queue_timeout=app.config['BCRYPT_QUEUE_TIMEOUT'],
+            retry_after=app.config['BCRYPT_RETRY_AFTER'],
+            rounds=app.config['BCRYPT_LOG_ROUNDS']
+        )
+        app.extensions["password_hasher"] = self
+
+    def generate_password_hash(self, password):
+        """Hash password at the target cost, returning the hash as a string"""
+
+        return self._run(
+            bcrypt.generate_password_hash,
+            password,
+            self.rounds
+        ).decode('UTF-8')
+
+    def check_password_hash(self, pw_hash, password):
+        """Check password against pw_hash"""
+
+        return self._run(bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Whether pw_hash was made at a cost other than the target"""
+
+        return get_rounds(pw_hash) != self.rounds
+
+    def _run(self, fn, *args):
+        """
+        Run fn on the pool once a slot is free and wait for its result.
+        The wait counts towards the request's bcrypt timing.
+        """
+
+        with timed("bcrypt"):
+            return self._run_on_pool(fn, *args)
+
+    def _run_on_pool(self, fn, *args):
+        """Run fn on the pool once a slot is free and wait for its result"""
+
+        slots = self._slots
+        if not slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy(self.retry_after)
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def _get_executor(self):
+        """Get the pool, created on first use so it is never forked"""
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="bcrypt"
+                )
+            return self._executor
+
+
+def get_rounds(pw_hash):
+    """Cost of a bcrypt hash such as "$2b$12$...", or None if unrecognized"""
+
+    try:
+        return int(pw_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def calibrate(budget, samples=3, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS):
+    """Time checking a password on this host at increasing costs.
+
+    Stops at the first cost over budget seconds, since each further round
+    doubles the time. Returns (timings, recommended) where timings is a list
+    of (rounds, seconds) and recommended is the highest cost within budget,
+    or None if even min_rounds is over it.
+    """
+
+    timings = []
+    recommended = None
+
+    for rounds in range(min_rounds, max_rounds + 1):
+        pw_hash = bcrypt.generate_password_hash("calibrate", rounds)
+
+        best = None
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.check_password_hash(pw_hash, "calibrate")
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        timings.append((rounds, best))
+
+        if best > budget:
+            break
+
+        recommended = rounds
+
+    return timings, recommended
+
+
+# The current app's PasswordHasher
+password_hasher = LocalProxy(
+    lambda: current_app.extensions["password_hasher"]
+)
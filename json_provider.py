@@ -0,0 +1,127 @@
+"""JSON encoding with orjson, when installed, in place of the standard library"""
+
+import math
+from flask.json.provider import DefaultJSONProvider
+from metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Dates, dataclasses and non-str keys are left to default() and encoded
+    # as Flask does, so responses keep the same values with either encoder
+    ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_NON_STR_KEYS
+    )
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with orjson if it is installed.
+
+    Keys are kept in insertion order rather than sorted, with either
+    encoder. orjson output is compact unless indented; calls with options
+    it does not support, such as other separators, fall back to the
+    standard library. Either way NaN and ±Infinity are written as null, as
+    orjson does, rather than as the standard library's invalid NaN and
+    Infinity.
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        """Serialize data as JSON to a string"""
+
+        option = self._get_orjson_option(kwargs)
+        if option is None:
+            return self._dumps_stdlib(obj, **kwargs)
+
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        """Deserialize data as JSON from a string or bytes"""
+
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """
+        Serialize the arguments as a JSON response, without a str copy.
+        Counts towards the request's serialize timing.
+        """
+
+        with timed("serialize"):
+            if orjson is None:
+                return super().response(*args, **kwargs)
+
+            obj = self._prepare_response_obj(args, kwargs)
+            option = ORJSON_OPTIONS
+
+            if ((self.compact is None and self._app.debug)
+                    or self.compact is False):
+                option |= orjson.OPT_INDENT_2
+
+            return self._app.response_class(
+                orjson.dumps(obj, default=self.default, option=option) + b"\n",
+                mimetype=self.mimetype
+            )
+
+    def _dumps_stdlib(self, obj, **kwargs):
+        """
+        Serialize with the standard library, writing NaN and ±Infinity as
+        null unless allow_nan is passed. Only data holding them is walked.
+        """
+
+        if "allow_nan" in kwargs:
+            return super().dumps(obj, **kwargs)
+
+        try:
+            return super().dumps(obj, allow_nan=False, **kwargs)
+        except ValueError as e:
+            if not str(e).startswith("Out of range float values"):
+                raise
+            return super().dumps(_finite(obj), allow_nan=False, **kwargs)
+
+    def _get_orjson_option(self, kwargs):
+        """
+        Get orjson options equivalent to json.dumps kwargs, or None if
+        orjson is not installed or cannot honor them.
+        """
+
+        if orjson is None:
+            return None
+
+        option = ORJSON_OPTIONS
+        kwargs = dict(kwargs)
+
+        # orjson output is always compact
+        if kwargs.pop("separators", (",", ":")) != (",", ":"):
+            return None
+
+        indent = kwargs.pop("indent", None)
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        elif indent is not None:
+            return None
+
+        if kwargs.pop("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+
+        return None if kwargs else option
+
+
+def _finite(obj):
+    """Copy of obj with NaN and ±Infinity floats, at any depth, as None"""
+
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
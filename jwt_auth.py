@@ -0,0 +1,92 @@
+"""JWT verification, done once per request"""
+
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import current_user, get_jwt, verify_jwt_in_request
+
+
+def public(fn):
+    """Mark a view as not needing a token, so tokens are never verified for it"""
+
+    fn.is_public = True
+    return fn
+
+
+def is_public_request():
+    """Whether the request needs no token: preflights, public views and 404s"""
+
+    if request.method == "OPTIONS":
+        return True
+
+    view = current_app.view_functions.get(request.endpoint)
+    return view is None or getattr(view, "is_public", False)
+
+
+def verify_jwt_once():
+    """
+    Verify the request's token, if it is provided, and load current_user.
+    The result is kept in request scope for jwt_required to reuse.
+    Raises if an invalid token is received.
+    """
+
+    if is_public_request():
+        return
+
+    verify_jwt_in_request(optional=True)
+    g.jwt_verified = True
+
+
+def jwt_required(optional=False):
+    """
+    Protect a view with the token verified by verify_jwt_once.
+    Verifies the token itself only if that has not happened yet.
+    Without a token, raises the usual "Missing JWT" error unless optional.
+    """
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if not g.get("jwt_verified"):
+                verify_jwt_in_request(optional=optional)
+            elif not optional and not get_jwt():
+                # No token to decode: only raises NoAuthorizationError
+                verify_jwt_in_request()
+
+            return current_app.ensure_sync(fn)(*args, **kwargs)
+
+        return decorator
+
+    return wrapper
+
+
+def require_admin(fn):
+    """
+    Protect a view for admins only, authorizing from the token's claims.
+    If not an admin, returns JSON { "errors": "Unauthorized" }
+    """
+
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        if not current_user.is_admin:
+            return jsonify(errors="Unauthorized"), 401
+
+        return current_app.ensure_sync(fn)(*args, **kwargs)
+
+    return jwt_required()(decorator)
+
+
+def require_self_or_admin(fn):
+    """
+    Protect a view taking `user_id` for that user or admins only,
+    authorizing from the token's claims.
+    Otherwise, returns JSON { "errors": "Unauthorized" }
+    """
+
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        if not (current_user.id == kwargs["user_id"] or current_user.is_admin):
+            return jsonify(errors="Unauthorized"), 401
+
+        return current_app.ensure_sync(fn)(*args, **kwargs)
+
+    return jwt_required()(decorator)
@@ -0,0 +1,547 @@
+"""Per-request timings, as a Server-Timing header and Prometheus metrics"""
+
+import copy
+import hmac
+import ipaddress
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import (
+    Response, current_app, g, has_request_context, jsonify, request
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from jwt_auth import public
+from engine import POOL_EVENTS, get_pool_stats
+
+# Timings reported per request, besides the SQL statement count
+TIMINGS = ("total", "sql", "serialize", "bcrypt")
+
+DURATION_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Stats that are a current value rather than a running total. A worker's are
+# dropped from /metrics when it exits; its counters and histograms are kept.
+POOL_GAUGES = {"size", "checked_out", "overflow"}
+CACHE_GAUGES = {"size"}
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+
+    return (str(value)
+        .replace("\\", "\\\\")
+        .replace("\"", "\\\"")
+        .replace("\n", "\\n"))
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram with one series per endpoint.
+
+    Values are counted into cumulative buckets on render. Each worker keeps
+    its own; with METRICS_DIR set, /metrics adds up every worker's.
+    """
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        """Record value for endpoint"""
+
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = {
+                    "counts": [0] * len(self.buckets),
+                    "sum": 0,
+                    "count": 0,
+                }
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+
+            series["sum"] += value
+            series["count"] += 1
+
+    def clear(self):
+        """Drop all recorded values"""
+
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """Get a copy of the recorded series, by endpoint"""
+
+        with self._lock:
+            return copy.deepcopy(self._series)
+
+    def render(self, series=None):
+        """
+        Get the histogram's lines in the Prometheus text format, for series
+        by endpoint as from snapshot() (this worker's by default).
+        """
+
+        if series is None:
+            series = self.snapshot()
+
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+
+        for endpoint, values in sorted(series.items()):
+            label = f'endpoint="{_escape(endpoint)}"'
+
+            cumulative = 0
+            for bound, count in zip(self.buckets, values["counts"]):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+
+            lines.append(
+                f'{self.name}_bucket{{{label},le="+Inf"}} {values["count"]}'
+            )
+            lines.append(f'{self.name}_sum{{{label}}} {values["sum"]}')
+            lines.append(f'{self.name}_count{{{label}}} {values["count"]}')
+
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Wall time handling the request.",
+    DURATION_BUCKETS
+)
+sql_statements = Histogram(
+    "http_request_sql_statements",
+    "SQL statements executed for the request.",
+    COUNT_BUCKETS
+)
+sql_duration = Histogram(
+    "http_request_sql_duration_seconds",
+    "Time executing SQL statements for the request.",
+    DURATION_BUCKETS
+)
+serialize_duration = Histogram(
+    "http_request_serialize_duration_seconds",
+    "Time encoding the request's JSON response.",
+    DURATION_BUCKETS
+)
+bcrypt_duration = Histogram(
+    "http_request_bcrypt_duration_seconds",
+    "Time hashing or checking passwords for the request.",
+    DURATION_BUCKETS
+)
+
+HISTOGRAMS = {
+    "total": request_duration,
+    "sql": sql_duration,
+    "serialize": serialize_duration,
+    "bcrypt": bcrypt_duration,
+}
+
+
+def get_request_timings():
+    """Get the current request's timings, or None outside a request"""
+
+    if not has_request_context():
+        return None
+
+    return g.get("request_timings")
+
+
+def record(name, seconds):
+    """Add seconds to the current request's timing `name`, if in a request"""
+
+    timings = get_request_timings()
+    if timings is not None:
+        timings[name] += seconds
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the request's timing `name`"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+    timings = get_request_timings()
+    if timings is not None:
+        timings["sql"] += elapsed
+        g.sql_statements += 1
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def start_request():
+    """Start timing the request"""
+
+    g.request_timings = dict.fromkeys(TIMINGS, 0.0)
+    g.sql_statements = 0
+    g.request_start = time.perf_counter()
+
+
+def finish_request(response):
+    """
+    Stop timing the request: add the Server-Timing header and record its
+    timings against its endpoint.
+    """
+
+    timings = get_request_timings()
+    if timings is None:
+        return response
+
+    timings["total"] = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or "none"
+
+    for name, histogram in HISTOGRAMS.items():
+        histogram.observe(endpoint, timings[name])
+    sql_statements.observe(endpoint, g.sql_statements)
+
+    response.headers["Server-Timing"] = get_server_timing(
+        timings,
+        g.sql_statements
+    )
+    return response
+
+
+def get_server_timing(timings, statements):
+    """Format timings (in seconds) as a Server-Timing header value"""
+
+    entries = []
+    for name in TIMINGS:
+        entry = f"{name};dur={timings[name] * 1000:.3f}"
+        if name == "sql":
+            entry += f';desc="{statements} statement(s)"'
+        entries.append(entry)
+
+    return ", ".join(entries)
+
+
+def get_pool_lines(stats):
+    """
+    Get each pool's gauges and counters in the Prometheus text format, from
+    stats as from get_pool_stats().
+    """
+
+    lines = []
+
+    for metric, description, key in (
+        ("db_pool_size", "Connections the pool keeps open.", "size"),
+        ("db_pool_checked_out", "Connections in use.", "checked_out"),
+        ("db_pool_overflow", "Connections open beyond the pool size.",
+            "overflow"),
+    ):
+        lines += [
+            f"# HELP {metric} {description}",
+            f"# TYPE {metric} gauge",
+        ]
+        for name, pool in sorted(stats.items()):
+            if key in pool:
+                lines.append(f'{metric}{{pool="{_escape(name)}"}} {pool[key]}')
+
+    lines += [
+        "# HELP db_pool_events_total Connections opened (connect), checked "
+        "out, checked in and invalidated.",
+        "# TYPE db_pool_events_total counter",
+    ]
+    for name, pool in sorted(stats.items()):
+        for pool_event in POOL_EVENTS:
+            lines.append(
+                f'db_pool_events_total{{pool="{_escape(name)}",'
+                f'event="{pool_event}"}} {pool.get(pool_event, 0)}'
+            )
+
+    return lines
+
+
+def get_cache_lines(stats):
+    """
+    Get cache hit and miss counters in the Prometheus text format, from
+    TTLCache stats() by cache name.
+    """
+
+    lines = []
+
+    for metric, kind, description, stat in (
+        ("cache_hits_total", "counter", "Cache lookups that were hits.",
+            "hits"),
+        ("cache_misses_total", "counter", "Cache lookups that were misses.",
+            "misses"),
+        ("cache_size", "gauge", "Entries in the cache.", "size"),
+    ):
+        lines += [
+            f"# HELP {metric} {description}",
+            f"# TYPE {metric} {kind}",
+        ]
+
+        for name, cache in sorted(stats.items()):
+            if stat in cache:
+                lines.append(
+                    f'{metric}{{cache="{_escape(name)}"}} {cache[stat]}'
+                )
+
+    return lines
+
+
+def take_snapshot(caches, engines):
+    """Get this worker's histograms, pool stats and cache stats"""
+
+    return {
+        "histograms": {
+            histogram.name: histogram.snapshot()
+            for histogram in (*HISTOGRAMS.values(), sql_statements)
+        },
+        "pools": get_pool_stats(engines),
+        "caches": {name: cache.stats() for name, cache in caches.items()},
+    }
+
+
+def merge_snapshots(live, dead=()):
+    """
+    Add up snapshots of live and exited workers. Gauges are only taken from
+    live workers, so a pool or cache that is gone doesn't count.
+    """
+
+    merged = {"histograms": {}, "pools": {}, "caches": {}}
+
+    for snapshots, is_live in ((live, True), (dead, False)):
+        for snapshot in snapshots:
+            for name, series in snapshot["histograms"].items():
+                merged_series = merged["histograms"].setdefault(name, {})
+                for endpoint, values in series.items():
+                    total = merged_series.setdefault(endpoint, {
+                        "counts": [0] * len(values["counts"]),
+                        "sum": 0,
+                        "count": 0,
+                    })
+                    for i, count in enumerate(values["counts"]):
+                        total["counts"][i] += count
+                    total["sum"] += values["sum"]
+                    total["count"] += values["count"]
+
+            for section, gauges in (("pools", POOL_GAUGES),
+                                    ("caches", CACHE_GAUGES)):
+                for name, stats in snapshot[section].items():
+                    total = merged[section].setdefault(name, {})
+                    for key, value in stats.items():
+                        if is_live or key not in gauges:
+                            total[key] = total.get(key, 0) + value
+
+    return merged
+
+
+class MultiprocessMetrics:
+    """Metrics shared by the workers of a server through a directory.
+
+    Each worker writes a snapshot of its own metrics to worker-<pid>.json
+    every interval seconds, and before serving /metrics, which adds up the
+    snapshots of every worker. The directory must be emptied when the
+    server starts (see gunicorn.conf.py).
+    """
+
+    def __init__(self, directory, caches, engines, interval=1, logger=None):
+        self.directory = directory
+        self.caches = caches
+        self.engines = engines
+        self.interval = interval
+        self.logger = logger
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start writing snapshots, once per worker process"""
+
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._write_every_interval, daemon=True
+            ).start()
+
+    def write(self):
+        """Write this worker's snapshot, replacing its previous one"""
+
+        path = os.path.join(self.directory, f"worker-{os.getpid()}.json")
+        _write_json(path, take_snapshot(self.caches, self.engines))
+
+    def collect(self):
+        """Get the snapshots of every worker, live and exited, added up"""
+
+        self.write()
+
+        snapshots = {"worker-": [], "dead-": []}
+        for filename in sorted(os.listdir(self.directory)):
+            for prefix, found in snapshots.items():
+                if filename.startswith(prefix) and filename.endswith(".json"):
+                    snapshot = _read_json(
+                        os.path.join(self.directory, filename)
+                    )
+                    if snapshot is not None:
+                        found.append(snapshot)
+
+        return merge_snapshots(snapshots["worker-"], snapshots["dead-"])
+
+    def _write_every_interval(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError:
+                if self.logger is not None:
+                    self.logger.warning(
+                        "Could not write metrics snapshot", exc_info=True
+                    )
+
+
+def mark_process_dead(directory, pid):
+    """
+    Keep an exited worker's counters and histograms in /metrics, but not
+    its gauges. Call from the server's master, e.g. gunicorn's child_exit.
+    """
+
+    live_path = os.path.join(directory, f"worker-{pid}.json")
+    dead_path = os.path.join(directory, f"dead-{pid}.json")
+
+    snapshot = _read_json(live_path)
+    if snapshot is None:
+        return
+
+    # A reused pid: add to what the earlier worker left
+    previous = _read_json(dead_path)
+    dead = [snapshot] if previous is None else [previous, snapshot]
+    _write_json(dead_path, merge_snapshots([], dead))
+    os.remove(live_path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    # Written aside then renamed, so readers never see a partial file
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def is_allowed(config):
+    """
+    Whether the request may read /metrics: it has the bearer token
+    METRICS_TOKEN, or comes from an address in METRICS_ALLOWED_NETWORKS.
+    """
+
+    token = config.get("METRICS_TOKEN")
+    if token and hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(),
+            f"Bearer {token}".encode()):
+        return True
+
+    try:
+        address = ipaddress.ip_address(request.remote_addr)
+    except ValueError:
+        return False
+
+    return any(
+        address in ipaddress.ip_network(network.strip(), strict=False)
+        for network in config.get("METRICS_ALLOWED_NETWORKS", "").split(",")
+        if network.strip()
+    )
+
+
+def init_app(app, caches=None):
+    """
+    Time every request and serve the aggregated metrics at /metrics.
+    Register before other before_request hooks, so they are timed too.
+    `caches` maps names to TTLCaches whose hits and misses are reported,
+    and app.extensions["engines"] names the engines whose pools are.
+
+    With METRICS_DIR set, /metrics reports every worker of the server;
+    otherwise only the worker serving it.
+    """
+
+    caches = caches or {}
+    engines = app.extensions.setdefault("engines", {})
+
+    multiprocess = None
+    if app.config.get("METRICS_DIR"):
+        multiprocess = MultiprocessMetrics(
+            app.config["METRICS_DIR"],
+            caches,
+            engines,
+            interval=app.config.get("METRICS_WRITE_INTERVAL", 1),
+            logger=app.logger
+        )
+        app.extensions["metrics"] = multiprocess
+
+    # Checked here rather than by verify_jwt: scrapers have no user
+    @public
+    def metrics():
+        """Prometheus metrics for this server's workers"""
+
+        if not is_allowed(current_app.config):
+            return jsonify(errors="Unauthorized"), 401
+
+        if multiprocess is not None:
+            snapshot = multiprocess.collect()
+        else:
+            snapshot = take_snapshot(caches, engines)
+
+        lines = []
+        for histogram in (*HISTOGRAMS.values(), sql_statements):
+            lines += histogram.render(
+                snapshot["histograms"].get(histogram.name, {})
+            )
+
+        lines += get_pool_lines(snapshot["pools"])
+        lines += get_cache_lines(snapshot["caches"])
+
+        return Response("\n".join(lines) + "\n", content_type=CONTENT_TYPE)
+
+    app.before_request(start_request)
+    if multiprocess is not None:
+        app.before_request(multiprocess.start)
+    app.after_request(finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
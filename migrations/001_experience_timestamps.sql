@@ -0,0 +1,26 @@
+-- Convert experience times from ISO format strings to native timestamps and
+-- add a stored duration, so range filters and sums can run in the database.
+--
+-- Run once against an existing database:
+--   psql "$DATABASE_URL" -f migrations/001_experience_timestamps.sql
+--
+-- Postgres parses both "2022-01-05T08:00:00" and "2022-01-05 08:00:00"
+-- (with or without fractional seconds). Empty and "None" sign out times,
+-- written by older clients, become NULL.
+
+BEGIN;
+
+ALTER TABLE experiences
+    ALTER COLUMN date TYPE TIMESTAMP WITHOUT TIME ZONE
+        USING date::timestamp,
+    ALTER COLUMN sign_in_time TYPE TIMESTAMP WITHOUT TIME ZONE
+        USING sign_in_time::timestamp,
+    ALTER COLUMN sign_out_time TYPE TIMESTAMP WITHOUT TIME ZONE
+        USING NULLIF(NULLIF(sign_out_time, ''), 'None')::timestamp;
+
+ALTER TABLE experiences
+    ADD COLUMN duration_seconds INTEGER GENERATED ALWAYS AS (
+        CAST(FLOOR(EXTRACT(EPOCH FROM sign_out_time - sign_in_time)) AS INTEGER)
+    ) STORED;
+
+COMMIT;
@@ -0,0 +1,16 @@
+-- Index experiences by user and time, and index experiences that have not
+-- been signed out of, for the per-user and 'incomplete' lists.
+--
+-- CREATE INDEX CONCURRENTLY does not block writes while it builds, but
+-- cannot run inside a transaction, so run without --single-transaction:
+--   psql "$DATABASE_URL" -f migrations/002_experience_indexes.sql
+--
+-- If a build fails it leaves an INVALID index behind; drop it with
+-- DROP INDEX CONCURRENTLY <name> and run this again.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_experiences_user_id_sign_in_time
+    ON experiences (user_id, sign_in_time);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_experiences_open
+    ON experiences (id)
+    WHERE sign_out_time IS NULL;
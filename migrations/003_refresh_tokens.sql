@@ -0,0 +1,15 @@
+-- Refresh tokens issued at login, so clients can renew access tokens
+-- without sending credentials again. Each row is one refresh token;
+-- revoked_at is set once it is used or its family is revoked.
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    jti VARCHAR(36) PRIMARY KEY,
+    family VARCHAR(36) NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    revoked_at TIMESTAMP WITHOUT TIME ZONE,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family
+    ON refresh_tokens (family);
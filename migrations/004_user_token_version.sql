@@ -0,0 +1,5 @@
+-- Version each user's admin rights and status, so access tokens carrying
+-- them as claims can be rejected once they change. Tokens minted before
+-- this migration have no version and must be refreshed or logged in again.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,13 @@
+-- Index experiences by user and id, so each page of a user's experiences
+-- (GET /users/<id>/experiences, paged by id) is a range scan of the index,
+-- however deep, instead of sorting all of the user's experiences.
+--
+-- CREATE INDEX CONCURRENTLY does not block writes while it builds, but
+-- cannot run inside a transaction, so run without --single-transaction:
+--   psql "$DATABASE_URL" -f migrations/005_experience_user_id_id.sql
+--
+-- If a build fails it leaves an INVALID index behind; drop it with
+-- DROP INDEX CONCURRENTLY <name> and run this again.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_experiences_user_id_id
+    ON experiences (user_id, id);
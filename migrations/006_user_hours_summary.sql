@@ -0,0 +1,13 @@
+-- Per-user rollup of experiences (total hours, session count and last
+-- activity), kept in step by the Experience listeners in
+-- models/UserHoursSummary.py. Those listeners write to this table on every
+-- experience insert, update and delete, so apply this before deploying
+-- code that has them, then backfill it from existing experiences:
+--   flask rebuild-hours-summary
+
+CREATE TABLE IF NOT EXISTS user_hours_summary (
+    user_id INTEGER PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+    total_hours NUMERIC(12, 2) NOT NULL DEFAULT 0,
+    session_count INTEGER NOT NULL DEFAULT 0,
+    last_activity TIMESTAMP WITHOUT TIME ZONE
+);
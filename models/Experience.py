@@ -2,13 +2,30 @@
 
 from models.models import db
 from models.User import User
-from datetime import datetime
+from sqlalchemy.orm import validates
+from datetime import datetime, timedelta
 
 class Experience(db.Model):
     """A volunteer experience."""
 
     __tablename__ = 'experiences'
 
+    # Built CONCURRENTLY on existing databases by
+    # migrations/002_experience_indexes.sql and 005_experience_user_id_id.sql
+    __table_args__ = (
+        # Experiences of a user, in time order
+        db.Index('ix_experiences_user_id_sign_in_time', 'user_id', 'sign_in_time'),
+        # Experiences of a user, in the id order lists are paged in
+        db.Index('ix_experiences_user_id_id', 'user_id', 'id'),
+        # Experiences not yet signed out of ('incomplete'), a small fraction,
+        # in the id order lists are paged in
+        db.Index(
+            'ix_experiences_open',
+            'id',
+            postgresql_where=db.text('sign_out_time IS NULL')
+        ),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -16,20 +33,28 @@ class Experience(db.Model):
     )
 
     date = db.Column(
-        db.String(),
+        db.DateTime,
         nullable=False,
     )
 
     sign_in_time = db.Column(
-        db.String(),
+        db.DateTime,
         nullable=False,
     )
 
     sign_out_time = db.Column(
-        db.String(),
+        db.DateTime,
         nullable=True,
     )
 
+    # Whole seconds between sign in and sign out, computed by the database
+    duration_seconds = db.Column(
+        db.Integer,
+        db.Computed(
+            "CAST(FLOOR(EXTRACT(EPOCH FROM sign_out_time - sign_in_time)) AS INTEGER)"
+        ),
+    )
+
     department = db.Column(
         db.String(50),
         nullable=False,
@@ -41,30 +66,114 @@ class Experience(db.Model):
         nullable=False,
     )
 
+    @validates('date', 'sign_in_time', 'sign_out_time')
+    def validate_datetime(self, key, value):
+        """Accept ISO format strings as well as datetimes"""
+
+        if isinstance(value, str):
+            return datetime.fromisoformat(value)
+
+        return value
+
     def serialize(self):
-        """Serialize experience data"""
+        """
+        Serialize experience data, with times as ISO format strings. They
+        always have microseconds, as the experience forms require.
+        """
 
         return {
             "id": self.id,
-            "date": self.date,
-            "sign_in_time": self.sign_in_time,
-            "sign_out_time": self.sign_out_time,
+            "date": self.date.isoformat(timespec="microseconds"),
+            "sign_in_time": self.sign_in_time.isoformat(
+                timespec="microseconds"
+            ),
+            "sign_out_time": (
+                self.sign_out_time.isoformat(timespec="microseconds")
+                if self.sign_out_time else None
+            ),
             "department": self.department,
             "user_id": self.user_id
         }
 
+    # Keys of serialize(), each also the name of its column
+    SERIALIZE_KEYS = (
+        "id",
+        "date",
+        "sign_in_time",
+        "sign_out_time",
+        "department",
+        "user_id",
+    )
+
+    @classmethod
+    def get_row_columns(cls, keys=SERIALIZE_KEYS):
+        """Columns of serialize() `keys`, to read lists as rows, not instances"""
+
+        return tuple(getattr(cls, key) for key in keys)
+
+    @staticmethod
+    def serialize_row(row, keys=SERIALIZE_KEYS):
+        """Serialize a row of get_row_columns(keys) the same as serialize()"""
+
+        experience = dict(zip(keys, row))
+
+        for key in ("date", "sign_in_time", "sign_out_time"):
+            if experience.get(key) is not None:
+                experience[key] = experience[key].isoformat(
+                    timespec="microseconds"
+                )
+
+        return experience
+
     def get_duration(self):
         """Get duration of experience in hours"""
 
-        if self.sign_out_time is None:
+        return Experience.calculate_duration(
+            self.sign_in_time,
+            self.sign_out_time
+        )
+
+    @staticmethod
+    def calculate_duration(sign_in_time, sign_out_time):
+        """Get duration in hours between sign in and sign out times"""
+
+        if sign_out_time is None:
             return 0
 
-        sign_in = datetime.fromisoformat(self.sign_in_time)
-        sign_out = datetime.fromisoformat(self.sign_out_time)
-        duration = sign_out - sign_in
+        duration = sign_out_time - sign_in_time
         hours = round(duration.total_seconds()//60/60, 2)
 
         return hours
 
+    @classmethod
+    def get_duration_expression(cls):
+        """SQL expression for duration of experience in hours.
+
+        Mirrors get_duration so hours can be summed in the database:
+        whole minutes converted to hours, rounded to 2 decimal places,
+        and 0 for an experience that has not been signed out of.
+        """
+
+        minutes = cls.duration_seconds // 60
+
+        return db.case(
+            (cls.duration_seconds.is_(None), 0),
+            else_=db.func.round(db.cast(minutes, db.Numeric) / 60, 2)
+        )
+
+    @classmethod
+    def get_filters(cls, start=None, end=None, department=None):
+        """SQL conditions for experiences dated from start to end (inclusive
+        dates) in department. Conditions not given are left out.
+        """
+
+        filters = []
 
+        if start:
+            filters.append(cls.date >= start)
+        if end:
+            filters.append(cls.date < end + timedelta(days=1))
+        if department:
+            filters.append(cls.department == department)
 
+        return filters
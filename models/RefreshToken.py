@@ -0,0 +1,118 @@
+"""SQLAlchemy models for a User's refresh tokens"""
+
+from models.models import db
+from models.User import User
+from datetime import datetime
+import uuid
+
+class RefreshToken(db.Model):
+    """A refresh token issued to a user, by its JWT id (jti).
+
+    Each refresh token can be used once: using it revokes it and issues its
+    replacement in the same family. A revoked token being used again means
+    it was stolen or replayed, so its whole family is revoked.
+    Times are UTC, as in the tokens themselves.
+    """
+
+    __tablename__ = 'refresh_tokens'
+
+    jti = db.Column(
+        db.String(36),
+        primary_key=True,
+    )
+
+    family = db.Column(
+        db.String(36),
+        nullable=False,
+        index=True,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey(User.id, ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    expires_at = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    revoked_at = db.Column(
+        db.DateTime,
+        nullable=True,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    @classmethod
+    def record(cls, jti, user_id, expires_at, family=None):
+        """Record a newly issued refresh token, in a new family by default.
+
+        Caller must commit.
+        """
+
+        token = cls(
+            jti=jti,
+            user_id=user_id,
+            expires_at=expires_at,
+            family=family or str(uuid.uuid4()),
+        )
+
+        db.session.add(token)
+        return token
+
+    @classmethod
+    def use(cls, jti):
+        """Revoke the refresh token with `jti` so it cannot be used again.
+
+        Returns the token if it was valid to use. Returns None if it is
+        unknown, expired or already revoked; if already revoked, revokes
+        its whole family. Locks the row, so concurrent uses of one token
+        cannot both succeed. Caller must commit.
+        """
+
+        token = (cls.query
+            .filter_by(jti=jti)
+            .with_for_update()
+            .one_or_none()
+        )
+
+        if token is None:
+            return None
+
+        now = datetime.utcnow()
+
+        if token.revoked_at is not None:
+            cls.revoke_family(token.family)
+            return None
+
+        if token.expires_at <= now:
+            return None
+
+        token.revoked_at = now
+        return token
+
+    @classmethod
+    def revoke_family(cls, family):
+        """Revoke every unrevoked token in `family`. Caller must commit."""
+
+        db.session.execute(
+            db.update(cls)
+            .where(cls.family == family, cls.revoked_at.is_(None))
+            .values(revoked_at=datetime.utcnow())
+        )
+
+    @classmethod
+    def prune(cls):
+        """Delete expired tokens, returning how many. Caller must commit."""
+
+        result = db.session.execute(
+            db.delete(cls).where(cls.expires_at <= datetime.utcnow())
+        )
+
+        return result.rowcount
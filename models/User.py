@@ -1,9 +1,47 @@
 """SQLAlchemy models for User"""
 
+from flask import current_app
 from models.models import db
-from flask_bcrypt import Bcrypt
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from typing import NamedTuple
+from werkzeug.local import LocalProxy
+from hashing import password_hasher, HashingBusy
+
+# Identities of recently authenticated users: the current app's TTLCache,
+# per worker. Entries are dropped when this worker changes a user, and
+# expire after a TTL so changes made by other workers are seen within that
+# time.
+identity_cache = LocalProxy(lambda: current_app.extensions["identity_cache"])
+
+class UserIdentity(NamedTuple):
+    """The parts of a User that authorization checks need"""
+
+    id: int
+    is_admin: bool
+    status: str
+    token_version: int
 
-bcrypt = Bcrypt()
+    @classmethod
+    def from_claims(cls, jwt_data):
+        """Get the UserIdentity embedded in a token's claims"""
+
+        return cls(
+            jwt_data["sub"],
+            jwt_data["is_admin"],
+            jwt_data["status"],
+            jwt_data["ver"]
+        )
+
+    @staticmethod
+    def get_claims(user):
+        """Claims to embed in a token for user (a User or UserIdentity)"""
+
+        return {
+            "is_admin": user.is_admin,
+            "status": user.status,
+            "ver": user.token_version
+        }
 
 class User(db.Model):
     """User in the system"""
@@ -191,6 +229,15 @@ class User(db.Model):
         default=db.func.now()
     )
 
+    # Bumped whenever is_admin or status changes, so tokens minted with the
+    # previous values can be rejected
+    token_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0"
+    )
+
     @classmethod
     def authenticate(cls, email, password):
         """Find user with `email` and `password`.
@@ -201,18 +248,64 @@ class User(db.Model):
 
         If this can't find matching user (or if password is wrong), returns
         False.
+
+        A password hashed at a cost other than the target is rehashed at
+        the target cost and saved.
+
+        Raises HashingBusy if no password hashing slot frees up in time.
         """
 
         user = cls.query.filter_by(email=email).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = password_hasher.check_password_hash(user.password, password)
             if is_auth:
+                if password_hasher.needs_rehash(user.password):
+                    user.rehash_password(password)
                 return user
 
         return False
 
 
+    def rehash_password(self, password):
+        """Save password hashed at the target cost.
+
+        Best effort: if hashing is saturated, keeps the current hash until
+        the next login.
+        """
+
+        try:
+            self.password = password_hasher.generate_password_hash(password)
+        except HashingBusy:
+            return
+
+        db.session.commit()
+
+    @classmethod
+    def get_identity(cls, user_id):
+        """Get the UserIdentity of user with `user_id`, or None if not found.
+
+        Served from identity_cache when possible; otherwise only the columns
+        of UserIdentity are loaded from the database.
+        """
+
+        identity = identity_cache.get(user_id)
+
+        if identity is None:
+            row = (db.session
+                .query(cls.id, cls.is_admin, cls.status, cls.token_version)
+                .filter_by(id=user_id)
+                .one_or_none()
+            )
+
+            if row is None:
+                return None
+
+            identity = UserIdentity(*row)
+            identity_cache.set(user_id, identity)
+
+        return identity
+
     @classmethod
     def signup(
         cls,
@@ -251,9 +344,10 @@ class User(db.Model):
         """Sign up user.
 
         Hashes password and adds user to system.
+        Raises HashingBusy if no password hashing slot frees up in time.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = password_hasher.generate_password_hash(password)
 
         user = User(
             status=status,
@@ -330,269 +424,350 @@ class User(db.Model):
             "created_at": self.created_at
         }
         
+    # Keys of serialize(), each also the name of its column
+    SERIALIZE_KEYS = (
+        "id",
+        "badge_number",
+        "email",
+        "school_email",
+        "first_name",
+        "last_name",
+        "dob",
+        "gender",
+        "pronouns",
+        "race",
+        "ethnicity",
+        "address",
+        "city",
+        "state",
+        "zip_code",
+        "phone_number",
+        "phone_carrier",
+        "is_student",
+        "type_of_student",
+        "school",
+        "anticipated_graduation",
+        "major",
+        "minor",
+        "classification",
+        "degree",
+        "is_healthcare_provider",
+        "type_of_provider",
+        "employer",
+        "is_multilingual",
+        "is_admin",
+        "status",
+        "created_at",
+    )
+
+    @classmethod
+    def get_row_columns(cls, keys=SERIALIZE_KEYS):
+        """Columns of serialize() `keys`, to read users as rows, not instances"""
+
+        return tuple(getattr(cls, key) for key in keys)
+
     @classmethod
     def get_race_options(self):
-        return [
-            "Native American or Alaska Native",
-            "Asian",
-            "Black or African American",
-            "Middle Eastern or North African",
-            "Hispanic or Latino",
-            "Native Hawaiian",
-            "Pacific Islander",
-            "White",
-            "I Do Not See My Race Listed Here",
-            "I Do Not Know",
-            "I Prefer Not to Share"
-        ]
+        return RACE_OPTIONS
         
     @classmethod
     def get_ethnicity_options(self):
-        return [
-            "Hispanic or Latino",
-            "Not Hispanic or Latino",
-            "I Do Not Know",
-            "I Prefer Not to Share"
-        ]
+        return ETHNICITY_OPTIONS
         
     @classmethod
     def get_ethnic_background_options(self):
-        return [
-            "African",
-            "African American",
-            "Alaska Native",
-            "Albanian",
-            "Algerian",
-            "American",
-            "American Indian or Native American background not listed here",
-            "Angolan",
-            "Anguillan",
-            "Antiguan and Barbudan",
-            "Arab",
-            "Argentinian",
-            "Armenian",
-            "Aruban",
-            "Asian backround not listed here",
-            "Asian Indian",
-            "Australian",
-            "Austrian",
-            "Azerbaijani",
-            "Bahamian",
-            "Bahraini",
-            "Bajan or Barbadian",
-            "Bangladeshi",
-            "Batswana",
-            "Belarusian",
-            "Belgian",
-            "Belizean",
-            "Beninese",
-            "Bermudian",
-            "Bhutanese",
-            "Bissau-Guinean",
-            "Black or African background not listed here",
-            "Bolivian",
-            "Bosnian",
-            "Brazilian",
-            "British Virgin Islander",
-            "Bruneian",
-            "Bulgarian",
-            "Burkinabe",
-            "Burmese or Myanma",
-            "Burundian",
-            "Cambodian",
-            "Cameroonian",
-            "Canadian",
-            "Cape Verdean",
-            "Caribbean background not listed here",
-            "Caymanian",
-            "Central African",
-            "Chadian",
-            "Cherokee",
-            "Chilean",
-            "Chinese",
-            "Colombian",
-            "Comorian",
-            "Congolese",
-            "Cook Islander",
-            "Costa Rican",
-            "Croatian",
-            "Cuban",
-            "Curaçaoan",
-            "Cypriot",
-            "Czech",
-            "Danish",
-            "Djiboutian",
-            "Dominican/Black",
-            "Dominican/Hispanic",
-            "Dutch",
-            "Ecuadorian",
-            "Egyptian",
-            "Emiratis",
-            "English",
-            "Equatoguinean",
-            "Eritrean",
-            "Estonian",
-            "Ethiopian",
-            "European",
-            "European background not listed here",
-            "Fijian",
-            "Filipino",
-            "Finnish",
-            "French",
-            "French Polynesian",
-            "Gabonese",
-            "Gambian",
-            "Georgian",
-            "German",
-            "Ghanaian",
-            "Greek",
-            "Grenadian",
-            "Guadeloupian",
-            "Guamanian or Chamorro",
-            "Guatemalan",
-            "Guianese",
-            "Guinean",
-            "Guyanese",
-            "Haitian",
-            "Hmong",
-            "Honduran",
-            "Hungarian",
-            "Icelandic",
-            "Indonesian",
-            "Iranian",
-            "Iraqi",
-            "Irish",
-            "Iroquois",
-            "Ivorian",
-            "Israeli",
-            "Italian",
-            "Jamaican",
-            "Japanese",
-            "Jordanian",
-            "Kazakhstani",
-            "Kenyan",
-            "Kiribatian",
-            "Kittitian or Nevisian",
-            "Korean",
-            "Kuwaiti",
-            "Kyrgyz",
-            "Laotian",
-            "Latvian",
-            "Lebanese",
-            "Liberian",
-            "Libyan",
-            "Liechtensteiner",
-            "Lithuanian",
-            "Luxembourger",
-            "Macedonian",
-            "Malagasy",
-            "Malawian",
-            "Malaysian",
-            "Maldivians",
-            "Malian",
-            "Maltese",
-            "Marshallese",
-            "Martinican",
-            "Mashantucket Pequot",
-            "Mauritanian",
-            "Mauritian",
-            "Mexican, Mexican American, Chicano/a",
-            "Micronesian",
-            "Middle Eastern or Northern African background not listed here",
-            "Mohegan",
-            "Moldovan",
-            "Monegasque",
-            "Mongolian",
-            "Montenegrin",
-            "Montserratian",
-            "Moroccan",
-            "Mosotho",
-            "Mozambican",
-            "Namibian",
-            "Nauruan",
-            "Nepalese",
-            "New Caledoner",
-            "New Zealander",
-            "Nicaraguan",
-            "Nigerian",
-            "Nigerien",
-            "Niuean",
-            "Northern Irish",
-            "Northern Mariana Islander",
-            "Norwegian",
-            "Omanis",
-            "Pakistani",
-            "Palauan",
-            "Palestinian",
-            "Papua New Guinean",
-            "Paraguayan",
-            "Peruvian",
-            "Polish",
-            "Portuguese",
-            "Puerto Rican",
-            "Qataris",
-            "Romanian",
-            "Russian",
-            "Rwandan",
-            "Saint Lucian",
-            "Saint Martiner",
-            "Salvadorian",
-            "Sammarinese",
-            "Samoan",
-            "Sao Tomean",
-            "Saudi Arabian or Saudi",
-            "Scottish",
-            "Senegalese",
-            "Serbian",
-            "Seychellois",
-            "Sierra Leonean",
-            "Singaporean",
-            "Sint Maartener - Ameridian",
-            "Slovak",
-            "Slovenian",
-            "Solomon Islander",
-            "Somalian",
-            "South African",
-            "South Sudanese",
-            "Spaniard",
-            "Spanish",
-            "Sri Lankan",
-            "Sudanese",
-            "Surinamese",
-            "Swazi",
-            "Swedish",
-            "Swiss",
-            "Syrian",
-            "Taiwanese",
-            "Tajikistanis",
-            "Tanzanian",
-            "Thai",
-            "Timorese",
-            "Togolese",
-            "Tokelauan",
-            "Tongan",
-            "Trinidadian and Tobagonian",
-            "Tunisian",
-            "Turkish",
-            "Turkmen",
-            "Turks and Caicos Islander",
-            "Tuvaluan",
-            "Ugandan",
-            "Ukrainian",
-            "Uruguayan",
-            "Uzbek",
-            "Vanuatuan",
-            "Venezuelan",
-            "Vietnamese",
-            "Vincentian",
-            "Wallisian or Futunan",
-            "Welsh",
-            "West Indian",
-            "Yemeni",
-            "Zambian",
-            "Zimbabwean",
-            "I Do Not Know",
-            "I Do Not See My Ethnic Background Listed Here",
-            "I Prefer Not To Share"
-        ]
-            
\ No newline at end of file
+        return ETHNIC_BACKGROUND_OPTIONS
+            
+
+
+# Options for a user's race
+RACE_OPTIONS = (
+    "Native American or Alaska Native",
+    "Asian",
+    "Black or African American",
+    "Middle Eastern or North African",
+    "Hispanic or Latino",
+    "Native Hawaiian",
+    "Pacific Islander",
+    "White",
+    "I Do Not See My Race Listed Here",
+    "I Do Not Know",
+    "I Prefer Not to Share"
+)
+
+
+# Options for a user's ethnicity
+ETHNICITY_OPTIONS = (
+    "Hispanic or Latino",
+    "Not Hispanic or Latino",
+    "I Do Not Know",
+    "I Prefer Not to Share"
+)
+
+
+# Options for a user's ethnic background
+ETHNIC_BACKGROUND_OPTIONS = (
+    "African",
+    "African American",
+    "Alaska Native",
+    "Albanian",
+    "Algerian",
+    "American",
+    "American Indian or Native American background not listed here",
+    "Angolan",
+    "Anguillan",
+    "Antiguan and Barbudan",
+    "Arab",
+    "Argentinian",
+    "Armenian",
+    "Aruban",
+    "Asian backround not listed here",
+    "Asian Indian",
+    "Australian",
+    "Austrian",
+    "Azerbaijani",
+    "Bahamian",
+    "Bahraini",
+    "Bajan or Barbadian",
+    "Bangladeshi",
+    "Batswana",
+    "Belarusian",
+    "Belgian",
+    "Belizean",
+    "Beninese",
+    "Bermudian",
+    "Bhutanese",
+    "Bissau-Guinean",
+    "Black or African background not listed here",
+    "Bolivian",
+    "Bosnian",
+    "Brazilian",
+    "British Virgin Islander",
+    "Bruneian",
+    "Bulgarian",
+    "Burkinabe",
+    "Burmese or Myanma",
+    "Burundian",
+    "Cambodian",
+    "Cameroonian",
+    "Canadian",
+    "Cape Verdean",
+    "Caribbean background not listed here",
+    "Caymanian",
+    "Central African",
+    "Chadian",
+    "Cherokee",
+    "Chilean",
+    "Chinese",
+    "Colombian",
+    "Comorian",
+    "Congolese",
+    "Cook Islander",
+    "Costa Rican",
+    "Croatian",
+    "Cuban",
+    "Curaçaoan",
+    "Cypriot",
+    "Czech",
+    "Danish",
+    "Djiboutian",
+    "Dominican/Black",
+    "Dominican/Hispanic",
+    "Dutch",
+    "Ecuadorian",
+    "Egyptian",
+    "Emiratis",
+    "English",
+    "Equatoguinean",
+    "Eritrean",
+    "Estonian",
+    "Ethiopian",
+    "European",
+    "European background not listed here",
+    "Fijian",
+    "Filipino",
+    "Finnish",
+    "French",
+    "French Polynesian",
+    "Gabonese",
+    "Gambian",
+    "Georgian",
+    "German",
+    "Ghanaian",
+    "Greek",
+    "Grenadian",
+    "Guadeloupian",
+    "Guamanian or Chamorro",
+    "Guatemalan",
+    "Guianese",
+    "Guinean",
+    "Guyanese",
+    "Haitian",
+    "Hmong",
+    "Honduran",
+    "Hungarian",
+    "Icelandic",
+    "Indonesian",
+    "Iranian",
+    "Iraqi",
+    "Irish",
+    "Iroquois",
+    "Ivorian",
+    "Israeli",
+    "Italian",
+    "Jamaican",
+    "Japanese",
+    "Jordanian",
+    "Kazakhstani",
+    "Kenyan",
+    "Kiribatian",
+    "Kittitian or Nevisian",
+    "Korean",
+    "Kuwaiti",
+    "Kyrgyz",
+    "Laotian",
+    "Latvian",
+    "Lebanese",
+    "Liberian",
+    "Libyan",
+    "Liechtensteiner",
+    "Lithuanian",
+    "Luxembourger",
+    "Macedonian",
+    "Malagasy",
+    "Malawian",
+    "Malaysian",
+    "Maldivians",
+    "Malian",
+    "Maltese",
+    "Marshallese",
+    "Martinican",
+    "Mashantucket Pequot",
+    "Mauritanian",
+    "Mauritian",
+    "Mexican, Mexican American, Chicano/a",
+    "Micronesian",
+    "Middle Eastern or Northern African background not listed here",
+    "Mohegan",
+    "Moldovan",
+    "Monegasque",
+    "Mongolian",
+    "Montenegrin",
+    "Montserratian",
+    "Moroccan",
+    "Mosotho",
+    "Mozambican",
+    "Namibian",
+    "Nauruan",
+    "Nepalese",
+    "New Caledoner",
+    "New Zealander",
+    "Nicaraguan",
+    "Nigerian",
+    "Nigerien",
+    "Niuean",
+    "Northern Irish",
+    "Northern Mariana Islander",
+    "Norwegian",
+    "Omanis",
+    "Pakistani",
+    "Palauan",
+    "Palestinian",
+    "Papua New Guinean",
+    "Paraguayan",
+    "Peruvian",
+    "Polish",
+    "Portuguese",
+    "Puerto Rican",
+    "Qataris",
+    "Romanian",
+    "Russian",
+    "Rwandan",
+    "Saint Lucian",
+    "Saint Martiner",
+    "Salvadorian",
+    "Sammarinese",
+    "Samoan",
+    "Sao Tomean",
+    "Saudi Arabian or Saudi",
+    "Scottish",
+    "Senegalese",
+    "Serbian",
+    "Seychellois",
+    "Sierra Leonean",
+    "Singaporean",
+    "Sint Maartener - Ameridian",
+    "Slovak",
+    "Slovenian",
+    "Solomon Islander",
+    "Somalian",
+    "South African",
+    "South Sudanese",
+    "Spaniard",
+    "Spanish",
+    "Sri Lankan",
+    "Sudanese",
+    "Surinamese",
+    "Swazi",
+    "Swedish",
+    "Swiss",
+    "Syrian",
+    "Taiwanese",
+    "Tajikistanis",
+    "Tanzanian",
+    "Thai",
+    "Timorese",
+    "Togolese",
+    "Tokelauan",
+    "Tongan",
+    "Trinidadian and Tobagonian",
+    "Tunisian",
+    "Turkish",
+    "Turkmen",
+    "Turks and Caicos Islander",
+    "Tuvaluan",
+    "Ugandan",
+    "Ukrainian",
+    "Uruguayan",
+    "Uzbek",
+    "Vanuatuan",
+    "Venezuelan",
+    "Vietnamese",
+    "Vincentian",
+    "Wallisian or Futunan",
+    "Welsh",
+    "West Indian",
+    "Yemeni",
+    "Zambian",
+    "Zimbabwean",
+    "I Do Not Know",
+    "I Do Not See My Ethnic Background Listed Here",
+    "I Prefer Not To Share"
+)
+
+
+# Bulk query updates bypass this; tokens then keep working until they expire.
+@event.listens_for(User, 'before_update')
+def _bump_token_version(mapper, connection, target):
+    state = db.inspect(target)
+
+    if (state.attrs.is_admin.history.has_changes()
+    or state.attrs.status.history.has_changes()):
+        target.token_version = (target.token_version or 0) + 1
+
+
+# Bulk query updates and deletes bypass these; entries then expire by TTL.
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_identity(mapper, connection, target):
+    identity_cache.invalidate(target.id)
+
+    # Drop again after commit, in case another request re-cached the
+    # previous values before this transaction committed
+    object_session(target).info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_identities(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        identity_cache.invalidate(user_id)
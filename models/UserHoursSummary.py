@@ -0,0 +1,262 @@
+"""SQLAlchemy models for a User's hours summary"""
+
+from models.models import db
+from models.User import User
+from models.Experience import Experience
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+
+class UserHoursSummary(db.Model):
+    """Rollup of a user's experiences, kept in step with each experience.
+
+    Rows are upserted in the same transaction that inserts, updates or
+    deletes an Experience (see listeners below), so reading a user's hours
+    is a primary key lookup rather than a scan of experiences.
+    """
+
+    __tablename__ = 'user_hours_summary'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey(User.id, ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    total_hours = db.Column(
+        db.Numeric(12, 2),
+        nullable=False,
+        default=0,
+    )
+
+    session_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    last_activity = db.Column(
+        db.DateTime,
+        nullable=True,
+    )
+
+    def serialize(self):
+        """Serialize user hours summary data"""
+
+        return {
+            "user_id": self.user_id,
+            "total_hours": float(self.total_hours),
+            "session_count": self.session_count,
+            "last_activity": self.last_activity
+        }
+
+    @classmethod
+    def record(cls, connection, user_id, hours=0, sessions=0, last_activity=None):
+        """Add hours and sessions to a user's summary, creating it if needed.
+
+        Runs on the given connection so it is part of the caller's
+        transaction. Increments are applied in the database, so concurrent
+        sign-ins and sign-outs for the same user do not overwrite each other;
+        the listeners below lock an experience's row while working out its
+        change, so concurrent writes to one experience aren't counted twice.
+        """
+
+        stmt = insert(cls).values(
+            user_id=user_id,
+            total_hours=hours,
+            session_count=sessions,
+            last_activity=last_activity,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.user_id],
+            set_={
+                "total_hours": cls.total_hours + stmt.excluded.total_hours,
+                "session_count": cls.session_count + stmt.excluded.session_count,
+                "last_activity": db.func.greatest(
+                    cls.last_activity,
+                    stmt.excluded.last_activity
+                ),
+            }
+        )
+        connection.execute(stmt)
+
+    @classmethod
+    def remove(cls, connection, user_id, hours):
+        """Take a deleted experience's hours and session off a user's summary.
+
+        last_activity is recomputed from the user's remaining experiences,
+        and a summary left with no sessions is deleted, so the result is
+        what rebuild() would store. Runs on the given connection, after the
+        experience is deleted.
+        """
+
+        cls.record(connection, user_id, hours=-hours, sessions=-1)
+        cls.refresh_last_activity(connection, user_id)
+        connection.execute(db.delete(cls)
+            .where(cls.user_id == user_id, cls.session_count <= 0)
+        )
+
+    @classmethod
+    def refresh_last_activity(cls, connection, user_id):
+        """
+        Recompute a user's last_activity from their experiences, for when
+        the latest one moved earlier or is gone. Runs on the given connection.
+        """
+
+        latest = (db.select(db.func.max(db.func.greatest(
+                Experience.sign_in_time,
+                Experience.sign_out_time
+            )))
+            .where(Experience.user_id == user_id)
+            .scalar_subquery()
+        )
+        connection.execute(db.update(cls)
+            .where(cls.user_id == user_id)
+            .values(last_activity=latest)
+        )
+
+    @classmethod
+    def get_computed_query(cls):
+        """Query recomputing every user's summary from raw experiences"""
+
+        return (db.select(
+                Experience.user_id,
+                db.func.sum(Experience.get_duration_expression()),
+                db.func.count(Experience.id),
+                db.func.max(db.func.greatest(
+                    Experience.sign_in_time,
+                    Experience.sign_out_time
+                )),
+            )
+            .group_by(Experience.user_id)
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """Replace every user's summary with one recomputed from experiences.
+
+        Caller must commit.
+        """
+
+        db.session.execute(db.delete(cls))
+        db.session.execute(
+            db.insert(cls).from_select(
+                ["user_id", "total_hours", "session_count", "last_activity"],
+                cls.get_computed_query()
+            )
+        )
+
+    @classmethod
+    def verify(cls):
+        """Compare stored summaries against ones recomputed from experiences.
+
+        Returns a list of drifted summaries:
+        [{ "user_id": 1, "stored": (...), "computed": (...) } ...]
+        where each tuple is (total_hours, session_count, last_activity)
+        and is None if that side has no row for the user.
+        """
+
+        computed = {
+            row[0]: tuple(row[1:])
+            for row in db.session.execute(cls.get_computed_query())
+        }
+        stored = {
+            row[0]: tuple(row[1:])
+            for row in db.session.execute(db.select(
+                cls.user_id,
+                cls.total_hours,
+                cls.session_count,
+                cls.last_activity,
+            ))
+        }
+
+        drift = []
+        for user_id in sorted(computed.keys() | stored.keys()):
+            if computed.get(user_id) != stored.get(user_id):
+                drift.append({
+                    "user_id": user_id,
+                    "stored": stored.get(user_id),
+                    "computed": computed.get(user_id),
+                })
+
+        return drift
+
+
+def _last_activity(sign_in_time, sign_out_time):
+    """Latest of an experience's sign in and sign out times"""
+
+    return sign_out_time or sign_in_time
+
+
+def _lock_times(connection, target):
+    """
+    Lock an experience's row and keep its committed sign in and sign out
+    times, to work out its change from. The session's copy may be expired,
+    or older than another transaction's write, which then waits for this
+    one. None if the row is already gone.
+    """
+
+    table = Experience.__table__
+    db.inspect(target).info["committed_times"] = connection.execute(
+        db.select(table.c.sign_in_time, table.c.sign_out_time)
+        .where(table.c.id == target.id)
+        .with_for_update()
+    ).one_or_none()
+
+
+@event.listens_for(Experience, 'after_insert')
+def _record_new_experience(mapper, connection, target):
+    UserHoursSummary.record(
+        connection,
+        target.user_id,
+        hours=target.get_duration(),
+        sessions=1,
+        last_activity=_last_activity(target.sign_in_time, target.sign_out_time),
+    )
+
+
+@event.listens_for(Experience, 'before_update')
+def _lock_updated_experience(mapper, connection, target):
+    state = db.inspect(target)
+
+    if (state.attrs.sign_in_time.history.has_changes()
+            or state.attrs.sign_out_time.history.has_changes()):
+        _lock_times(connection, target)
+
+
+@event.listens_for(Experience, 'after_update')
+def _record_updated_experience(mapper, connection, target):
+    committed = db.inspect(target).info.pop("committed_times", None)
+    if committed is None:
+        return
+
+    previous_activity = _last_activity(*committed)
+    last_activity = _last_activity(target.sign_in_time, target.sign_out_time)
+
+    UserHoursSummary.record(
+        connection,
+        target.user_id,
+        hours=target.get_duration() - Experience.calculate_duration(*committed),
+        last_activity=last_activity,
+    )
+
+    # record() only moves last_activity later
+    if last_activity < previous_activity:
+        UserHoursSummary.refresh_last_activity(connection, target.user_id)
+
+
+@event.listens_for(Experience, 'before_delete')
+def _lock_deleted_experience(mapper, connection, target):
+    _lock_times(connection, target)
+
+
+@event.listens_for(Experience, 'after_delete')
+def _record_deleted_experience(mapper, connection, target):
+    committed = db.inspect(target).info.pop("committed_times", None)
+    if committed is None:
+        return
+
+    UserHoursSummary.remove(
+        connection,
+        target.user_id,
+        hours=Experience.calculate_duration(*committed),
+    )
@@ -1,13 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
+from replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 def connect_db(app):
     """Connect this database to provided Flask app.
 
-    You should call this in your Flask app.
+    You should call this in your Flask app. No app context is pushed:
+    outside requests and CLI commands, use `with app.app_context()`.
     """
 
-    app.app_context().push()
-    db.app = app
     db.init_app(app)
\ No newline at end of file
@@ -17,6 +17,9 @@ from app import app
 
 bcrypt = Bcrypt()
 
+# Tests use the database outside of requests
+app.app_context().push()
+
 # Create tables once for all tests.
 # Data deleted & fresh test data set within each test
 db.create_all()
@@ -66,6 +69,254 @@ class ExperienceModelTestCase(TestCase):
 ############################################################
 # get_duration Tests
 
-    # def test_get_duration(self):
-# TODO: Add test for get_duration
-# - if sign out time is None, returns 0 for duration
\ No newline at end of file
+    def test_get_duration(self):
+        e1 = Experience(
+            date=datetime(year=2022, month=1, day=5),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=8),
+            sign_out_time=datetime(year=2022, month=1, day=5, hour=10, minute=15),
+            department="lab",
+            user_id=self.u1_id
+        )
+
+        self.assertEqual(e1.get_duration(), 2.25)
+
+    def test_get_duration_no_sign_out(self):
+        e1 = Experience(
+            date=datetime(year=2022, month=1, day=5),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=8),
+            sign_out_time=None,
+            department="lab",
+            user_id=self.u1_id
+        )
+
+        self.assertEqual(e1.get_duration(), 0)
+
+    def test_duration_seconds(self):
+        e1 = Experience(
+            date=datetime(year=2022, month=1, day=5),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=8),
+            sign_out_time=datetime(
+                year=2022, month=1, day=5, hour=8, minute=7, microsecond=500000
+            ),
+            department="lab",
+            user_id=self.u1_id
+        )
+        e2 = Experience(
+            date=datetime(year=2022, month=1, day=5),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=12),
+            sign_out_time=None,
+            department="lab",
+            user_id=self.u1_id
+        )
+
+        db.session.add_all([e1, e2])
+        db.session.commit()
+
+        self.assertEqual(e1.duration_seconds, 420)
+        self.assertIsNone(e2.duration_seconds)
+
+        hours = (db.session
+            .query(Experience.get_duration_expression())
+            .order_by(Experience.id)
+            .all()
+        )
+        self.assertEqual(
+            [float(h) for (h,) in hours],
+            [e1.get_duration(), e2.get_duration()]
+        )
+
+############################################################
+# serialize Tests
+
+    def test_serialize_iso_strings(self):
+        e1 = Experience(
+            date=datetime(year=2022, month=1, day=5).isoformat(),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=8).isoformat(),
+            sign_out_time=None,
+            department="lab",
+            user_id=self.u1_id
+        )
+
+        db.session.add(e1)
+        db.session.commit()
+
+        e1 = Experience.query.get(e1.id)
+
+        self.assertEqual(e1.sign_in_time, datetime(year=2022, month=1, day=5, hour=8))
+        self.assertEqual(e1.serialize(), {
+            "id": e1.id,
+            "date": "2022-01-05T00:00:00.000000",
+            "sign_in_time": "2022-01-05T08:00:00.000000",
+            "sign_out_time": None,
+            "department": "lab",
+            "user_id": self.u1_id
+        })
+
+    def test_serialize_row(self):
+        e1 = Experience(
+            date=datetime(year=2022, month=1, day=5).isoformat(),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=8).isoformat(),
+            sign_out_time=datetime(year=2022, month=1, day=5, hour=9).isoformat(),
+            department="lab",
+            user_id=self.u1_id
+        )
+        e2 = Experience(
+            date=datetime(year=2022, month=1, day=6).isoformat(),
+            sign_in_time=datetime(year=2022, month=1, day=6, hour=8).isoformat(),
+            sign_out_time=None,
+            department="pharmacy",
+            user_id=self.u1_id
+        )
+
+        db.session.add_all([e1, e2])
+        db.session.commit()
+
+        rows = (db.session
+            .query(*Experience.get_row_columns())
+            .order_by(Experience.id)
+            .all()
+        )
+
+        self.assertEqual(
+            [Experience.serialize_row(row) for row in rows],
+            [e1.serialize(), e2.serialize()]
+        )
+
+        keys = ("id", "sign_out_time")
+        rows = (db.session
+            .query(*Experience.get_row_columns(keys))
+            .order_by(Experience.id)
+            .all()
+        )
+
+        self.assertEqual(
+            [Experience.serialize_row(row, keys) for row in rows],
+            [
+                {"id": e1.id, "sign_out_time": "2022-01-05T09:00:00.000000"},
+                {"id": e2.id, "sign_out_time": None},
+            ]
+        )
+
+
+class ExperienceIndexesTestCase(TestCase):
+    """Hot experience queries use indexes on a table of a million rows."""
+
+    USERS = 1000
+    EXPERIENCES = 1000000
+
+    @classmethod
+    def setUpClass(cls):
+        Experience.query.delete()
+        User.query.delete()
+
+        db.session.execute(db.text("""
+            INSERT INTO users (
+                badge_number, email, password, status, first_name, last_name,
+                dob, gender, address, city, state, zip_code, phone_number,
+                is_student, is_healthcare_provider, is_multilingual, is_admin,
+                created_at
+            )
+            SELECT n, 'u' || n || '@mail.com', 'password', 'active', 'u' || n,
+                'test', '2000-01-01', 'Prefer not to say', '1 Cherry lane',
+                'New York', 'NY', '11001', '9991234567',
+                false, false, false, false, now()
+            FROM generate_series(1, :users) AS n
+        """), {"users": cls.USERS})
+
+        # One in a thousand experiences is not signed out of
+        db.session.execute(db.text("""
+            INSERT INTO experiences (
+                date, sign_in_time, sign_out_time, department, user_id
+            )
+            SELECT
+                start::date,
+                start,
+                CASE WHEN n % 1000 = 0 THEN NULL ELSE start + interval '4 hours' END,
+                'lab',
+                first_user.id + n % :users
+            FROM generate_series(1, :experiences) AS n,
+                (SELECT min(id) AS id FROM users) AS first_user,
+                LATERAL (
+                    SELECT timestamp '2020-01-01' + n * interval '1 minute' AS start
+                ) AS times
+        """), {"users": cls.USERS, "experiences": cls.EXPERIENCES})
+
+        db.session.commit()
+        db.session.execute(db.text("ANALYZE users"))
+        db.session.execute(db.text("ANALYZE experiences"))
+
+        cls.user_id = db.session.execute(db.text("SELECT min(id) FROM users")).scalar()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.rollback()
+        db.session.execute(db.text("TRUNCATE experiences"))
+        db.session.execute(db.text("TRUNCATE user_hours_summary"))
+        User.query.delete()
+        db.session.commit()
+
+    def explain(self, query):
+        """Get the query plan of a query, as text"""
+
+        sql = query.statement.compile(
+            dialect=db.engine.dialect,
+            compile_kwargs={"literal_binds": True}
+        )
+        plan = db.session.execute(db.text(f"EXPLAIN {sql}")).scalars().all()
+
+        return "\n".join(plan)
+
+    def test_incomplete_experiences_use_open_index(self):
+        plan = self.explain(Experience.query
+            .filter_by(sign_out_time=None)
+            .order_by(Experience.id)
+            .limit(101)
+        )
+
+        self.assertIn("ix_experiences_open", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_incomplete_user_experiences_use_open_index(self):
+        plan = self.explain(Experience.query
+            .filter_by(user_id=self.user_id)
+            .filter_by(sign_out_time=None)
+            .order_by(Experience.id)
+            .limit(101)
+        )
+
+        self.assertIn("ix_experiences_open", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_user_experiences_use_user_index(self):
+        plan = self.explain(Experience.query
+            .filter_by(user_id=self.user_id)
+            .order_by(Experience.id)
+            .limit(101)
+        )
+
+        self.assertIn("ix_experiences_user_id_id", plan)
+        self.assertNotIn("Seq Scan", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_user_experiences_deep_page_use_user_index(self):
+        # A page after a cursor, as paginate() queries it
+        plan = self.explain(Experience.query
+            .filter_by(user_id=self.user_id)
+            .filter(Experience.id > self.EXPERIENCES // 2)
+            .order_by(Experience.id)
+            .limit(101)
+        )
+
+        self.assertIn("ix_experiences_user_id_id", plan)
+        self.assertNotIn("Seq Scan", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_user_experiences_in_range_use_user_index(self):
+        plan = self.explain(Experience.query
+            .filter_by(user_id=self.user_id)
+            .filter(Experience.sign_in_time >= datetime(year=2021, month=1, day=1))
+            .filter(Experience.sign_in_time < datetime(year=2021, month=2, day=1))
+        )
+
+        self.assertIn("ix_experiences_user_id_sign_in_time", plan)
+        self.assertNotIn("Seq Scan", plan)
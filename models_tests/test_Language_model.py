@@ -17,6 +17,9 @@ from app import app
 
 bcrypt = Bcrypt()
 
+# Tests use the database outside of requests
+app.app_context().push()
+
 # Create tables once for all tests.
 # Data deleted & fresh test data set within each test
 db.create_all()
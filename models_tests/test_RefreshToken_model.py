@@ -0,0 +1,118 @@
+"""RefreshToken model tests."""
+
+import os
+from unittest import TestCase
+from flask_bcrypt import Bcrypt
+from datetime import datetime, timedelta
+
+from models.models import db
+from models.User import User
+from models.Experience import Experience
+from models.RefreshToken import RefreshToken
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+bcrypt = Bcrypt()
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+# Create tables once for all tests.
+# Data deleted & fresh test data set within each test
+db.create_all()
+Experience.__table__.drop(db.engine)
+db.drop_all()
+db.create_all()
+
+
+class RefreshTokenModelTestCase(TestCase):
+    def setUp(self):
+        RefreshToken.query.delete()
+        User.query.delete()
+
+        hashed_password = (bcrypt
+            .generate_password_hash("password")
+            .decode('UTF-8')
+        )
+
+        u1 = User(
+            badge_number=1,
+            email='u1@mail.com',
+            password=hashed_password,
+            first_name="u1",
+            last_name="test",
+            dob=datetime(year=2000, month=1, day=1).isoformat(),
+            gender="Prefer not to say",
+            address="1 Cherry lane",
+            city="New York",
+            state="NY",
+            zip_code="11001",
+            phone_number="9991234567",
+            is_student=True,
+            is_healthcare_provider=False,
+            is_multilingual=False
+        )
+
+        db.session.add(u1)
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.expires_at = datetime.utcnow() + timedelta(days=1)
+
+        t1 = RefreshToken.record("t1", u1.id, self.expires_at)
+        db.session.commit()
+
+        self.family = t1.family
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_use(self):
+        used = RefreshToken.use("t1")
+        db.session.commit()
+
+        self.assertEqual(used.jti, "t1")
+        self.assertIsNotNone(used.revoked_at)
+
+    def test_use_unknown(self):
+        self.assertIsNone(RefreshToken.use("unknown"))
+
+    def test_use_expired(self):
+        RefreshToken.record(
+            "expired",
+            self.u1_id,
+            datetime.utcnow() - timedelta(seconds=1)
+        )
+        db.session.commit()
+
+        self.assertIsNone(RefreshToken.use("expired"))
+
+    def test_reuse_revokes_family(self):
+        RefreshToken.use("t1")
+        RefreshToken.record("t2", self.u1_id, self.expires_at, self.family)
+        RefreshToken.record("other", self.u1_id, self.expires_at)
+        db.session.commit()
+
+        self.assertIsNone(RefreshToken.use("t1"))
+        db.session.commit()
+
+        self.assertIsNotNone(RefreshToken.query.get("t2").revoked_at)
+        self.assertIsNone(RefreshToken.query.get("other").revoked_at)
+
+    def test_prune(self):
+        RefreshToken.record(
+            "expired",
+            self.u1_id,
+            datetime.utcnow() - timedelta(seconds=1)
+        )
+        db.session.commit()
+
+        self.assertEqual(RefreshToken.prune(), 1)
+        db.session.commit()
+
+        self.assertIsNone(RefreshToken.query.get("expired"))
+        self.assertIsNotNone(RefreshToken.query.get("t1"))
@@ -0,0 +1,250 @@
+"""UserHoursSummary model tests."""
+
+import os
+import threading
+from unittest import TestCase
+from sqlalchemy.orm import Session
+from flask_bcrypt import Bcrypt
+from datetime import datetime
+
+from models.models import db
+from models.User import User
+from models.Experience import Experience
+from models.UserHoursSummary import UserHoursSummary
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+bcrypt = Bcrypt()
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+# Create tables once for all tests.
+# Data deleted & fresh test data set within each test
+db.create_all()
+Experience.__table__.drop(db.engine)
+db.drop_all()
+db.create_all()
+
+
+class UserHoursSummaryModelTestCase(TestCase):
+    def setUp(self):
+        Experience.query.delete()
+        UserHoursSummary.query.delete()
+        User.query.delete()
+
+        hashed_password = (bcrypt
+            .generate_password_hash("password")
+            .decode('UTF-8')
+        )
+
+        u1 = User(
+            badge_number=1,
+            email='u1@mail.com',
+            password=hashed_password,
+            first_name="u1",
+            last_name="test",
+            dob=datetime(year=2000, month=1, day=1).isoformat(),
+            gender="Prefer not to say",
+            address="1 Cherry lane",
+            city="New York",
+            state="NY",
+            zip_code="11001",
+            phone_number="9991234567",
+            is_student=True,
+            is_healthcare_provider=False,
+            is_multilingual=False
+        )
+
+        db.session.add(u1)
+        db.session.commit()
+
+        e1 = Experience(
+            date=datetime(year=2022, month=1, day=5).isoformat(),
+            sign_in_time=datetime(year=2022, month=1, day=5, hour=8).isoformat(),
+            sign_out_time=datetime(year=2022, month=1, day=5, hour=10).isoformat(),
+            department="lab",
+            user_id=u1.id
+        )
+
+        e2 = Experience(
+            date=datetime(year=2022, month=1, day=8).isoformat(),
+            sign_in_time=datetime(year=2022, month=1, day=8, hour=12).isoformat(),
+            sign_out_time=None,
+            department="pharmacy",
+            user_id=u1.id
+        )
+
+        db.session.add_all([e1, e2])
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.e2_id = e2.id
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+        # Other model tests delete users without first deleting experiences
+        Experience.query.delete()
+        db.session.commit()
+
+############################################################
+# Listener Tests
+
+    def test_summary_on_new_experiences(self):
+        summary = UserHoursSummary.query.get(self.u1_id)
+
+        self.assertEqual(summary.total_hours, 2)
+        self.assertEqual(summary.session_count, 2)
+        self.assertEqual(
+            summary.last_activity,
+            datetime(year=2022, month=1, day=8, hour=12)
+        )
+
+    def test_summary_on_sign_out(self):
+        e2 = Experience.query.get(self.e2_id)
+        e2.sign_out_time = datetime(
+            year=2022, month=1, day=8, hour=13, minute=30
+        ).isoformat()
+        db.session.commit()
+
+        summary = UserHoursSummary.query.get(self.u1_id)
+
+        self.assertEqual(float(summary.total_hours), 3.5)
+        self.assertEqual(summary.session_count, 2)
+        self.assertEqual(
+            summary.last_activity,
+            datetime(year=2022, month=1, day=8, hour=13, minute=30)
+        )
+
+    def test_summary_on_change_after_commit(self):
+        """Changing an experience expired by a commit counts only the change"""
+
+        e3 = Experience(
+            date=datetime(year=2022, month=1, day=9).isoformat(),
+            sign_in_time=datetime(year=2022, month=1, day=9, hour=8).isoformat(),
+            sign_out_time=datetime(year=2022, month=1, day=9, hour=17).isoformat(),
+            department="lab",
+            user_id=self.u1_id
+        )
+        db.session.add(e3)
+        db.session.commit()
+
+        e3.sign_out_time = datetime(year=2022, month=1, day=9, hour=12)
+        db.session.commit()
+
+        summary = UserHoursSummary.query.get(self.u1_id)
+
+        self.assertEqual(summary.total_hours, 6)
+        self.assertEqual(UserHoursSummary.verify(), [])
+
+    def test_summary_on_sign_out_correction(self):
+        """Moving the latest sign out earlier moves last_activity back"""
+
+        e2 = Experience.query.get(self.e2_id)
+        e2.sign_out_time = datetime(year=2022, month=1, day=8, hour=17)
+        db.session.commit()
+
+        e2.sign_out_time = datetime(year=2022, month=1, day=8, hour=13)
+        db.session.commit()
+
+        summary = UserHoursSummary.query.get(self.u1_id)
+
+        self.assertEqual(summary.total_hours, 3)
+        self.assertEqual(
+            summary.last_activity,
+            datetime(year=2022, month=1, day=8, hour=13)
+        )
+        self.assertEqual(UserHoursSummary.verify(), [])
+
+    def test_summary_on_concurrent_sign_outs(self):
+        """Two sign outs of one experience at once count its hours once"""
+
+        engine = db.engine
+        loaded = threading.Barrier(2)
+        errors = []
+
+        def sign_out():
+            try:
+                with Session(engine) as session:
+                    experience = session.get(Experience, self.e2_id)
+                    loaded.wait(timeout=10)
+                    experience.sign_out_time = datetime(
+                        year=2022, month=1, day=8, hour=16
+                    )
+                    session.commit()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=sign_out) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+        db.session.expire_all()
+        summary = UserHoursSummary.query.get(self.u1_id)
+
+        self.assertEqual(summary.total_hours, 6)
+        self.assertEqual(UserHoursSummary.verify(), [])
+
+    def test_summary_on_delete(self):
+        db.session.delete(Experience.query.get(self.e2_id))
+        db.session.commit()
+
+        summary = UserHoursSummary.query.get(self.u1_id)
+
+        self.assertEqual(summary.total_hours, 2)
+        self.assertEqual(summary.session_count, 1)
+        # Recomputed from the remaining experience
+        self.assertEqual(
+            summary.last_activity,
+            datetime(year=2022, month=1, day=5, hour=10)
+        )
+        self.assertEqual(UserHoursSummary.verify(), [])
+
+    def test_summary_on_delete_all(self):
+        for experience in Experience.query.filter_by(user_id=self.u1_id):
+            db.session.delete(experience)
+        db.session.commit()
+
+        self.assertIsNone(UserHoursSummary.query.get(self.u1_id))
+        self.assertEqual(UserHoursSummary.verify(), [])
+
+############################################################
+# Verify and Rebuild Tests
+
+    def test_verify_no_drift(self):
+        self.assertEqual(UserHoursSummary.verify(), [])
+
+    def test_verify_reports_drift(self):
+        summary = UserHoursSummary.query.get(self.u1_id)
+        summary.total_hours = 10
+        db.session.commit()
+
+        drift = UserHoursSummary.verify()
+
+        self.assertEqual(len(drift), 1)
+        self.assertEqual(drift[0]["user_id"], self.u1_id)
+        self.assertEqual(drift[0]["stored"][0], 10)
+        self.assertEqual(drift[0]["computed"][0], 2)
+
+    def test_rebuild(self):
+        UserHoursSummary.query.delete()
+        db.session.commit()
+
+        self.assertEqual(len(UserHoursSummary.verify()), 1)
+
+        UserHoursSummary.rebuild()
+        db.session.commit()
+
+        self.assertEqual(UserHoursSummary.verify(), [])
+        self.assertEqual(UserHoursSummary.query.get(self.u1_id).total_hours, 2)
@@ -7,8 +7,9 @@ from flask_bcrypt import Bcrypt
 from datetime import datetime
 
 from models.models import db
-from models.User import User
+from models.User import User, UserIdentity, identity_cache
 from models.Experience import Experience
+from hashing import password_hasher, get_rounds
 
 # To use a different database for tests, set env variable.
 # Must be before app is imported
@@ -18,6 +19,9 @@ from app import app
 
 bcrypt = Bcrypt()
 
+# Tests use the database outside of requests
+app.app_context().push()
+
 # Create tables once for all tests.
 # Data deleted & fresh test data set within each test
 db.create_all()
@@ -132,6 +136,11 @@ class UserModelTestCase(TestCase):
             )
             db.session.commit()
 
+    def test_serialize_keys(self):
+        u1 = User.query.get(self.u1_id)
+
+        self.assertEqual(tuple(u1.serialize()), User.SERIALIZE_KEYS)
+
 ################################################################
 # Authentication Tests
 
@@ -146,3 +155,82 @@ class UserModelTestCase(TestCase):
 
     def test_wrong_password(self):
         self.assertFalse(User.authenticate("u1@mail.com", "bad-password"))
+
+    def test_authentication_rehashes_other_cost(self):
+        rounds = password_hasher.rounds
+        password_hasher.rounds = 4
+        try:
+            self.assertTrue(User.authenticate("u1@mail.com", "password"))
+
+            db.session.expire_all()
+            u1 = User.query.get(self.u1_id)
+            self.assertEqual(get_rounds(u1.password), 4)
+            self.assertEqual(User.authenticate("u1@mail.com", "password"), u1)
+        finally:
+            password_hasher.rounds = rounds
+
+    def test_wrong_password_not_rehashed(self):
+        rounds = password_hasher.rounds
+        password_hasher.rounds = 4
+        try:
+            self.assertFalse(User.authenticate("u1@mail.com", "bad-password"))
+
+            db.session.expire_all()
+            u1 = User.query.get(self.u1_id)
+            self.assertEqual(get_rounds(u1.password), 12)
+        finally:
+            password_hasher.rounds = rounds
+
+################################################################
+# Identity Tests
+
+    def test_get_identity(self):
+        identity = User.get_identity(self.u1_id)
+
+        self.assertEqual(identity, UserIdentity(self.u1_id, False, "new", 0))
+        self.assertIsNone(User.get_identity(0))
+
+    def test_get_identity_cached(self):
+        User.get_identity(self.u1_id)
+        stats = identity_cache.stats()
+
+        User.get_identity(self.u1_id)
+
+        self.assertEqual(identity_cache.stats()["hits"], stats["hits"] + 1)
+        self.assertEqual(identity_cache.stats()["misses"], stats["misses"])
+
+    def test_get_identity_invalidated_on_update(self):
+        self.assertFalse(User.get_identity(self.u1_id).is_admin)
+
+        u1 = User.query.get(self.u1_id)
+        u1.is_admin = True
+        db.session.commit()
+
+        self.assertTrue(User.get_identity(self.u1_id).is_admin)
+
+    def test_token_version_bumped_on_privilege_change(self):
+        u1 = User.query.get(self.u1_id)
+        u1.first_name = "renamed"
+        db.session.commit()
+
+        self.assertEqual(u1.token_version, 0)
+
+        u1.is_admin = True
+        db.session.commit()
+
+        self.assertEqual(u1.token_version, 1)
+
+        u1.status = "active"
+        db.session.commit()
+
+        self.assertEqual(User.get_identity(self.u1_id).token_version, 2)
+
+    def test_identity_claims_round_trip(self):
+        u1 = User.query.get(self.u1_id)
+        claims = UserIdentity.get_claims(u1)
+        claims["sub"] = u1.id
+
+        self.assertEqual(
+            UserIdentity.from_claims(claims),
+            User.get_identity(self.u1_id)
+        )
@@ -0,0 +1,29 @@
+"""TTLCache tests."""
+
+from unittest import TestCase
+from cache import TTLCache
+
+
+class TTLCacheTestCase(TestCase):
+    def test_cache_expires(self):
+        now = [0]
+        cache = TTLCache(maxsize=10, ttl=30, timer=lambda: now[0])
+        cache.set(1, "one")
+
+        now[0] = 29
+        self.assertEqual(cache.get(1), "one")
+
+        now[0] = 30
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 0})
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=30)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.get(1)
+        cache.set(3, "three")
+
+        self.assertEqual(cache.get(1), "one")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), "three")
@@ -0,0 +1,64 @@
+"""Engine options and pool instrumentation tests."""
+
+import os
+from unittest import TestCase
+
+from models.models import db
+from engine import create_engine, dispose_pools, get_engine_options
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+
+class EngineTestCase(TestCase):
+    def test_engine_options(self):
+        """Engine options come from DB_* variables, with defaults"""
+
+        url = "postgresql+psycopg://localhost/db"
+
+        options = get_engine_options(url, environ={})
+        self.assertEqual(options["pool_size"], 5)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertNotIn("connect_args", options)
+
+        options = get_engine_options(url, environ={
+            "DB_POOL_SIZE": "20",
+            "DB_POOL_PRE_PING": "false",
+            "DB_PGBOUNCER": "true",
+        })
+        self.assertEqual(options["pool_size"], 20)
+        self.assertFalse(options["pool_pre_ping"])
+        self.assertEqual(
+            options["connect_args"],
+            {"prepare_threshold": None}
+        )
+
+        # psycopg2 never prepares statements, so needs no change
+        options = get_engine_options(
+            "postgresql://localhost/db",
+            environ={"DB_PGBOUNCER": "true"}
+        )
+        self.assertNotIn("connect_args", options)
+
+    def test_dispose_pools(self):
+        """After a fork, pools are replaced without closing connections"""
+
+        engine = create_engine(os.environ["DATABASE_URL"])
+        connection = engine.connect()
+        pool = engine.pool
+        app_pool = db.engine.pool
+
+        dispose_pools([engine])
+
+        self.assertIsNot(engine.pool, pool)
+        self.assertIs(db.engine.pool, app_pool)
+        # Still usable by the process that opened it
+        self.assertEqual(connection.execute(db.text("SELECT 1")).scalar(), 1)
+
+        connection.close()
+        engine.dispose()
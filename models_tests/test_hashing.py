@@ -0,0 +1,61 @@
+"""PasswordHasher tests."""
+
+import threading
+from unittest import TestCase
+from hashing import PasswordHasher, HashingBusy, get_rounds, calibrate
+
+
+class PasswordHasherTestCase(TestCase):
+    def test_hasher_round_trip(self):
+        hasher = PasswordHasher(max_workers=1)
+        pw_hash = hasher.generate_password_hash("password")
+
+        self.assertTrue(hasher.check_password_hash(pw_hash, "password"))
+        self.assertFalse(hasher.check_password_hash(pw_hash, "wrong"))
+
+    def test_hasher_busy_when_saturated(self):
+        hasher = PasswordHasher(max_workers=1, queue_timeout=0.01, retry_after=5)
+        started = threading.Event()
+        release = threading.Event()
+
+        def hold_slot():
+            started.set()
+            release.wait()
+
+        holder = threading.Thread(target=hasher._run, args=(hold_slot,))
+        holder.start()
+        started.wait()
+
+        try:
+            with self.assertRaises(HashingBusy) as cm:
+                hasher.generate_password_hash("password")
+            self.assertEqual(cm.exception.retry_after, 5)
+        finally:
+            release.set()
+            holder.join()
+
+        # Slot is released once the held job finishes
+        self.assertTrue(hasher.check_password_hash(
+            hasher.generate_password_hash("password"),
+            "password"
+        ))
+
+    def test_hasher_uses_target_rounds(self):
+        hasher = PasswordHasher(max_workers=1, rounds=5)
+        pw_hash = hasher.generate_password_hash("password")
+
+        self.assertEqual(get_rounds(pw_hash), 5)
+        self.assertFalse(hasher.needs_rehash(pw_hash))
+        self.assertTrue(PasswordHasher(rounds=6).needs_rehash(pw_hash))
+        self.assertIsNone(get_rounds("not a hash"))
+
+    def test_calibrate_stops_over_budget(self):
+        timings, recommended = calibrate(budget=0, samples=1, max_rounds=6)
+
+        self.assertEqual([rounds for rounds, _ in timings], [4])
+        self.assertIsNone(recommended)
+
+        timings, recommended = calibrate(budget=60, samples=1, max_rounds=5)
+
+        self.assertEqual([rounds for rounds, _ in timings], [4, 5])
+        self.assertEqual(recommended, 5)
@@ -0,0 +1,49 @@
+"""Keyset (cursor) pagination for list routes"""
+
+import base64
+import binascii
+import json
+
+def encode_cursor(key):
+    """Encode the key of the last row of a page as an opaque cursor"""
+
+    payload = json.dumps([key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Get the key encoded in a cursor. Raises ValueError if invalid."""
+
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        [key] = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(key, int):
+        raise ValueError("Invalid cursor")
+
+    return key
+
+def paginate(query, key, form, get_key=lambda row: row.id):
+    """Get a page of rows of query ordered by an indexed key column.
+
+    Rows start after form.cursor (if given) and number at most form.limit,
+    so every page costs an index range scan no matter how deep it is.
+    get_key gets the key value of a row.
+
+    Returns (rows, next_cursor), where next_cursor is None on the last page.
+    """
+
+    limit = form.limit.data
+
+    if form.cursor.data:
+        query = query.filter(key > decode_cursor(form.cursor.data))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.order_by(key).limit(limit + 1).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(get_key(rows[-1]))
+
+    return rows, None
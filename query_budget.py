@@ -0,0 +1,111 @@
+"""Per-view budgets for the number of SQL statements executed"""
+
+import json
+import re
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Literals and bound parameters, replaced to fingerprint a statement
+LITERALS = re.compile(r"%\(\w+\)s|%s|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised, when enforcing, if a view executes more statements than budgeted"""
+
+
+def fingerprint(statement):
+    """
+    Normalize a statement so repeats of it with other values compare equal:
+    literals and parameters become "?", IN lists "IN (?)", whitespace one space.
+    """
+
+    statement = LITERALS.sub("?", statement)
+    statement = IN_LISTS.sub("IN (?)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context,
+                      executemany):
+    if not has_request_context():
+        return
+
+    for statements in g.get("statement_logs", ()):
+        statements.append(statement)
+
+
+@contextmanager
+def count_statements():
+    """
+    Collect the SQL statements executed within the block on any engine.
+    Yields the list they are appended to.
+    """
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def query_budget(budget):
+    """
+    Limit a view to `budget` SQL statements, counted while it runs.
+    Statements run by a streamed response body after the view returns
+    are not counted.
+
+    Over budget, raises QueryBudgetExceeded if QUERY_BUDGET_ENFORCE is set
+    (by default, when testing), otherwise logs a warning with the
+    statements' fingerprints.
+    """
+
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            statements = []
+            logs = g.setdefault("statement_logs", [])
+            logs.append(statements)
+
+            try:
+                response = current_app.ensure_sync(fn)(*args, **kwargs)
+            finally:
+                logs.remove(statements)
+
+            if len(statements) > budget:
+                _over_budget(fn, budget, statements)
+
+            return response
+
+        decorator.query_budget = budget
+        return decorator
+
+    return wrapper
+
+
+def _over_budget(fn, budget, statements):
+    """Raise or warn for a view that executed too many statements"""
+
+    details = {
+        "event": "query_budget_exceeded",
+        "endpoint": request.endpoint,
+        "view": fn.__qualname__,
+        "budget": budget,
+        "statements": len(statements),
+        "fingerprints": dict(Counter(map(fingerprint, statements))),
+    }
+
+    if current_app.config.get("QUERY_BUDGET_ENFORCE", current_app.testing):
+        raise QueryBudgetExceeded(json.dumps(details, indent=2))
+
+    current_app.logger.warning(json.dumps(details))
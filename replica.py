@@ -0,0 +1,221 @@
+"""Routing of read-only views to a read replica, falling back to the primary"""
+
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+from werkzeug.local import LocalProxy
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+from cache import TTLCache
+from engine import create_engine
+
+# Seconds the replica is behind the primary; 0 when it has replayed all the
+# WAL it received, so an idle primary doesn't read as lag. 0 on a primary.
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+    )
+END
+"""
+
+# Cookie set by successful writes: reads go to the primary until it expires
+PIN_COOKIE = "read_primary_until"
+
+# Tables no replica_reads view reads, so writing them pins nothing: logins
+# and token refreshes don't send the client's next reads to the primary
+UNPINNED_TABLES = {"refresh_tokens"}
+
+
+class ReadReplica:
+    """A replica engine, and whether it is healthy and caught up enough.
+
+    Health and lag are checked at most every check_interval seconds, per
+    worker. A disconnect on the replica marks it down until the next check.
+    """
+
+    def __init__(self, engine=None, max_lag=5, check_interval=5,
+                 pin_seconds=10, timer=time.monotonic):
+        self.timer = timer
+        self.available = False
+        self.checked_at = None
+        # Users who wrote recently, by id: their reads go to the primary
+        self.recent_writers = TTLCache()
+        self._lock = threading.Lock()
+        # One listener object, so it is added to each engine only once
+        self._on_error = self._handle_error
+        self.configure(engine, max_lag, check_interval, pin_seconds)
+
+    def configure(self, engine, max_lag, check_interval, pin_seconds):
+        """Change the engine (None for no replica) and thresholds"""
+
+        with self._lock:
+            self.engine = engine
+            self.max_lag = max_lag
+            self.check_interval = check_interval
+            self.pin_seconds = pin_seconds
+            self.checked_at = None
+
+        self.recent_writers.configure(maxsize=4096, ttl=pin_seconds)
+
+        if engine is not None and not event.contains(
+                engine, "handle_error", self._on_error):
+            event.listen(engine, "handle_error", self._on_error)
+
+    def init_app(self, app):
+        """
+        Create the engine from REPLICA_DATABASE_URL, if set, and pin the
+        reads that follow a request's writes to the primary. Becomes the
+        app's read_replica.
+        """
+
+        url = app.config.get("REPLICA_DATABASE_URL")
+        self.configure(
+            create_engine(url) if url else None,
+            max_lag=app.config.get("REPLICA_MAX_LAG", 5),
+            check_interval=app.config.get("REPLICA_CHECK_INTERVAL", 5),
+            pin_seconds=app.config.get("REPLICA_PIN_SECONDS", 10),
+        )
+
+        app.extensions["read_replica"] = self
+        if self.engine is not None:
+            app.extensions.setdefault("engines", {})["replica"] = self.engine
+
+        app.after_request(self._pin_after_write)
+        app.teardown_request(self._end_request)
+
+    def get_lag(self):
+        """Seconds the replica is behind, or None if it can't be reached"""
+
+        try:
+            with self.engine.connect() as connection:
+                return float(connection.execute(text(LAG_SQL)).scalar())
+        except SQLAlchemyError:
+            current_app.logger.warning(
+                "Read replica unreachable", exc_info=True
+            )
+            return None
+
+    def is_available(self):
+        """Whether the replica is reachable and within max_lag seconds"""
+
+        if self.engine is None:
+            return False
+
+        with self._lock:
+            now = self.timer()
+            if (self.checked_at is not None
+                    and now - self.checked_at < self.check_interval):
+                return self.available
+            # Other threads use the last result while this one checks
+            self.checked_at = now
+
+        lag = self.get_lag()
+        available = lag is not None and lag <= self.max_lag
+
+        if lag is not None and not available:
+            current_app.logger.warning(
+                "Read replica %.1fs behind, reading from primary", lag
+            )
+
+        with self._lock:
+            self.available = available
+        return available
+
+    def is_pinned(self):
+        """Whether this request's client wrote recently, in another request"""
+
+        try:
+            if float(request.cookies.get(PIN_COOKIE, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+
+        user_id = get_jwt().get("sub") if g.get("jwt_verified") else None
+        return (user_id is not None
+                and self.recent_writers.get(user_id) is not None)
+
+    def _pin_after_write(self, response):
+        if (self.engine is None or not g.pop("wrote_to_primary", False)
+                or response.status_code >= 400):
+            return response
+
+        response.set_cookie(
+            PIN_COOKIE,
+            str(int(time.time() + self.pin_seconds) + 1),
+            max_age=int(self.pin_seconds) + 1,
+            httponly=True,
+            samesite="Lax"
+        )
+
+        user_id = get_jwt().get("sub") if g.get("jwt_verified") else None
+        if user_id is not None:
+            self.recent_writers.set(user_id, True)
+
+        return response
+
+    def _end_request(self, error=None):
+        # g outlives the request while an app context is pushed globally
+        g.pop("read_from_replica", None)
+        g.pop("wrote_to_primary", None)
+
+    def _handle_error(self, context):
+        if context.is_disconnect:
+            with self._lock:
+                self.available = False
+                self.checked_at = self.timer()
+
+
+# The current app's ReadReplica
+read_replica = LocalProxy(lambda: current_app.extensions["read_replica"])
+
+
+def replica_reads(fn):
+    """
+    Let a read-only view read from the replica, unless the replica is down or
+    lagging, or the client wrote recently. Writes made while it runs, and
+    every statement after them, go to the primary.
+    """
+
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        g.read_from_replica = (
+            read_replica.engine is not None
+            and not read_replica.is_pinned()
+            and read_replica.is_available()
+        )
+        return current_app.ensure_sync(fn)(*args, **kwargs)
+
+    return decorator
+
+
+def _written_table(mapper, clause):
+    """Name of the table a flush or DML statement writes, if known"""
+
+    if isinstance(clause, UpdateBase):
+        return getattr(clause.table, "name", None)
+    mapper = inspect(mapper, raiseerr=False)
+    return getattr(getattr(mapper, "local_table", None), "name", None)
+
+
+class RoutingSession(Session):
+    """Session sending the reads of replica_reads views to the replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                if _written_table(mapper, clause) not in UNPINNED_TABLES:
+                    g.wrote_to_primary = True
+                g.read_from_replica = False
+            elif g.get("read_from_replica"):
+                return read_replica.engine
+
+        return super().get_bind(
+            mapper=mapper, clause=clause, bind=bind, **kwargs
+        )
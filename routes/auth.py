@@ -1,10 +1,20 @@
 from flask import Blueprint, jsonify, request
 from models.models import db
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import (
+    create_access_token,
+    create_refresh_token,
+    decode_token,
+    get_jwt,
+    verify_jwt_in_request
+)
 from models.User import User
+from models.RefreshToken import RefreshToken
 from forms.LoginForm import LoginForm
 from forms.SignUpForm import SignUpForm
+from jwt_auth import public
+from query_budget import query_budget
 import os
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,7 +26,51 @@ auth = Blueprint(
     template_folder="../templates"
 )
 
+def create_tokens(user, family=None):
+    """
+    Create an access token and a refresh token for user, recording the
+    refresh token (in a new family unless given one). Caller must commit.
+    Returns { "token": "...", "refresh_token": "..." }
+    """
+
+    # Note: payload is stored on "sub" of token
+    refresh_token = create_refresh_token(identity=user)
+    claims = decode_token(refresh_token)
+
+    RefreshToken.record(
+        jti=claims["jti"],
+        user_id=user.id,
+        expires_at=datetime.utcfromtimestamp(claims["exp"]),
+        family=family
+    )
+
+    return {
+        "token": create_access_token(identity=user),
+        "refresh_token": refresh_token
+    }
+
+def use_refresh_token():
+    """
+    Verify the refresh token in the request's JSON and use it up.
+    Returns the used RefreshToken, or None if the token is invalid, expired,
+    unknown or already used.
+    """
+
+    try:
+        verify_jwt_in_request(refresh=True, locations=["json"])
+    except Exception:
+        return None
+
+    used = RefreshToken.use(get_jwt()["jti"])
+
+    # Saves revocation of the family of a reused token, too
+    db.session.commit()
+
+    return used
+
 @auth.post("/signup")
+@query_budget(2)
+@public
 def signup():
     """
     Handle user signup.
@@ -37,7 +91,10 @@ def signup():
         "is_healthcare_provider":"false",
         "is_multilingual":"false"
     }
-    Returns JSON: { "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf" }
+    Returns JSON: {
+        "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf",
+        "refresh_token": "eyjhbgcio.eyjmcmvzacig.ywxzzs"
+    }
     """
 
     received = request.json
@@ -64,11 +121,11 @@ def signup():
         )
 
         try:
-            db.session.commit()
+            db.session.flush()
 
-            # Note: payload is stored on "sub" of token
-            token = create_access_token(identity=user)
-            return jsonify(token=token)
+            tokens = create_tokens(user)
+            db.session.commit()
+            return jsonify(**tokens)
 
         except Exception:
             return jsonify(
@@ -78,6 +135,8 @@ def signup():
     return jsonify(errors=form.errors), 400
 
 @auth.post("/admin-signup")
+@query_budget(2)
+@public
 def admin_signup():
     """
     Handle Admin Signup.
@@ -99,7 +158,10 @@ def admin_signup():
         "is_healthcare_provider":"false",
         "is_multilingual":"false"
     }
-    Returns JSON: { "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf" }
+    Returns JSON: {
+        "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf",
+        "refresh_token": "eyjhbgcio.eyjmcmvzacig.ywxzzs"
+    }
     """
 
     received = request.json
@@ -130,11 +192,11 @@ def admin_signup():
         )
 
         try:
-            db.session.commit()
+            db.session.flush()
 
-            # Note: payload is stored on "sub" of token
-            token = create_access_token(identity=user)
-            return jsonify(token=token)
+            tokens = create_tokens(user)
+            db.session.commit()
+            return jsonify(**tokens)
 
         except Exception:
             return jsonify(
@@ -146,13 +208,17 @@ def admin_signup():
 
 
 @auth.post("/login")
+@query_budget(3)
+@public
 def login():
     """
     Handles user login.
     Expecting JSON: { "email": "mail@mail.com", "password": "mypassword" }
     Returns JSON:
-    - If provided valid data:
-    { "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf" }
+    - If provided valid data: {
+        "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf",
+        "refresh_token": "eyjhbgcio.eyjmcmvzacig.ywxzzs"
+    }
     - If provided invalid data:
     { "errors": "Invalid credentials" }
     """
@@ -168,8 +234,67 @@ def login():
         )
 
         if user:
-            # Note: payload is stored on "sub" of token
-            token = create_access_token(identity=user)
-            return jsonify(token=token)
+            tokens = create_tokens(user)
+            db.session.commit()
+            return jsonify(**tokens)
+
+    return jsonify(errors="Invalid credentials"), 400
+
+
+@auth.post("/refresh")
+@query_budget(5)
+@public
+def refresh():
+    """
+    Handles exchanging a refresh token for new tokens, without a password.
+    Each refresh token can be used once; reusing one revokes the tokens
+    issued from it, logging that client out.
+    Expecting JSON: { "refresh_token": "eyjhbgcio.eyjmcmvzacig.ywxzzs" }
+    Returns JSON:
+    - If provided a valid refresh token: {
+        "token": "dleoidlksd.aslkfjoiweflkfj.aldsjfoweifsldf",
+        "refresh_token": "eyjhbgcio.eyjmcmvzacig.ywxzzs"
+    }
+    - If provided an invalid, expired or used refresh token:
+    { "errors": "Invalid token" }
+    """
+
+    used = use_refresh_token()
+
+    if used is None:
+        return jsonify(errors="Invalid token"), 401
+
+    # Fresh claims, in case admin rights or status changed
+    user = db.session.get(User, used.user_id)
+
+    # Deleted since the token was used
+    if user is None:
+        return jsonify(errors="Invalid token"), 401
+
+    tokens = create_tokens(user, family=used.family)
+    db.session.commit()
+    return jsonify(**tokens)
+
+
+@auth.post("/logout")
+@query_budget(4)
+@public
+def logout():
+    """
+    Handles logout: revokes the refresh token and all tokens issued from it.
+    Expecting JSON: { "refresh_token": "eyjhbgcio.eyjmcmvzacig.ywxzzs" }
+    Returns JSON:
+    - If provided a valid refresh token:
+    { "message": "Logged out" }
+    - If provided an invalid, expired or used refresh token:
+    { "errors": "Invalid token" }
+    """
+
+    used = use_refresh_token()
+
+    if used is None:
+        return jsonify(errors="Invalid token"), 401
 
-    return jsonify(errors="Invalid credentials"), 400
\ No newline at end of file
+    RefreshToken.revoke_family(used.family)
+    db.session.commit()
+    return jsonify(message="Logged out")
@@ -1,9 +1,19 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, current_user
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import current_user
 from models.User import User
 from models.Experience import Experience
+# Listeners on Experience keep each user's hours summary up to date
+from models.UserHoursSummary import UserHoursSummary  # noqa: F401
 from forms.CreateExperienceForm import CreateExperienceForm
 from forms.UpdateExperienceForm import UpdateExperienceForm
+from forms.PaginationForm import PaginationForm
+from forms.ExportForm import ExportForm
+from forms.FieldsForm import FieldsForm
+from pagination import paginate
+from streaming import wants_ndjson, stream_ndjson, stream_csv
+from jwt_auth import jwt_required, require_admin
+from query_budget import query_budget
+from replica import replica_reads
 from models.models import db
 
 experiences = Blueprint(
@@ -14,42 +24,119 @@ experiences = Blueprint(
 )
 
 @experiences.get('')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+@replica_reads
+@query_budget(1)
+@require_admin
 def get_all_experiences():
     """
     Gets all experiences for all users. Optional query parameter of 'incomplete'
     will return all experiences whose sign_out_time is None.
     Primary use case for 'incomplete' is to check any experiences that have not "signed out".
+    Paginated by id: optional query parameters 'limit' (default 100, max 1000)
+    and 'cursor' (next_cursor of the previous page).
+    With header "Accept: application/x-ndjson", streams every experience
+    instead, one JSON object per line, without pagination.
+    Optional query parameter 'fields': comma separated fields to return
+    (id is always returned), e.g. 'fields=sign_in_time,sign_out_time'.
     Authorization: must be admin requesting with valid token.
     Returns JSON {
-        "user_experiences": [{
+        "experiences": [{
             "id": 1,
             "date": "2023-04-06-08:35:12:23",
             "sign_in_time": "2023-04-06-08:35:12:23",
             "sign_out_time": "2023-04-06-08:35:12:23",
             "department": "lab",
             "user_id": 3
-        } ... ]
+        } ... ],
+        "limit": 100,
+        "next_cursor": "WzEwMF0" (null on the last page)
     }
     If unauthorized request, returns JSON { "errors": "Unauthorized" }
     """
 
-    if (current_user.is_admin):
-        if 'incomplete' in request.args:
-            experiences = Experience.query.filter_by(
-                sign_out_time=None
-            ).all()
-        else:
-            experiences = Experience.query.all()
+    fields_form = FieldsForm(
+        formdata=request.args,
+        allowed=Experience.SERIALIZE_KEYS
+    )
 
-        serialized_experiences = [e.serialize() for e in experiences]
+    if not fields_form.validate():
+        return jsonify(errors=fields_form.errors), 400
 
-        return jsonify(experiences=serialized_experiences)
+    keys = fields_form.get_keys()
+    query = db.session.query(*Experience.get_row_columns(keys))
+    if 'incomplete' in request.args:
+        query = query.filter(Experience.sign_out_time.is_(None))
 
-    return jsonify(errors="Unauthorized"), 401
+    if wants_ndjson():
+        return stream_ndjson(
+            query.order_by(Experience.id),
+            lambda row: Experience.serialize_row(row, keys)
+        )
+
+    form = PaginationForm(formdata=request.args)
+
+    if not form.validate():
+        return jsonify(errors=form.errors), 400
+
+    rows, next_cursor = paginate(query, Experience.id, form)
+
+    serialized_experiences = [
+        Experience.serialize_row(row, keys) for row in rows
+    ]
+
+    return jsonify(
+        experiences=serialized_experiences,
+        limit=form.limit.data,
+        next_cursor=next_cursor
+    )
+
+@experiences.get('/export.csv')
+@replica_reads
+@query_budget(0)
+@require_admin
+def export_experiences():
+    """
+    Exports all experiences for all users as CSV, streamed by Postgres COPY.
+    Optional query parameters 'start' and 'end' (inclusive dates, YYYY-MM-DD)
+    filter on experience date, and 'department' on department.
+    Authorization: must be admin requesting with valid token.
+    Returns CSV with header:
+        id,user_id,badge_number,first_name,last_name,date,sign_in_time,
+        sign_out_time,department,hours
+    If unauthorized request, returns JSON { "errors": "Unauthorized" }
+    """
+
+    form = ExportForm(formdata=request.args)
+
+    if not form.validate():
+        return jsonify(errors=form.errors), 400
+
+    statement = (db.select(
+            Experience.id,
+            Experience.user_id,
+            User.badge_number,
+            User.first_name,
+            User.last_name,
+            Experience.date,
+            Experience.sign_in_time,
+            Experience.sign_out_time,
+            Experience.department,
+            Experience.get_duration_expression().label("hours"),
+        )
+        .join(User, Experience.user_id == User.id)
+        .where(*Experience.get_filters(
+            start=form.start.data,
+            end=form.end.data,
+            department=form.department.data
+        ))
+        .order_by(Experience.id)
+    )
+
+    return stream_csv(statement, "experiences.csv")
 
 @experiences.post('')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+@query_budget(4)
+@jwt_required()
 def create_user_experience():
     """
     Create a new experience. Use case for "signing-in" to an experience.
@@ -88,9 +175,9 @@ def create_user_experience():
                 return jsonify(errors="User not found"), 404
 
             experience = Experience(
-                date=received.get('date'),
-                sign_in_time=received.get('sign_in_time'),
-                sign_out_time=received.get('sign_out_time'),
+                date=form.date.data,
+                sign_in_time=form.sign_in_time.data,
+                sign_out_time=form.sign_out_time.data,
                 department=received.get('department'),
                 user_id=user_id
             )
@@ -102,7 +189,8 @@ def create_user_experience():
                 return jsonify(user_experience=serialized)
 
             except Exception:
-                print("EXCEPTION OCCURRED UPON DB COMMIT, experience = ", experience)
+                current_app.logger.exception(
+                    "Exception upon DB commit, experience = %s", experience)
                 return jsonify(errors="Database Error")
 
         return jsonify(errors=form.errors), 400
@@ -110,7 +198,9 @@ def create_user_experience():
     return jsonify(errors="Unauthorized"), 401
 
 @experiences.patch('/<int:exp_id>')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+# Includes locking the row and updating the user's hours summary
+@query_budget(6)
+@jwt_required()
 def update_experience(exp_id):
     """
     Update a user's experience sign out time and/or department.
@@ -145,7 +235,7 @@ def update_experience(exp_id):
         if (experience):
             if (current_user.is_admin or experience.user_id == current_user.id):
 
-                experience.sign_out_time = received.get('sign_out_time')
+                experience.sign_out_time = form.sign_out_time.data
                 if (received.get('department')):
                     experience.department = received.get('department')
 
@@ -153,7 +243,8 @@ def update_experience(exp_id):
                     db.session.commit()
 
                 except Exception:
-                    print("EXCEPTION OCCURRED UPON DB COMMIT, experience = ", experience)
+                    current_app.logger.exception(
+                        "Exception upon DB commit, experience = %s", experience)
                     return jsonify(errors="Database Error")
 
                 serialized = experience.serialize()
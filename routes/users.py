@@ -1,8 +1,19 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, current_user
+import hashlib
+import json
+from flask import Blueprint, Response, jsonify, request
 from models.User import User
 from models.Experience import Experience
 from models.Language import Language
+from models.UserHoursSummary import UserHoursSummary
+from forms.PaginationForm import PaginationForm
+from forms.ExportForm import ExportForm
+from forms.FieldsForm import FieldsForm
+from models.models import db
+from pagination import paginate
+from streaming import wants_ndjson, stream_ndjson, stream_csv
+from jwt_auth import public, require_admin, require_self_or_admin
+from query_budget import query_budget
+from replica import replica_reads
 
 users = Blueprint(
     "users",
@@ -11,11 +22,57 @@ users = Blueprint(
     template_folder="../templates"
 )
 
+# Columns of each user in the list of all users, by key. Only these (or the
+# requested ones) are selected, as rows rather than User instances.
+USER_ROW_COLUMNS = {
+    "id": User.id,
+    "badge_number": User.badge_number,
+    "email": User.email,
+    "experience_hours": UserHoursSummary.total_hours,
+    "first_name": User.first_name,
+    "is_admin": User.is_admin,
+    "is_student": User.is_student,
+    "is_healthcare_provider": User.is_healthcare_provider,
+    "is_multilingual": User.is_multilingual,
+    "last_name": User.last_name,
+    "status": User.status,
+}
+USER_ROW_KEYS = tuple(USER_ROW_COLUMNS)
+
+def serialize_user_row(row, keys=USER_ROW_KEYS):
+    """Serialize a row of USER_ROW_COLUMNS `keys` for the list of all users"""
+
+    user = dict(zip(keys, row))
+
+    # Keep 0 (not 0.0) for users without any hours, as before
+    if "experience_hours" in user:
+        hours = user["experience_hours"]
+        user["experience_hours"] = float(hours) if hours else 0
+
+    return user
+
+# Options are fixed while running, so the response body is encoded once
+RACE_ETHNICITY_OPTIONS_JSON = json.dumps(
+    {
+        "race_ethnicity_options": {
+            "race": User.get_race_options(),
+            "ethnicity": User.get_ethnicity_options(),
+            "ethnic_background": User.get_ethnic_background_options()
+        }
+    },
+    separators=(",", ":")
+).encode()
+RACE_ETHNICITY_OPTIONS_ETAG = hashlib.sha256(RACE_ETHNICITY_OPTIONS_JSON).hexdigest()
+RACE_ETHNICITY_OPTIONS_MAX_AGE = 24 * 60 * 60
+
 @users.get('/race-ethnicity-options')
-@jwt_required(optional=True, locations=['headers', 'cookies'])
+@query_budget(0)
+@public
 def get_race_ethnicity_options():
     """
     Gets all Database options for a user's race, ethnicity, and ethnic background.
+    Cacheable for a day; with header "If-None-Match" of the ETag from a
+    previous response, returns status 304 and no body if unchanged.
     Returns JSON {
         race_ethnicity_options: {
             "race": [...],
@@ -23,21 +80,28 @@ def get_race_ethnicity_options():
             "ethnic_background": [...]
         }
     """
-    
-    race_ethnicity_options = {
-        "race": User.get_race_options(),
-        "ethnicity": User.get_ethnicity_options(),
-        "ethnic_background": User.get_ethnic_background_options()
-    }
-    
-    return jsonify(race_ethnicity_options=race_ethnicity_options)
+
+    response = Response(RACE_ETHNICITY_OPTIONS_JSON, mimetype="application/json")
+    response.set_etag(RACE_ETHNICITY_OPTIONS_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = RACE_ETHNICITY_OPTIONS_MAX_AGE
+
+    return response.make_conditional(request)
     
 
 @users.get('')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+@replica_reads
+@query_budget(1)
+@require_admin
 def get_users():
     """
     Gets all users.
+    Paginated by id: optional query parameters 'limit' (default 100, max 1000)
+    and 'cursor' (next_cursor of the previous page).
+    With header "Accept: application/x-ndjson", streams every user instead,
+    one JSON object per line, without pagination.
+    Optional query parameter 'fields': comma separated fields to return
+    (id is always returned), e.g. 'fields=first_name,last_name'.
     Authorization: must be admin requesting with valid token.
     Returns JSON {
         users: [{
@@ -52,42 +116,99 @@ def get_users():
             "is_healthcare_provider": False,
             "is_multilingual": False,
             "status": "new"
-        } ... ]
+        } ... ],
+        limit: 100,
+        next_cursor: "WzEwMF0" (null on the last page)
     }
     If unauthorized request, returns JSON { "errors": "Unauthorized" }
     """
 
-    if (current_user.is_admin):
-        user_instances = User.query.all()
-        users = []
-        for u in user_instances:
-            user_experiences = Experience.query.filter_by(user_id=u.id).all()
-            experience_hours = 0
-            for exp in user_experiences:
-                experience_hours += exp.get_duration()
-
-            users.append({
-                "id": u.id,
-                "badge_number": u.badge_number,
-                "email": u.email,
-                "experience_hours": experience_hours,
-                "first_name": u.first_name,
-                "is_admin": u.is_admin,
-                "is_student": u.is_student,
-                "is_healthcare_provider": u.is_healthcare_provider,
-                "is_multilingual": u.is_multilingual,
-                "last_name": u.last_name,
-                "status": u.status,
-            })
-        return jsonify(users=users)
-
-    return jsonify(errors="Unauthorized"), 401
+    fields_form = FieldsForm(formdata=request.args, allowed=USER_ROW_KEYS)
+
+    if not fields_form.validate():
+        return jsonify(errors=fields_form.errors), 400
+
+    keys = fields_form.get_keys()
+    query = db.session.query(*(USER_ROW_COLUMNS[key] for key in keys))
+
+    if "experience_hours" in keys:
+        # Hours come from the rollup rather than scanning experiences
+        query = query.outerjoin(
+            UserHoursSummary,
+            UserHoursSummary.user_id == User.id
+        )
+
+    if wants_ndjson():
+        return stream_ndjson(
+            query.order_by(User.id),
+            lambda row: serialize_user_row(row, keys)
+        )
+
+    form = PaginationForm(formdata=request.args)
+
+    if not form.validate():
+        return jsonify(errors=form.errors), 400
+
+    user_rows, next_cursor = paginate(query, User.id, form)
+
+    users = [serialize_user_row(row, keys) for row in user_rows]
+
+    return jsonify(users=users, limit=form.limit.data, next_cursor=next_cursor)
+
+@users.get('/export.csv')
+@replica_reads
+@query_budget(0)
+@require_admin
+def export_users():
+    """
+    Exports all users with their experience hours as CSV, streamed by
+    Postgres COPY. Optional query parameters 'start' and 'end' (inclusive
+    dates, YYYY-MM-DD) and 'department' count only matching experiences.
+    Authorization: must be admin requesting with valid token.
+    Returns CSV with header:
+        id,badge_number,email,first_name,last_name,status,
+        experience_hours,sessions
+    If unauthorized request, returns JSON { "errors": "Unauthorized" }
+    """
+
+    form = ExportForm(formdata=request.args)
+
+    if not form.validate():
+        return jsonify(errors=form.errors), 400
+
+    filters = Experience.get_filters(
+        start=form.start.data,
+        end=form.end.data,
+        department=form.department.data
+    )
+
+    statement = (db.select(
+            User.id,
+            User.badge_number,
+            User.email,
+            User.first_name,
+            User.last_name,
+            User.status,
+            db.func.sum(Experience.get_duration_expression())
+                .label("experience_hours"),
+            db.func.count(Experience.id).label("sessions"),
+        )
+        .outerjoin(Experience, db.and_(Experience.user_id == User.id, *filters))
+        .group_by(User.id)
+        .order_by(User.id)
+    )
+
+    return stream_csv(statement, "users.csv")
 
 @users.get('/<int:user_id>')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+@replica_reads
+@query_budget(1)
+@require_self_or_admin
 def get_user(user_id):
     """
     Gets a user by id.
+    Optional query parameter 'fields': comma separated fields to return
+    (id is always returned), e.g. 'fields=first_name,last_name'.
     Authorization: must be same user or admin requesting with valid token.
     Returns JSON {
         user: {
@@ -114,20 +235,34 @@ def get_user(user_id):
     If unauthorized request, returns JSON { "errors": "Unauthorized" }
     """
 
-    if (current_user.id == user_id or current_user.is_admin):
-        user = User.query.get_or_404(user_id)
-        return jsonify(user=user.serialize())
+    form = FieldsForm(formdata=request.args, allowed=User.SERIALIZE_KEYS)
+
+    if not form.validate():
+        return jsonify(errors=form.errors), 400
 
-    return jsonify(errors="Unauthorized"), 401
+    keys = form.get_keys()
+    row = (db.session
+        .query(*User.get_row_columns(keys))
+        .filter(User.id == user_id)
+        .first_or_404()
+    )
+
+    return jsonify(user=dict(zip(keys, row)))
 
 
 @users.get('/<int:user_id>/experiences')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+@replica_reads
+@query_budget(1)
+@require_self_or_admin
 def get_user_experiences(user_id):
     """
     Gets all experiences for a user. Optional query parameter of 'incomplete'
     will return all experiences whose sign_out_time is None.
     Primary use case for 'incomplete' is for getting experience(s) to "sign out".
+    Paginated by id: optional query parameters 'limit' (default 100, max 1000)
+    and 'cursor' (next_cursor of the previous page).
+    Optional query parameter 'fields': comma separated fields to return
+    (id is always returned), e.g. 'fields=sign_in_time,sign_out_time'.
     Authorization: must be same user or admin requesting with valid token.
     Returns JSON {
         user_experiences: [{
@@ -137,29 +272,48 @@ def get_user_experiences(user_id):
             "sign_out_time": "2023-04-06-08:35:12:23",
             "department": "lab",
             "user_id": 3
-        } ... ]
+        } ... ],
+        limit: 100,
+        next_cursor: "WzEwMF0" (null on the last page)
     }
     If unauthorized request, returns JSON { "errors": "Unauthorized" }
     """
 
-    if (current_user.id == user_id or current_user.is_admin):
-        if 'incomplete' in request.args:
-            experiences = Experience.query.filter_by(
-                user_id=user_id
-            ).filter_by(
-                sign_out_time=None
-            ).all()
-        else:
-            experiences = Experience.query.filter_by(user_id=user_id).all()
+    form = PaginationForm(formdata=request.args)
 
-        user_experiences = [e.serialize() for e in experiences]
+    if not form.validate():
+        return jsonify(errors=form.errors), 400
 
-        return jsonify(user_experiences=user_experiences)
+    fields_form = FieldsForm(
+        formdata=request.args,
+        allowed=Experience.SERIALIZE_KEYS
+    )
 
-    return jsonify(errors="Unauthorized"), 401
+    if not fields_form.validate():
+        return jsonify(errors=fields_form.errors), 400
+
+    keys = fields_form.get_keys()
+    query = (db.session
+        .query(*Experience.get_row_columns(keys))
+        .filter(Experience.user_id == user_id)
+    )
+    if 'incomplete' in request.args:
+        query = query.filter(Experience.sign_out_time.is_(None))
+
+    rows, next_cursor = paginate(query, Experience.id, form)
+
+    user_experiences = [Experience.serialize_row(row, keys) for row in rows]
+
+    return jsonify(
+        user_experiences=user_experiences,
+        limit=form.limit.data,
+        next_cursor=next_cursor
+    )
 
 @users.get('/<int:user_id>/languages')
-@jwt_required(optional=False, locations=['headers', 'cookies'])
+@replica_reads
+@query_budget(1)
+@require_self_or_admin
 def get_user_languages(user_id):
     """
     Gets all languages for a user. 
@@ -175,12 +329,9 @@ def get_user_languages(user_id):
     If unauthorized request, returns JSON { "errors": "Unauthorized" }
     """
 
-    if (current_user.id == user_id or current_user.is_admin):
-        languages = Language.query.filter_by(user_id=user_id).all()
-
-        user_languages = [e.serialize() for e in languages]
+    languages = Language.query.filter_by(user_id=user_id).all()
 
-        return jsonify(user_languages=user_languages)
+    user_languages = [e.serialize() for e in languages]
 
-    return jsonify(errors="Unauthorized"), 401
+    return jsonify(user_languages=user_languages)
 
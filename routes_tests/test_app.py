@@ -0,0 +1,64 @@
+"""App factory tests."""
+
+import os
+from unittest import TestCase
+from models.models import db
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app, create_app
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+
+class CreateAppTestCase(TestCase):
+    def test_create_app(self):
+        """The factory opens no connection and serves on its own"""
+
+        prod_app = create_app("production")
+
+        self.assertEqual(prod_app.config["APP_ENV"], "production")
+        self.assertNotIn("_debug_toolbar.static", prod_app.view_functions)
+        with prod_app.app_context():
+            self.assertEqual(db.engine.pool.checkedin(), 0)
+
+        resp = prod_app.test_client().get("/users/race-ethnicity-options")
+        self.assertEqual(resp.status_code, 200)
+
+        resp = prod_app.test_client().get("/users/1")
+        self.assertEqual(resp.status_code, 401)
+
+        with prod_app.app_context():
+            db.engine.dispose()
+
+    def test_create_app_leaves_other_apps(self):
+        """A second app has its own caches, hasher, replica and engines"""
+
+        engine = db.engine
+        cache = app.extensions["identity_cache"]
+        hasher = app.extensions["password_hasher"]
+        replica = app.extensions["read_replica"]
+
+        other_app = create_app({
+            "USER_CACHE_SIZE": 1,
+            "BCRYPT_MAX_CONCURRENCY": 1,
+        })
+
+        for name in ("identity_cache", "password_hasher", "read_replica"):
+            self.assertIsNot(other_app.extensions[name], app.extensions[name])
+        self.assertIs(app.extensions["identity_cache"], cache)
+        self.assertIs(app.extensions["password_hasher"], hasher)
+        self.assertIs(app.extensions["read_replica"], replica)
+        self.assertEqual(cache.maxsize, app.config["USER_CACHE_SIZE"])
+        self.assertEqual(
+            hasher.max_workers, app.config["BCRYPT_MAX_CONCURRENCY"]
+        )
+
+        with other_app.app_context():
+            self.assertIsNot(db.engine, engine)
+            self.assertIs(other_app.extensions["engines"]["primary"], db.engine)
+            db.engine.dispose()
+        self.assertIs(app.extensions["engines"]["primary"], engine)
@@ -2,10 +2,13 @@
 
 import os
 from unittest import TestCase
+from unittest.mock import patch
+from flask_jwt_extended import decode_token
 from datetime import datetime
 from models.User import User
 from models.Experience import Experience
 from models.models import db
+from hashing import password_hasher, HashingBusy
 
 # To use a different database for tests, set env variable.
 # Must be before app is imported
@@ -21,6 +24,9 @@ app.config['WTF_CSRF_ENABLED'] = False
 # Make Flask errors be real errors, rather than HTML pages with error info
 app.config['TESTING'] = True
 
+# Tests use the database outside of requests
+app.app_context().push()
+
 # Create tables once for all tests.
 # Data deleted & fresh test data set within each test
 db.create_all()
@@ -47,6 +53,7 @@ class AuthViewTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=True,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -145,6 +152,26 @@ class AuthViewTestCase(TestCase):
                 })
 
             self.assertIsInstance(resp.json["token"], str)
+            self.assertIsInstance(resp.json["refresh_token"], str)
+
+    def test_login_server_timing(self):
+        """Login reports the time spent checking the password"""
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/login",
+                json={
+                    "email": "u1@mail.com",
+                    "password": "password",
+                })
+
+            timings = {
+                entry.split(";")[0]: float(entry.split(";")[1][len("dur="):])
+                for entry in resp.headers["Server-Timing"].split(", ")
+            }
+
+            self.assertGreater(timings["bcrypt"], 0)
+            self.assertGreaterEqual(timings["total"], timings["bcrypt"])
 
     def test_login_wrong_password(self):
         with self.client as c:
@@ -166,4 +193,136 @@ class AuthViewTestCase(TestCase):
                     "password": "badpassword",
                 })
 
-            self.assertEqual(resp.json["errors"], "Invalid credentials")
\ No newline at end of file
+            self.assertEqual(resp.json["errors"], "Invalid credentials")
+
+    def test_login_hashing_busy(self):
+        with patch.object(
+            password_hasher,
+            "check_password_hash",
+            side_effect=HashingBusy(retry_after=2)
+        ):
+            with self.client as c:
+                resp = c.post(
+                    "/auth/login",
+                    json={
+                        "email": "u1@mail.com",
+                        "password": "password",
+                    })
+
+                self.assertEqual(resp.status_code, 503)
+                self.assertEqual(resp.headers["Retry-After"], "2")
+                self.assertEqual(
+                    resp.json["errors"],
+                    "Server busy, try again shortly"
+                )
+
+    def login(self):
+        """Log in as u1, returning the JSON with token and refresh_token"""
+
+        resp = self.client.post(
+            "/auth/login",
+            json={
+                "email": "u1@mail.com",
+                "password": "password",
+            })
+
+        return resp.json
+
+    def test_refresh(self):
+        tokens = self.login()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/refresh",
+                json={"refresh_token": tokens["refresh_token"]}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIsInstance(resp.json["token"], str)
+            self.assertNotEqual(
+                resp.json["refresh_token"],
+                tokens["refresh_token"]
+            )
+
+            resp = c.get(
+                f"/users/{self.u1_id}",
+                headers={"AUTHORIZATION": f"Bearer {resp.json['token']}"}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+
+    def test_refresh_reuse_revokes_family(self):
+        tokens = self.login()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/refresh",
+                json={"refresh_token": tokens["refresh_token"]}
+            )
+            rotated = resp.json["refresh_token"]
+
+            resp = c.post(
+                "/auth/refresh",
+                json={"refresh_token": tokens["refresh_token"]}
+            )
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json["errors"], "Invalid token")
+
+            resp = c.post("/auth/refresh", json={"refresh_token": rotated})
+
+            self.assertEqual(resp.status_code, 401)
+
+    def test_refresh_after_privilege_change(self):
+        tokens = self.login()
+
+        u1 = User.query.get(self.u1_id)
+        u1.is_admin = True
+        db.session.commit()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/refresh",
+                json={"refresh_token": tokens["refresh_token"]}
+            )
+
+            claims = decode_token(resp.json["token"])
+            self.assertTrue(claims["is_admin"])
+            self.assertEqual(claims["ver"], 1)
+
+    def test_refresh_fail_access_token(self):
+        tokens = self.login()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/refresh",
+                json={"refresh_token": tokens["token"]}
+            )
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json["errors"], "Invalid token")
+
+    def test_refresh_fail_no_token(self):
+        with self.client as c:
+            resp = c.post("/auth/refresh", json={})
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json["errors"], "Invalid token")
+
+    def test_logout(self):
+        tokens = self.login()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/logout",
+                json={"refresh_token": tokens["refresh_token"]}
+            )
+
+            self.assertEqual(resp.json["message"], "Logged out")
+
+            resp = c.post(
+                "/auth/refresh",
+                json={"refresh_token": tokens["refresh_token"]}
+            )
+
+            self.assertEqual(resp.status_code, 401)
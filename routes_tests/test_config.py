@@ -0,0 +1,28 @@
+"""Config tests."""
+
+from unittest import TestCase
+from config import get_config
+
+
+class ConfigTestCase(TestCase):
+    def test_config_profiles(self):
+        """Production turns off statement echo and the debug toolbar"""
+
+        environ = {
+            "SECRET_KEY": "secret",
+            "JWT_SECRET_KEY": "jwt secret",
+            "DATABASE_URL": "postgresql://localhost/db",
+            "SQLALCHEMY_ECHO": "true",
+        }
+
+        config = get_config(environ=environ)
+        self.assertEqual(config["APP_ENV"], "development")
+        self.assertTrue(config["SQLALCHEMY_ECHO"])
+        self.assertTrue(config["DEBUG_TOOLBAR"])
+
+        config = get_config(environ={**environ, "APP_ENV": "production"})
+        self.assertFalse(config["SQLALCHEMY_ECHO"])
+        self.assertFalse(config["DEBUG_TOOLBAR"])
+
+        with self.assertRaises(ValueError):
+            get_config("staging", environ=environ)
@@ -1,6 +1,7 @@
 """Experience Routes tests."""
 
 import os
+import json
 from unittest import TestCase
 from datetime import datetime
 from models.User import User
@@ -21,6 +22,9 @@ app.config['WTF_CSRF_ENABLED'] = False
 # Make Flask errors be real errors, rather than HTML pages with error info
 app.config['TESTING'] = True
 
+# Tests use the database outside of requests
+app.app_context().push()
+
 # Create tables once for all tests.
 # Data deleted & fresh test data set within each test
 db.create_all()
@@ -65,6 +69,7 @@ class ExperienceRoutesTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=True,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -82,6 +87,7 @@ class ExperienceRoutesTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=False,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -99,6 +105,7 @@ class ExperienceRoutesTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=False,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -203,9 +210,9 @@ class ExperienceRoutesTestCase(TestCase):
 
             self.assertIn(
                 {
-                    "date": "2022-01-05T00:00:00",
-                    "sign_in_time": "2022-01-05T08:00:00",
-                    "sign_out_time": "2022-01-05T10:00:00",
+                    "date": "2022-01-05T00:00:00.000000",
+                    "sign_in_time": "2022-01-05T08:00:00.000000",
+                    "sign_out_time": "2022-01-05T10:00:00.000000",
                     "department": "lab",
                     "user_id": self.u1_id
                 },
@@ -213,9 +220,9 @@ class ExperienceRoutesTestCase(TestCase):
             )
             self.assertIn(
                 {
-                    "date": "2022-01-08T00:00:00",
-                    "sign_in_time": "2022-01-08T12:00:00",
-                    "sign_out_time": "2022-01-08T16:00:00",
+                    "date": "2022-01-08T00:00:00.000000",
+                    "sign_in_time": "2022-01-08T12:00:00.000000",
+                    "sign_out_time": "2022-01-08T16:00:00.000000",
                     "department": "pharmacy",
                     "user_id": self.u1_id
                 },
@@ -223,8 +230,8 @@ class ExperienceRoutesTestCase(TestCase):
             )
             self.assertIn(
                 {
-                    "date": "2022-01-10T00:00:00",
-                    "sign_in_time": "2022-01-10T12:00:00",
+                    "date": "2022-01-10T00:00:00.000000",
+                    "sign_in_time": "2022-01-10T12:00:00.000000",
                     "sign_out_time": None,
                     "department": "pharmacy",
                     "user_id": self.u1_id
@@ -251,8 +258,8 @@ class ExperienceRoutesTestCase(TestCase):
 
             self.assertIn(
                 {
-                    "date": "2022-01-10T00:00:00",
-                    "sign_in_time": "2022-01-10T12:00:00",
+                    "date": "2022-01-10T00:00:00.000000",
+                    "sign_in_time": "2022-01-10T12:00:00.000000",
                     "sign_out_time": None,
                     "department": "pharmacy",
                     "user_id": self.u1_id
@@ -261,6 +268,123 @@ class ExperienceRoutesTestCase(TestCase):
             )
 
 
+    def test_get_experiences_pages_admin(self):
+        """Admin can page through all experiences with limit and cursor"""
+
+        with self.client as c:
+            resp1 = c.get(
+                f"/experiences?limit=3",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(len(resp1.json['experiences']), 3)
+            self.assertEqual(resp1.json['limit'], 3)
+            self.assertIsNotNone(resp1.json['next_cursor'])
+
+            resp2 = c.get(
+                f"/experiences?limit=3&cursor={resp1.json['next_cursor']}",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(len(resp2.json['experiences']), 1)
+            self.assertIsNone(resp2.json['next_cursor'])
+
+            ids = [e['id'] for e in resp1.json['experiences']]
+            ids += [e['id'] for e in resp2.json['experiences']]
+            self.assertEqual(ids, sorted(set(ids)))
+
+    def test_get_experiences_blank_limit_admin(self):
+        """A blank limit gets the default page size"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences?limit=",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['limit'], 100)
+            self.assertEqual(len(resp.json['experiences']), 4)
+
+    def test_get_experiences_fail_invalid_page_admin(self):
+        """Admin gets errors for an invalid limit or cursor"""
+
+        with self.client as c:
+            resp1 = c.get(
+                f"/experiences?limit=0",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+            resp2 = c.get(
+                f"/experiences?cursor=not-a-cursor",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp1.status_code, 400)
+            self.assertIn('limit', resp1.json['errors'])
+            self.assertEqual(resp2.status_code, 400)
+            self.assertEqual(resp2.json['errors'], {'cursor': ['Invalid cursor']})
+
+    def test_get_experiences_fields_admin(self):
+        """Admin can get only some fields of each experience"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences?incomplete&fields=sign_out_time,department",
+                headers={
+                    "AUTHORIZATION": f"Bearer {self.admin_token}",
+                    "ACCEPT": "application/x-ndjson"
+                }
+            )
+
+            experiences = [
+                json.loads(line) for line in resp.get_data(as_text=True).splitlines()
+            ]
+
+            self.assertEqual(len(experiences), 2)
+            self.assertEqual(
+                set(experiences[0]),
+                {"id", "sign_out_time", "department"}
+            )
+            self.assertIsNone(experiences[0]['sign_out_time'])
+
+    def test_get_experiences_fail_invalid_fields_admin(self):
+        """Admin gets errors for fields that are not returned"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences?fields=department,duration_seconds",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(
+                resp.json['errors'],
+                {'fields': ['Invalid field(s): duration_seconds']}
+            )
+
+    def test_get_experiences_ndjson_admin(self):
+        """Admin can stream all experiences as newline delimited JSON"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences?incomplete",
+                headers={
+                    "AUTHORIZATION": f"Bearer {self.admin_token}",
+                    "ACCEPT": "application/x-ndjson"
+                }
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, "application/x-ndjson")
+
+            experiences = [
+                json.loads(line) for line in resp.get_data(as_text=True).splitlines()
+            ]
+
+            self.assertEqual(len(experiences), 2)
+            self.assertEqual(experiences[0]['sign_in_time'], "2022-01-10T12:00:00.000000")
+            self.assertIsNone(experiences[0]['sign_out_time'])
+
     def test_get_all_experiences_fail_non_admin(self):
         """Non admin user can NOT retrieve all experiences"""
 
@@ -294,6 +418,47 @@ class ExperienceRoutesTestCase(TestCase):
             self.assertEqual(resp.status_code, 401)
             self.assertEqual(resp.json['errors'], "Invalid token")
 
+# ########################################################################
+# # GET /experiences/export.csv tests
+
+    def test_export_experiences_admin(self):
+        """Admin can export experiences as CSV, filtered by date and department"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences/export.csv?start=2022-01-06&end=2022-01-10&department=pharmacy",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, "text/csv")
+
+            lines = resp.get_data(as_text=True).splitlines()
+
+            self.assertEqual(
+                lines[0],
+                "id,user_id,badge_number,first_name,last_name,date," +
+                "sign_in_time,sign_out_time,department,hours"
+            )
+            # e2, e3 and e4 are in pharmacy; e1 is before start
+            self.assertEqual(len(lines), 4)
+            self.assertIn(
+                "2022-01-08 00:00:00,2022-01-08 12:00:00,2022-01-08 16:00:00,pharmacy,4.00",
+                lines[1]
+            )
+
+    def test_export_experiences_fail_non_admin(self):
+        """Non admin user can NOT export experiences"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences/export.csv",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json['errors'], "Unauthorized")
+
 # ########################################################################
 # # POST /experiences tests
 
@@ -568,6 +733,33 @@ class ExperienceRoutesTestCase(TestCase):
                 "user_id": self.u2_id
             })
 
+    def test_update_experience_round_trips_whole_seconds(self):
+        """Times as returned, even on a whole second, are accepted back"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/experiences",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            sign_out_time = next(
+                e['sign_out_time'] for e in resp.json['experiences']
+                if e['sign_out_time'] is not None
+            )
+            self.assertTrue(sign_out_time.endswith(":00.000000"))
+
+            resp = c.patch(
+                f"/experiences/{self.u2_exp_id}",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"},
+                json={"sign_out_time": sign_out_time}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(
+                resp.json['user_experience']['sign_out_time'],
+                sign_out_time
+            )
+
     def test_update_experience_success_admin(self):
         """Admin can update an experience"""
 
@@ -0,0 +1,143 @@
+"""JSON provider tests."""
+
+import os
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime
+from flask.json.provider import DefaultJSONProvider
+from models.User import User
+from models.Experience import Experience
+from models.models import db
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+# Disable WTForms from using CSRF at all
+app.config['WTF_CSRF_ENABLED'] = False
+
+# Make Flask errors be real errors, rather than HTML pages with error info
+app.config['TESTING'] = True
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+# Create tables once for all tests.
+# Data deleted & fresh test data set within each test
+db.create_all()
+Experience.__table__.drop(db.engine)
+db.drop_all()
+db.create_all()
+
+
+class JSONProviderTestCase(TestCase):
+    def setUp(self):
+        Experience.query.delete()
+        User.query.delete()
+
+        u1 = User.signup(
+            badge_number=1,
+            email='u1@mail.com',
+            password='password',
+            first_name="u1",
+            last_name="test",
+            dob=datetime(year=2000, month=1, day=1),
+            gender="Prefer not to say",
+            address="1 Cherry lane",
+            city="New York",
+            state="NY",
+            zip_code="11001",
+            phone_number="9991234567",
+            is_student=True,
+            is_healthcare_provider=False,
+            is_multilingual=False
+        )
+
+        u1.status = "active"
+        db.session.commit()
+
+        self.u1_id = u1.id
+
+        self.client = app.test_client()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/login",
+                json={
+                    "email": "u1@mail.com",
+                    "password": "password",
+                })
+
+            self.u1_token = resp.json["token"]
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_get_user_json_matches_stdlib(self):
+        """User details encode as the stdlib encoder would, unsorted"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/{self.u1_id}",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            self.assertEqual(tuple(resp.json['user']), User.SERIALIZE_KEYS)
+
+        with app.app_context():
+            row = (db.session
+                .query(*User.get_row_columns())
+                .filter(User.id == self.u1_id)
+                .one())
+            user = dict(zip(User.SERIALIZE_KEYS, row))
+
+            stdlib = DefaultJSONProvider(app)
+            expected = json.dumps(
+                user,
+                default=stdlib.default,
+                separators=(",", ":")
+            ) + "\n"
+
+            body = app.json.response(user).get_data(as_text=True)
+            self.assertEqual(body, expected)
+            with patch("json_provider.orjson", None):
+                body = app.json.response(user).get_data(as_text=True)
+                self.assertEqual(body, expected)
+
+            self.assertEqual(
+                app.json.loads(app.json.dumps(user)),
+                json.loads(stdlib.dumps(user))
+            )
+
+    def test_non_finite_floats_encode_as_null(self):
+        """NaN and ±Infinity are null with either encoder, as valid JSON"""
+
+        data = {
+            "nan": float("nan"),
+            "infinities": [float("inf"), -float("inf")],
+            "finite": 1.5,
+        }
+        expected = '{"nan":null,"infinities":[null,null],"finite":1.5}'
+
+        with app.app_context():
+            self.assertEqual(app.json.dumps(data), expected)
+            self.assertEqual(
+                app.json.response(data).get_data(as_text=True),
+                expected + "\n"
+            )
+
+            with patch("json_provider.orjson", None):
+                self.assertEqual(
+                    app.json.response(data).get_data(as_text=True),
+                    expected + "\n"
+                )
+                for kwargs in ({}, {"indent": 4}):
+                    self.assertEqual(
+                        json.loads(app.json.dumps(data, **kwargs)),
+                        json.loads(expected)
+                    )
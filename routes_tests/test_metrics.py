@@ -0,0 +1,262 @@
+"""Metrics tests."""
+
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime
+from models.User import User, identity_cache
+from models.Experience import Experience
+from models.models import db
+from query_budget import count_statements
+from metrics import (
+    DURATION_BUCKETS, MultiprocessMetrics, mark_process_dead, take_snapshot
+)
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+# Disable WTForms from using CSRF at all
+app.config['WTF_CSRF_ENABLED'] = False
+
+# Make Flask errors be real errors, rather than HTML pages with error info
+app.config['TESTING'] = True
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+# Create tables once for all tests.
+# Data deleted & fresh test data set within each test
+db.create_all()
+Experience.__table__.drop(db.engine)
+db.drop_all()
+db.create_all()
+
+# Test client requests come from 127.0.0.1
+LOOPBACK = {"METRICS_ALLOWED_NETWORKS": "127.0.0.1/32", "METRICS_TOKEN": None}
+
+# Another worker's snapshot, as written to METRICS_DIR
+WORKER_SNAPSHOT = {
+    "histograms": {
+        "http_request_duration_seconds": {
+            "users.get_user": {
+                "counts": [1] + [0] * (len(DURATION_BUCKETS) - 1),
+                "sum": 0.001,
+                "count": 1,
+            },
+        },
+    },
+    "pools": {
+        "primary": {
+            "size": 5, "checked_out": 2, "overflow": 0,
+            "connect": 3, "checkout": 10, "checkin": 8, "invalidate": 0,
+        },
+    },
+    "caches": {
+        "user_identity": {"hits": 4, "misses": 1, "size": 2},
+    },
+}
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        Experience.query.delete()
+        User.query.delete()
+
+        u1 = User.signup(
+            badge_number=1,
+            email='u1@mail.com',
+            password='password',
+            first_name="u1",
+            last_name="test",
+            dob=datetime(year=2000, month=1, day=1),
+            gender="Prefer not to say",
+            address="1 Cherry lane",
+            city="New York",
+            state="NY",
+            zip_code="11001",
+            phone_number="9991234567",
+            is_student=True,
+            is_healthcare_provider=False,
+            is_multilingual=False
+        )
+
+        u1.status = "active"
+        db.session.commit()
+
+        self.u1_id = u1.id
+
+        self.client = app.test_client()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/login",
+                json={
+                    "email": "u1@mail.com",
+                    "password": "password",
+                })
+
+            self.u1_token = resp.json["token"]
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_get_user_server_timing(self):
+        """Response reports its SQL statements and timings"""
+
+        with self.client as c, count_statements() as statements:
+            resp = c.get(
+                f"/users/{self.u1_id}",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            server_timing = resp.headers["Server-Timing"]
+            self.assertIn("total;dur=", server_timing)
+            self.assertIn("serialize;dur=", server_timing)
+            self.assertIn("sql;dur=", server_timing)
+            self.assertIn(
+                f'desc="{len(statements)} statement(s)"',
+                server_timing
+            )
+
+    def test_metrics(self):
+        """Metrics aggregate request timings per endpoint"""
+
+        with patch.dict(app.config, LOOPBACK), self.client as c:
+            c.get(
+                f"/users/{self.u1_id}",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+            resp = c.get("/metrics")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("text/plain", resp.content_type)
+
+            body = resp.get_data(as_text=True)
+            self.assertIn(
+                'http_request_duration_seconds_count{endpoint="users.get_user"}',
+                body
+            )
+            self.assertIn(
+                'http_request_sql_statements_bucket{endpoint="users.get_user",le="+Inf"}',
+                body
+            )
+            self.assertIn('db_pool_checked_out{pool="primary"}', body)
+            self.assertIn('db_pool_overflow{pool="primary"}', body)
+            self.assertIn(
+                'db_pool_events_total{pool="primary",event="checkout"}',
+                body
+            )
+            self.assertIn('cache_hits_total{cache="user_identity"}', body)
+
+    def test_metrics_fail_not_allowed(self):
+        """Without a token or an allowed address, metrics are refused"""
+
+        settings = {"METRICS_ALLOWED_NETWORKS": "", "METRICS_TOKEN": None}
+        with patch.dict(app.config, settings), self.client as c:
+            resp = c.get("/metrics")
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json, {"errors": "Unauthorized"})
+
+        settings = {"METRICS_ALLOWED_NETWORKS": "10.0.0.0/8"}
+        with patch.dict(app.config, settings), self.client as c:
+            resp = c.get("/metrics")
+
+            self.assertEqual(resp.status_code, 401)
+
+    def test_metrics_token(self):
+        """The metrics token is accepted from any address"""
+
+        settings = {"METRICS_ALLOWED_NETWORKS": "", "METRICS_TOKEN": "secret"}
+        with patch.dict(app.config, settings), self.client as c:
+            resp = c.get(
+                "/metrics",
+                headers={"AUTHORIZATION": "Bearer wrong"}
+            )
+            self.assertEqual(resp.status_code, 401)
+
+            resp = c.get(
+                "/metrics",
+                headers={"AUTHORIZATION": "Bearer secret"}
+            )
+            self.assertEqual(resp.status_code, 200)
+
+            # A user's token is not the metrics token
+            resp = c.get(
+                "/metrics",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+            self.assertEqual(resp.status_code, 401)
+
+    def test_metrics_add_up_workers(self):
+        """
+        Workers' counters and histograms are added up, and kept after they
+        exit; their gauges are not
+        """
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with open(os.path.join(directory, "worker-99999.json"), "w") as file:
+            json.dump(WORKER_SNAPSHOT, file)
+
+        caches = {"user_identity": identity_cache}
+        engines = {"primary": db.engine}
+        multiprocess = MultiprocessMetrics(directory, caches, engines)
+
+        own = take_snapshot(caches, engines)
+        own_requests = own["histograms"][
+            "http_request_duration_seconds"
+        ].get("users.get_user", {"count": 0})["count"]
+        own_pool = own["pools"]["primary"]
+
+        merged = multiprocess.collect()
+
+        self.assertTrue(
+            os.path.exists(os.path.join(directory, f"worker-{os.getpid()}.json"))
+        )
+        self.assertEqual(
+            merged["histograms"]["http_request_duration_seconds"]
+                ["users.get_user"]["count"],
+            own_requests + 1
+        )
+        self.assertEqual(
+            merged["pools"]["primary"]["checked_out"],
+            own_pool["checked_out"] + 2
+        )
+        self.assertEqual(
+            merged["pools"]["primary"]["connect"],
+            own_pool["connect"] + 3
+        )
+
+        mark_process_dead(directory, 99999)
+        merged = multiprocess.collect()
+
+        self.assertFalse(
+            os.path.exists(os.path.join(directory, "worker-99999.json"))
+        )
+        self.assertEqual(
+            merged["histograms"]["http_request_duration_seconds"]
+                ["users.get_user"]["count"],
+            own_requests + 1
+        )
+        self.assertEqual(
+            merged["pools"]["primary"]["checked_out"],
+            own_pool["checked_out"]
+        )
+        self.assertEqual(
+            merged["pools"]["primary"]["connect"],
+            own_pool["connect"] + 3
+        )
+        self.assertEqual(
+            merged["caches"]["user_identity"]["hits"],
+            identity_cache.stats()["hits"] + 4
+        )
@@ -0,0 +1,80 @@
+"""Query budget tests."""
+
+import os
+import json
+from unittest import TestCase
+from unittest.mock import patch
+from models.User import User
+from models.Experience import Experience
+from models.models import db
+from query_budget import query_budget, QueryBudgetExceeded
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+# Make Flask errors be real errors, rather than HTML pages with error info
+app.config['TESTING'] = True
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+# Create tables once for all tests.
+# Data deleted & fresh test data set within each test
+db.create_all()
+Experience.__table__.drop(db.engine)
+db.drop_all()
+db.create_all()
+
+
+class QueryBudgetTestCase(TestCase):
+    def test_routes_have_query_budgets(self):
+        """Every route declares a query budget, enforced while testing"""
+
+        for endpoint, view in app.view_functions.items():
+            if "." in endpoint and not endpoint.endswith(".static"):
+                self.assertIsInstance(
+                    getattr(view, "query_budget", None),
+                    int,
+                    endpoint
+                )
+
+    def test_query_budget_exceeded(self):
+        """Going over budget fails when testing"""
+
+        @query_budget(1)
+        def view():
+            User.query.all()
+            User.query.all()
+            return "ok"
+
+        with app.test_request_context("/users"):
+            with self.assertRaises(QueryBudgetExceeded) as cm:
+                view()
+
+            details = json.loads(str(cm.exception))
+            self.assertEqual(details["budget"], 1)
+            self.assertEqual(details["statements"], 2)
+            self.assertEqual(list(details["fingerprints"].values()), [2])
+
+    def test_query_budget_exceeded_warns(self):
+        """Going over budget only logs a warning when not enforced"""
+
+        @query_budget(0)
+        def view():
+            User.query.filter_by(id=1).all()
+            return "ok"
+
+        with patch.dict(app.config, QUERY_BUDGET_ENFORCE=False):
+            with app.test_request_context("/users"):
+                with self.assertLogs(app.logger, "WARNING") as logs:
+                    self.assertEqual(view(), "ok")
+
+        details = json.loads(logs.records[0].getMessage())
+        self.assertEqual(details["event"], "query_budget_exceeded")
+        self.assertIn(
+            "WHERE users.id = ?",
+            list(details["fingerprints"])[0]
+        )
@@ -0,0 +1,192 @@
+"""Read replica tests."""
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime
+from sqlalchemy import event
+from models.User import User
+from models.Experience import Experience
+from models.models import db
+from engine import create_engine
+from replica import read_replica, PIN_COOKIE
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+# Disable WTForms from using CSRF at all
+app.config['WTF_CSRF_ENABLED'] = False
+
+# Make Flask errors be real errors, rather than HTML pages with error info
+app.config['TESTING'] = True
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+# Create tables once for all tests.
+# Data deleted & fresh test data set within each test
+db.create_all()
+Experience.__table__.drop(db.engine)
+db.drop_all()
+db.create_all()
+
+
+class ReadReplicaTestCase(TestCase):
+    def setUp(self):
+        Experience.query.delete()
+        User.query.delete()
+
+        u1 = User.signup(
+            badge_number=1,
+            email='u1@mail.com',
+            password='password',
+            first_name="u1",
+            last_name="test",
+            dob=datetime(year=2000, month=1, day=1),
+            gender="Prefer not to say",
+            address="1 Cherry lane",
+            city="New York",
+            state="NY",
+            zip_code="11001",
+            phone_number="9991234567",
+            is_student=True,
+            is_healthcare_provider=False,
+            is_multilingual=False
+        )
+
+        u1.status = "active"
+        db.session.commit()
+
+        self.u1_id = u1.id
+
+        self.client = app.test_client()
+
+        with self.client as c:
+            resp = c.post(
+                "/auth/login",
+                json={
+                    "email": "u1@mail.com",
+                    "password": "password",
+                })
+
+            self.u1_token = resp.json["token"]
+
+    def tearDown(self):
+        db.session.rollback()
+        read_replica.configure(
+            None, max_lag=5, check_interval=5, pin_seconds=10
+        )
+
+    def count_replica_reads(self, engine, url):
+        """GET url as u1; the statements run on the replica engine"""
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            with self.client as c:
+                resp = c.get(
+                    url,
+                    headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+                )
+                self.assertEqual(resp.status_code, 200)
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+        return statements
+
+    def test_get_user_reads_replica(self):
+        """GET views read from the replica, once it is checked"""
+
+        # A second engine on the test database stands in for a replica
+        engine = create_engine(os.environ["DATABASE_URL"])
+        read_replica.configure(
+            engine, max_lag=5, check_interval=5, pin_seconds=10
+        )
+
+        statements = self.count_replica_reads(engine, f"/users/{self.u1_id}")
+
+        # The health check, then the view's query
+        self.assertEqual(len(statements), 2)
+        self.assertIn("FROM users", statements[1])
+
+        # A lagging replica is not read from
+        with patch.object(read_replica, "get_lag", return_value=60):
+            read_replica.checked_at = None
+            statements = self.count_replica_reads(
+                engine, f"/users/{self.u1_id}/experiences"
+            )
+        self.assertEqual(statements, [])
+
+        engine.dispose()
+
+    def test_get_user_replica_unreachable(self):
+        """Reads fall back to the primary if the replica is down"""
+
+        engine = create_engine("postgresql://localhost:1/replica")
+        read_replica.configure(
+            engine, max_lag=5, check_interval=5, pin_seconds=10
+        )
+
+        statements = self.count_replica_reads(engine, f"/users/{self.u1_id}")
+        self.assertEqual(statements, [])
+        self.assertFalse(read_replica.available)
+
+        engine.dispose()
+
+    def test_get_user_pinned_after_write(self):
+        """A client's reads go to the primary for a while after it writes"""
+
+        engine = create_engine(os.environ["DATABASE_URL"])
+        read_replica.configure(
+            engine, max_lag=5, check_interval=5, pin_seconds=10
+        )
+
+        with self.client as c:
+            # Refresh tokens aren't read from the replica, so logins don't pin
+            c.post(
+                "/auth/login",
+                json={"email": "u1@mail.com", "password": "password"}
+            )
+            self.assertIsNone(c.get_cookie(PIN_COOKIE))
+
+            sign_in_time = datetime(
+                year=2022, month=1, day=9, hour=8, microsecond=1
+            ).isoformat()
+            resp = c.post(
+                "/experiences",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"},
+                json={
+                    "date": sign_in_time,
+                    "sign_in_time": sign_in_time,
+                    "department": "lab",
+                    "user_id": self.u1_id
+                }
+            )
+            self.assertEqual(resp.status_code, 200)
+            self.assertIsNotNone(c.get_cookie(PIN_COOKIE))
+
+        url = f"/users/{self.u1_id}/experiences"
+
+        # Pinned by the cookie, for clients that keep cookies
+        read_replica.recent_writers.configure(maxsize=4096, ttl=10)
+        self.assertEqual(self.count_replica_reads(engine, url), [])
+
+        # Pinned by user, for those that don't
+        self.client.delete_cookie(PIN_COOKIE)
+        read_replica.recent_writers.set(self.u1_id, True)
+        self.assertEqual(self.count_replica_reads(engine, url), [])
+
+        # Unpinned, reads go to the replica again
+        read_replica.recent_writers.configure(maxsize=4096, ttl=10)
+        self.assertNotEqual(self.count_replica_reads(engine, url), [])
+
+        engine.dispose()
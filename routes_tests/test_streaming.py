@@ -0,0 +1,39 @@
+"""Streaming tests."""
+
+import os
+from unittest import TestCase
+import psycopg2
+from sqlalchemy import bindparam, literal_column, select
+from models.models import db
+from streaming import stream_csv
+
+# To use a different database for tests, set env variable.
+# Must be before app is imported
+os.environ['DATABASE_URI'] = "postgresql:///volunteer_management_test"
+
+from app import app
+
+# Tests use the database outside of requests
+app.app_context().push()
+
+
+class StreamCSVTestCase(TestCase):
+    def test_stream_csv_setup_error_returns_connection(self):
+        """A statement that can't be prepared doesn't leak its connection"""
+
+        # psycopg2 can't adapt the parameter, so mogrify raises
+        statement = select(literal_column("1")).where(
+            bindparam("value", value=object()) == 1
+        )
+
+        with app.test_request_context("/users/export.csv"):
+            checked_out = db.engine.pool.checkedout()
+
+            # Checked while the traceback holds the function's frame, as
+            # a caller's error handler would be
+            try:
+                stream_csv(statement, "test.csv")
+            except psycopg2.ProgrammingError:
+                self.assertEqual(db.engine.pool.checkedout(), checked_out)
+            else:
+                self.fail("stream_csv did not raise")
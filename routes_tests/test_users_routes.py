@@ -1,11 +1,15 @@
 """User Routes tests."""
 
 import os
+import json
 from unittest import TestCase
+from unittest.mock import patch
 from datetime import datetime
 from models.User import User
 from models.Experience import Experience
 from models.models import db
+import jwt_auth
+from query_budget import count_statements
 
 # To use a different database for tests, reset env variable.
 # Must be before app is imported
@@ -21,6 +25,9 @@ app.config['WTF_CSRF_ENABLED'] = False
 # Make Flask errors be real errors, rather than HTML pages with error info
 app.config['TESTING'] = True
 
+# Tests use the database outside of requests
+app.app_context().push()
+
 # Create tables once for all tests.
 # Data deleted & fresh test data set within each test
 db.create_all()
@@ -65,6 +72,7 @@ class UsersViewsTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=True,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -82,6 +90,7 @@ class UsersViewsTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=False,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -99,6 +108,7 @@ class UsersViewsTestCase(TestCase):
             zip_code="11001",
             phone_number="9991234567",
             is_student=False,
+            is_healthcare_provider=False,
             is_multilingual=False
         )
 
@@ -197,6 +207,7 @@ class UsersViewsTestCase(TestCase):
                     "experience_hours": 6.0,
                     "first_name": "u1",
                     "is_admin": False,
+                    "is_healthcare_provider": False,
                     "is_multilingual": False,
                     "is_student": True,
                     "last_name": "test",
@@ -211,6 +222,7 @@ class UsersViewsTestCase(TestCase):
                     "experience_hours": 0,
                     "first_name": "u2",
                     "is_admin": False,
+                    "is_healthcare_provider": False,
                     "is_multilingual": False,
                     "is_student": False,
                     "last_name": "test",
@@ -225,6 +237,7 @@ class UsersViewsTestCase(TestCase):
                     "experience_hours": 0,
                     "first_name": "Admin",
                     "is_admin": True,
+                    "is_healthcare_provider": False,
                     "is_multilingual": False,
                     "is_student": False,
                     "last_name": "test",
@@ -271,6 +284,143 @@ class UsersViewsTestCase(TestCase):
             #     ]
             # )
 
+    def test_get_users_constant_query_count(self):
+        """Number of queries to get all users does not grow with users"""
+
+        with self.client as c:
+            # Warm the current_user cache so both counts exclude the lookup
+            c.get(
+                f"/users",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            with count_statements() as before:
+                c.get(
+                    f"/users",
+                    headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+                )
+
+            for i in range(4, 9):
+                user = User(
+                    badge_number=i,
+                    email=f"u{i}@mail.com",
+                    password="password",
+                    first_name=f"u{i}",
+                    last_name="test",
+                    dob=datetime(year=2000, month=1, day=1).isoformat(),
+                    gender="Prefer not to say",
+                    address="1 Cherry lane",
+                    city="New York",
+                    state="NY",
+                    zip_code="11001",
+                    phone_number="9991234567",
+                    is_student=False,
+                    is_healthcare_provider=False,
+                    is_multilingual=False
+                )
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(Experience(
+                    date=datetime(year=2022, month=1, day=5).isoformat(),
+                    sign_in_time=datetime(year=2022, month=1, day=5, hour=8).isoformat(),
+                    sign_out_time=datetime(year=2022, month=1, day=5, hour=9).isoformat(),
+                    department="lab",
+                    user_id=user.id
+                ))
+            db.session.commit()
+
+            with count_statements() as after:
+                resp = c.get(
+                    f"/users",
+                    headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+                )
+
+            self.assertEqual(len(resp.json['users']), 8)
+            self.assertEqual(len(before), len(after))
+
+    def test_get_users_fields_admin(self):
+        """Admin can get only some fields, and only they are read"""
+
+        with self.client as c:
+            with count_statements() as statements:
+                resp = c.get(
+                    f"/users?fields=first_name,last_name",
+                    headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+                )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(
+                set(resp.json['users'][0]),
+                {"id", "first_name", "last_name"}
+            )
+
+            users_statement = statements[-1]
+            self.assertNotIn("email", users_statement)
+            self.assertNotIn("user_hours_summary", users_statement)
+
+    def test_get_users_fail_invalid_fields_admin(self):
+        """Admin gets errors for fields that are not returned"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users?fields=first_name,password",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(
+                resp.json['errors'],
+                {'fields': ['Invalid field(s): password']}
+            )
+
+    def test_get_users_pages_admin(self):
+        """Admin can page through all users with limit and cursor"""
+
+        with self.client as c:
+            resp1 = c.get(
+                f"/users?limit=2",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+            resp2 = c.get(
+                f"/users?limit=2&cursor={resp1.json['next_cursor']}",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(
+                [u['id'] for u in resp1.json['users']],
+                [self.u1_id, self.u2_id]
+            )
+            self.assertEqual(
+                [u['id'] for u in resp2.json['users']],
+                [self.admin_id]
+            )
+            self.assertIsNone(resp2.json['next_cursor'])
+
+    def test_get_users_ndjson_admin(self):
+        """Admin can stream all users as newline delimited JSON"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users",
+                headers={
+                    "AUTHORIZATION": f"Bearer {self.admin_token}",
+                    "ACCEPT": "application/x-ndjson"
+                }
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, "application/x-ndjson")
+
+            users = [
+                json.loads(line) for line in resp.get_data(as_text=True).splitlines()
+            ]
+
+            self.assertEqual(
+                [u['id'] for u in users],
+                [self.u1_id, self.u2_id, self.admin_id]
+            )
+            self.assertEqual(users[0]['experience_hours'], 6.0)
+
     def test_get_users_fail_non_admin(self):
         """Non-admin user can NOT get list of all users"""
 
@@ -305,6 +455,116 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(resp.json['errors'], "Invalid token")
 
 
+########################################################################
+# GET /users/export.csv tests
+
+    def test_export_users_admin(self):
+        """Admin can export users with experience hours as CSV"""
+
+        with self.client as c:
+            resp1 = c.get(
+                f"/users/export.csv",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+            resp2 = c.get(
+                f"/users/export.csv?department=lab",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp1.status_code, 200)
+            self.assertEqual(resp1.mimetype, "text/csv")
+
+            lines1 = resp1.get_data(as_text=True).splitlines()
+            lines2 = resp2.get_data(as_text=True).splitlines()
+
+            self.assertEqual(
+                lines1[0],
+                "id,badge_number,email,first_name,last_name,status," +
+                "experience_hours,sessions"
+            )
+            self.assertEqual(len(lines1), 4)
+            self.assertEqual(
+                lines1[1],
+                f"{self.u1_id},1,u1@mail.com,u1,test,active,6.00,3"
+            )
+            self.assertEqual(
+                lines1[2],
+                f"{self.u2_id},2,u2@mail.com,u2,test,new,0,0"
+            )
+            self.assertEqual(
+                lines2[1],
+                f"{self.u1_id},1,u1@mail.com,u1,test,active,2.00,1"
+            )
+
+    def test_export_users_fail_invalid_date_admin(self):
+        """Admin gets errors for an invalid date filter"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/export.csv?start=yesterday",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('start', resp.json['errors'])
+
+    def test_export_users_fail_non_admin(self):
+        """Non-admin user can NOT export users"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/export.csv",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json['errors'], "Unauthorized")
+
+########################################################################
+# GET /users/race-ethnicity-options tests
+
+    def test_get_race_ethnicity_options_skips_token(self):
+        """Public route ignores any token, even an invalid one"""
+
+        with self.client as c:
+            resp = c.get(
+                "/users/race-ethnicity-options",
+                headers={"AUTHORIZATION": f"Bearer {BAD_TOKEN}"}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("race", resp.json['race_ethnicity_options'])
+
+    def test_get_race_ethnicity_options_cached(self):
+        """Options come with an ETag, and a matching request gets a 304"""
+
+        with self.client as c:
+            resp = c.get("/users/race-ethnicity-options")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(
+                "I Do Not Know",
+                resp.json['race_ethnicity_options']['ethnic_background']
+            )
+            self.assertIn("max-age=86400", resp.headers["Cache-Control"])
+
+            etag = resp.headers["ETag"]
+
+            resp = c.get(
+                "/users/race-ethnicity-options",
+                headers={"If-None-Match": etag}
+            )
+
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.data, b"")
+
+            resp = c.get(
+                "/users/race-ethnicity-options",
+                headers={"If-None-Match": '"stale"'}
+            )
+
+            self.assertEqual(resp.status_code, 200)
+
 ########################################################################
 # GET /users/<user_id> tests
 
@@ -334,6 +594,45 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(user['email'], "u1@mail.com")
             self.assertEqual(user['id'], self.u1_id)
 
+    def test_get_user_fields_same_user(self):
+        """User can get only some of their own details"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/{self.u1_id}?fields=email,created_at",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            user = resp.json['user']
+            self.assertEqual(set(user), {"id", "email", "created_at"})
+            self.assertEqual(user['email'], "u1@mail.com")
+
+    def test_get_user_fail_invalid_fields_same_user(self):
+        """User gets errors for fields that are not returned"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/{self.u1_id}?fields=password",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(
+                resp.json['errors'],
+                {'fields': ['Invalid field(s): password']}
+            )
+
+    def test_get_user_fail_not_found_admin(self):
+        """Admin gets a 404 for a user that does not exist"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/0",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 404)
+
     def test_get_user_fail_diff_user(self):
         """User can NOT get another user's details"""
 
@@ -367,6 +666,40 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(resp.status_code, 401)
             self.assertEqual(resp.json['errors'], "Invalid token")
 
+    def test_get_user_verifies_token_once(self):
+        """Token is verified once per request, not again by the route"""
+
+        with patch.object(
+            jwt_auth,
+            "verify_jwt_in_request",
+            wraps=jwt_auth.verify_jwt_in_request
+        ) as verify:
+            with self.client as c:
+                resp = c.get(
+                    f"/users/{self.u1_id}",
+                    headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+                )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(verify.call_count, 1)
+
+    def test_preflight_skips_token(self):
+        """CORS preflight does not verify a token"""
+
+        with patch.object(
+            jwt_auth,
+            "verify_jwt_in_request",
+            wraps=jwt_auth.verify_jwt_in_request
+        ) as verify:
+            with self.client as c:
+                resp = c.options(
+                    f"/users/{self.u1_id}",
+                    headers={"AUTHORIZATION": f"Bearer {BAD_TOKEN}"}
+                )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(verify.call_count, 0)
+
 ########################################################################
 # GET /users/<user_id>/experiences tests
 
@@ -386,9 +719,9 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(len(resp.json['user_experiences']), 3)
             self.assertIn(
                 {
-                    "date": "2022-01-05T00:00:00",
-                    "sign_in_time": "2022-01-05T08:00:00",
-                    "sign_out_time": "2022-01-05T10:00:00",
+                    "date": "2022-01-05T00:00:00.000000",
+                    "sign_in_time": "2022-01-05T08:00:00.000000",
+                    "sign_out_time": "2022-01-05T10:00:00.000000",
                     "department": "lab",
                     "user_id": self.u1_id
                 },
@@ -396,9 +729,9 @@ class UsersViewsTestCase(TestCase):
             )
             self.assertIn(
                 {
-                    "date": "2022-01-08T00:00:00",
-                    "sign_in_time": "2022-01-08T12:00:00",
-                    "sign_out_time": "2022-01-08T16:00:00",
+                    "date": "2022-01-08T00:00:00.000000",
+                    "sign_in_time": "2022-01-08T12:00:00.000000",
+                    "sign_out_time": "2022-01-08T16:00:00.000000",
                     "department": "pharmacy",
                     "user_id": self.u1_id
                 },
@@ -406,8 +739,8 @@ class UsersViewsTestCase(TestCase):
             )
             self.assertIn(
                 {
-                    "date": "2022-01-10T00:00:00",
-                    "sign_in_time": "2022-01-10T12:00:00",
+                    "date": "2022-01-10T00:00:00.000000",
+                    "sign_in_time": "2022-01-10T12:00:00.000000",
                     "sign_out_time": None,
                     "department": "pharmacy",
                     "user_id": self.u1_id
@@ -415,6 +748,43 @@ class UsersViewsTestCase(TestCase):
                 user_experiences
             )
 
+    def test_get_user_experiences_skips_users_table(self):
+        """Authorized from token claims, without querying users"""
+
+        with self.client as c:
+            # Warm the token version cache
+            c.get(
+                f"/users/{self.u1_id}/experiences",
+                headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+            )
+
+            with count_statements() as statements:
+                resp = c.get(
+                    f"/users/{self.u1_id}/experiences",
+                    headers={"AUTHORIZATION": f"Bearer {self.admin_token}"}
+                )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse(
+                [s for s in statements if "FROM users" in s]
+            )
+
+    def test_get_user_experiences_fail_after_privilege_change(self):
+        """Token minted before a change to admin rights is rejected"""
+
+        u1 = User.query.get(self.u1_id)
+        u1.is_admin = True
+        db.session.commit()
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/{self.u1_id}/experiences",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            self.assertEqual(resp.status_code, 401)
+            self.assertEqual(resp.json['errors'], "Invalid token")
+
     def test_get_all_user_experiences_success_admin(self):
         """Admin can successfully get list of a user's experiences"""
 
@@ -431,9 +801,9 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(len(resp.json['user_experiences']), 3)
             self.assertIn(
                 {
-                    "date": "2022-01-05T00:00:00",
-                    "sign_in_time": "2022-01-05T08:00:00",
-                    "sign_out_time": "2022-01-05T10:00:00",
+                    "date": "2022-01-05T00:00:00.000000",
+                    "sign_in_time": "2022-01-05T08:00:00.000000",
+                    "sign_out_time": "2022-01-05T10:00:00.000000",
                     "department": "lab",
                     "user_id": self.u1_id
                 },
@@ -441,9 +811,9 @@ class UsersViewsTestCase(TestCase):
             )
             self.assertIn(
                 {
-                    "date": "2022-01-08T00:00:00",
-                    "sign_in_time": "2022-01-08T12:00:00",
-                    "sign_out_time": "2022-01-08T16:00:00",
+                    "date": "2022-01-08T00:00:00.000000",
+                    "sign_in_time": "2022-01-08T12:00:00.000000",
+                    "sign_out_time": "2022-01-08T16:00:00.000000",
                     "department": "pharmacy",
                     "user_id": self.u1_id
                 },
@@ -451,8 +821,8 @@ class UsersViewsTestCase(TestCase):
             )
             self.assertIn(
                 {
-                    "date": "2022-01-10T00:00:00",
-                    "sign_in_time": "2022-01-10T12:00:00",
+                    "date": "2022-01-10T00:00:00.000000",
+                    "sign_in_time": "2022-01-10T12:00:00.000000",
                     "sign_out_time": None,
                     "department": "pharmacy",
                     "user_id": self.u1_id
@@ -479,8 +849,8 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(len(resp.json['user_experiences']), 1)
             self.assertIn(
                 {
-                    "date": "2022-01-10T00:00:00",
-                    "sign_in_time": "2022-01-10T12:00:00",
+                    "date": "2022-01-10T00:00:00.000000",
+                    "sign_in_time": "2022-01-10T12:00:00.000000",
                     "sign_out_time": None,
                     "department": "pharmacy",
                     "user_id": self.u1_id
@@ -507,8 +877,8 @@ class UsersViewsTestCase(TestCase):
             self.assertEqual(len(resp.json['user_experiences']), 1)
             self.assertIn(
                 {
-                    "date": "2022-01-10T00:00:00",
-                    "sign_in_time": "2022-01-10T12:00:00",
+                    "date": "2022-01-10T00:00:00.000000",
+                    "sign_in_time": "2022-01-10T12:00:00.000000",
                     "sign_out_time": None,
                     "department": "pharmacy",
                     "user_id": self.u1_id
@@ -516,6 +886,45 @@ class UsersViewsTestCase(TestCase):
                 user_experiences
             )
 
+    def test_get_user_experiences_pages_same_user(self):
+        """User can page through their own experiences with limit and cursor"""
+
+        with self.client as c:
+            resp1 = c.get(
+                f"/users/{self.u1_id}/experiences?limit=2",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+            resp2 = c.get(
+                f"/users/{self.u1_id}/experiences?limit=2&cursor={resp1.json['next_cursor']}",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            self.assertEqual(len(resp1.json['user_experiences']), 2)
+            self.assertEqual(resp1.json['limit'], 2)
+            self.assertEqual(len(resp2.json['user_experiences']), 1)
+            self.assertEqual(
+                resp2.json['user_experiences'][0]['sign_in_time'],
+                "2022-01-10T12:00:00.000000"
+            )
+            self.assertIsNone(resp2.json['next_cursor'])
+
+    def test_get_user_experiences_fields_same_user(self):
+        """User can get only some fields of their experiences"""
+
+        with self.client as c:
+            resp = c.get(
+                f"/users/{self.u1_id}/experiences?fields=date",
+                headers={"AUTHORIZATION": f"Bearer {self.u1_token}"}
+            )
+
+            for e in resp.json['user_experiences']:
+                self.assertEqual(set(e), {"id", "date"})
+
+            self.assertIn(
+                "2022-01-05T00:00:00.000000",
+                [e['date'] for e in resp.json['user_experiences']]
+            )
+
     def test_get_no_user_experiences_success_same_user(self):
         """Same user gets an empty list if they have no experiences"""
 
@@ -5,6 +5,8 @@ from models.Experience import Experience
 from datetime import datetime
 # from dateutil import relativedelta
 
+app.app_context().push()
+
 print("SEEDING")
 db.create_all()
 Experience.__table__.drop(db.engine)
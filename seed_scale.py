@@ -0,0 +1,341 @@
+"""
+Seed a production-sized database: volunteers with languages, trainings and
+shift-shaped experience histories, generated deterministically from --seed.
+
+Drops and recreates all tables, like seed.py. Rows are loaded with COPY in
+batches, and every user shares one password hash ("password"), so
+100k users and 10M experiences load in minutes:
+    python seed_scale.py --users 100000 --experiences 10000000
+"""
+
+import argparse
+import csv
+import io
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from app import app
+from hashing import password_hasher
+from models.models import db
+from models.User import (
+    RACE_OPTIONS, ETHNICITY_OPTIONS, ETHNIC_BACKGROUND_OPTIONS
+)
+from models.Experience import Experience
+from models.UserHoursSummary import UserHoursSummary
+# Imported so create_all creates their tables
+from models.Language import Language  # noqa: F401
+from models.Training import Training  # noqa: F401
+from models.RefreshToken import RefreshToken  # noqa: F401
+
+PASSWORD = "password"
+
+BATCH_SIZE = 100000
+
+# Experiences are spread over the HISTORY_DAYS up to END_DATE
+END_DATE = date(2024, 6, 30)
+HISTORY_DAYS = 3 * 365
+
+# One admin per ADMIN_EVERY users
+ADMIN_EVERY = 1000
+
+# Share of experiences in the last day still signed in to ("incomplete")
+OPEN_SHARE = 0.5
+
+FIRST_NAMES = (
+    "Ana", "Ben", "Carla", "David", "Elena", "Farah", "George", "Hana",
+    "Ivan", "Jamal", "Kim", "Luis", "Maya", "Noah", "Olivia", "Priya",
+    "Quinn", "Rosa", "Sam", "Tariq", "Uma", "Victor", "Wen", "Yusuf",
+)
+LAST_NAMES = (
+    "Garcia", "Smith", "Nguyen", "Johnson", "Kim", "Patel", "Brown",
+    "Lopez", "Chen", "Williams", "Rodriguez", "Davis", "Ali", "Martinez",
+    "Wilson", "Okafor", "Cohen", "Singh", "Park", "Rivera",
+)
+GENDERS = ("Female", "Male", "Non-binary", "Prefer not to say")
+PRONOUNS = ("she/her", "he/him", "they/them", None)
+CITIES = (
+    ("New York", "NY", "100"), ("Brooklyn", "NY", "112"),
+    ("Jersey City", "NJ", "073"), ("Newark", "NJ", "071"),
+    ("Yonkers", "NY", "107"),
+)
+STATUSES = (("active", 80), ("new", 15), ("inactive", 5))
+DEPARTMENTS = (
+    ("front desk", 30), ("lab", 20), ("pharmacy", 20), ("triage", 15),
+    ("outreach", 10), ("interpretation", 5),
+)
+LANGUAGES = (
+    "spanish", "mandarin", "cantonese", "bengali", "haitian creole",
+    "russian", "korean", "arabic", "french", "urdu",
+)
+FLUENCIES = ("basic", "conversational", "proficient", "native")
+TRAININGS = (
+    ("Orientation", "front desk"), ("HIPAA", "front desk"),
+    ("Phlebotomy", "lab"), ("Lab safety", "lab"),
+    ("Medication dispensing", "pharmacy"), ("Vitals", "triage"),
+    ("Medical interpretation", "interpretation"),
+)
+
+# Shift starts (minute of the day) and lengths (minutes), with weights
+SHIFT_STARTS = ((7 * 60, 20), (8 * 60, 30), (12 * 60, 25), (13 * 60, 10),
+                (17 * 60, 15))
+SHIFT_LENGTHS = ((2 * 60, 15), (4 * 60, 50), (6 * 60, 20), (8 * 60, 15))
+
+USER_COLUMNS = (
+    "id", "badge_number", "email", "password", "status", "first_name",
+    "last_name", "dob", "gender", "pronouns", "race", "ethnicity", "address",
+    "city", "state", "zip_code", "phone_number", "is_student",
+    "is_healthcare_provider", "is_multilingual", "is_admin", "created_at",
+)
+LANGUAGE_COLUMNS = ("user_id", "language", "fluency")
+TRAINING_COLUMNS = ("user_id", "date", "name", "description", "department")
+EXPERIENCE_COLUMNS = (
+    "user_id", "date", "sign_in_time", "sign_out_time", "department",
+)
+
+
+def weighted(rng, choices):
+    """Pick from (value, weight) pairs"""
+
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def generate_users(rng, count, pw_hash):
+    """Yield USER_COLUMNS rows for `count` users, with ids from 1"""
+
+    start = END_DATE - timedelta(days=HISTORY_DAYS)
+
+    for id in range(1, count + 1):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        city, state, zip_prefix = rng.choice(CITIES)
+        dob = date(rng.randint(1950, 2005), rng.randint(1, 12),
+            rng.randint(1, 28))
+        created_at = start + timedelta(days=rng.randrange(HISTORY_DAYS))
+
+        yield (
+            id,
+            id,
+            f"{first_name}.{last_name}.{id}@example.com".lower(),
+            pw_hash,
+            weighted(rng, STATUSES),
+            first_name,
+            last_name,
+            f"{dob.isoformat()}T00:00:00",
+            rng.choice(GENDERS),
+            rng.choice(PRONOUNS),
+            rng.choice(RACE_OPTIONS),
+            rng.choice(ETHNICITY_OPTIONS + ETHNIC_BACKGROUND_OPTIONS),
+            f"{rng.randint(1, 999)} {rng.choice(LAST_NAMES)} St",
+            city,
+            state,
+            f"{zip_prefix}{rng.randint(0, 99):02}",
+            f"{rng.randint(200, 999)}{rng.randint(0, 9999999):07}",
+            rng.random() < 0.4,
+            rng.random() < 0.2,
+            rng.random() < 0.3,
+            id % ADMIN_EVERY == 1,
+            f"{created_at.isoformat()} 09:00:00",
+        )
+
+
+def generate_languages(rng, users):
+    """Yield LANGUAGE_COLUMNS rows: one or two for each multilingual user"""
+
+    for user in users:
+        if user[USER_COLUMNS.index("is_multilingual")]:
+            for language in rng.sample(LANGUAGES, rng.randint(1, 2)):
+                yield (user[0], language, rng.choice(FLUENCIES))
+
+
+def generate_trainings(rng, users):
+    """Yield TRAINING_COLUMNS rows: one to three for each user"""
+
+    start = END_DATE - timedelta(days=HISTORY_DAYS)
+
+    for user in users:
+        for name, department in rng.sample(TRAININGS, rng.randint(1, 3)):
+            day = start + timedelta(days=rng.randrange(HISTORY_DAYS))
+            yield (user[0], f"{day.isoformat()} 10:00:00", name,
+                f"{name} training", department)
+
+
+def get_experience_counts(rng, users, experiences):
+    """
+    Split `experiences` across users, heavy-tailed as real volunteering is:
+    most volunteer a few times, a few volunteer every week.
+    """
+
+    weights = [rng.paretovariate(1.2) for _ in range(users)]
+    total = sum(weights)
+    counts = [int(experiences * w / total) for w in weights]
+
+    # Hand out what rounding down left over
+    for i in rng.sample(range(users), experiences - sum(counts)):
+        counts[i] += 1
+
+    return counts
+
+
+def generate_experiences(rng, counts):
+    """
+    Yield EXPERIENCE_COLUMNS rows: for each user, counts[i] shifts at the
+    usual start times and lengths, give or take a few minutes.
+    Shifts on END_DATE are sometimes still open.
+    """
+
+    days = [
+        (END_DATE - timedelta(days=d)).isoformat()
+        for d in range(HISTORY_DAYS)
+    ]
+    times = [f"{m // 60:02}:{m % 60:02}:00" for m in range(24 * 60)]
+
+    start_values, start_weights = zip(*SHIFT_STARTS)
+    length_values, length_weights = zip(*SHIFT_LENGTHS)
+    department_values, department_weights = zip(*DEPARTMENTS)
+
+    for i, count in enumerate(counts):
+        if not count:
+            continue
+
+        user_id = i + 1
+        starts = rng.choices(start_values, start_weights, k=count)
+        lengths = rng.choices(length_values, length_weights, k=count)
+        departments = rng.choices(
+            department_values, department_weights, k=count
+        )
+
+        for start, length, department in zip(starts, lengths, departments):
+            d = rng.randrange(HISTORY_DAYS)
+            sign_in = start + rng.randint(-10, 10)
+            sign_out = min(sign_in + length + rng.randint(-15, 15), 24 * 60 - 1)
+            day = days[d]
+
+            if d == 0 and rng.random() < OPEN_SHARE:
+                sign_out_time = None
+            else:
+                sign_out_time = f"{day} {times[sign_out]}"
+
+            yield (
+                user_id,
+                f"{day} 00:00:00",
+                f"{day} {times[sign_in]}",
+                sign_out_time,
+                department,
+            )
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Load rows into table with COPY, BATCH_SIZE rows at a time"""
+
+    sql = (
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    )
+    loaded = 0
+
+    while True:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        batch = 0
+        for row in rows:
+            # None is written as an empty, unquoted field: NULL in COPY csv
+            writer.writerow(row)
+            batch += 1
+            if batch == BATCH_SIZE:
+                break
+
+        if not batch:
+            return loaded
+
+        # As bytes, so they are sent as UTF-8 whatever the client encoding
+        cursor.copy_expert(sql, io.BytesIO(buffer.getvalue().encode()))
+        loaded += batch
+
+        if batch < BATCH_SIZE:
+            return loaded
+
+
+def seed(users, experiences, seed):
+    """Recreate all tables and load the generated rows"""
+
+    rng = random.Random(seed)
+
+    db.drop_all()
+    db.create_all()
+
+    # Indexing experiences once loaded is faster than row by row
+    for index in Experience.__table__.indexes:
+        index.drop(db.engine)
+
+    pw_hash = password_hasher.generate_password_hash(PASSWORD)
+    user_rows = list(generate_users(rng, users, pw_hash))
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+
+        for table, columns, rows in (
+            ("users", USER_COLUMNS, iter(user_rows)),
+            ("languages", LANGUAGE_COLUMNS, generate_languages(rng, user_rows)),
+            ("trainings", TRAINING_COLUMNS, generate_trainings(rng, user_rows)),
+            (
+                "experiences",
+                EXPERIENCE_COLUMNS,
+                generate_experiences(
+                    rng,
+                    get_experience_counts(rng, users, experiences)
+                ),
+            ),
+        ):
+            start = time.perf_counter()
+            loaded = copy_rows(cursor, table, columns, rows)
+            print(
+                f"{table:<12} {loaded:>10} rows "
+                f"{time.perf_counter() - start:8.1f} s",
+                file=sys.stderr
+            )
+
+        # Ids were given explicitly, so move the sequence past them
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), %s)",
+            (max(users, 1),)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+    start = time.perf_counter()
+    for index in Experience.__table__.indexes:
+        index.create(db.engine)
+    print(f"{'indexes':<12} {time.perf_counter() - start:25.1f} s",
+        file=sys.stderr)
+
+    start = time.perf_counter()
+    UserHoursSummary.rebuild()
+    db.session.commit()
+    print(f"{'summary':<12} {time.perf_counter() - start:25.1f} s",
+        file=sys.stderr)
+
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--experiences", type=int, default=10000000)
+    parser.add_argument("--seed", type=int, default=1,
+        help="Random seed; the same seed always generates the same rows.")
+    args = parser.parse_args()
+
+    # The database is used outside of requests
+    app.app_context().push()
+    db.engine.echo = False
+    seed(args.users, args.experiences, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Streaming of list routes as newline delimited JSON (NDJSON) or CSV"""
+
+import queue
+import threading
+from flask import current_app, request, stream_with_context
+from models.models import db
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Rows fetched from the server-side cursor at a time
+STREAM_BATCH_SIZE = 1000
+
+# Bytes of CSV buffered per chunk, and chunks buffered before COPY waits
+COPY_CHUNK_SIZE = 64 * 1024
+COPY_QUEUE_SIZE = 16
+
+def wants_ndjson():
+    """Whether the request's Accept header prefers NDJSON over JSON"""
+
+    best = request.accept_mimetypes.best_match(
+        ["application/json", NDJSON_MIMETYPE]
+    )
+    return best == NDJSON_MIMETYPE
+
+def stream_ndjson(query, serialize):
+    """Stream the rows of a query as NDJSON, one serialized row per line.
+
+    Rows are read from a server-side cursor in batches of STREAM_BATCH_SIZE
+    and encoded as they are sent, so memory stays flat however many rows
+    there are, and the first line is sent as soon as the first batch is read.
+    """
+
+    def generate():
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield current_app.json.dumps(serialize(row)) + "\n"
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE
+    )
+
+class _CopyWriter:
+    """File-like target for COPY TO STDOUT, handing chunks to a bounded queue.
+
+    COPY blocks while the queue is full, so the database is never read
+    further ahead of the client than COPY_QUEUE_SIZE chunks. Once cancelled,
+    writes raise so COPY stops.
+    """
+
+    def __init__(self):
+        self.chunks = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+        self.cancelled = threading.Event()
+        self.buffer = []
+        self.buffered = 0
+        self.finished = False
+
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+        raise IOError("CSV export cancelled")
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+
+        if self.buffered >= COPY_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put(b"".join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+def stream_csv(statement, filename):
+    """Stream the rows of a select statement as a CSV attachment.
+
+    Rows are produced by Postgres with COPY ... TO STDOUT on a pooled
+    connection of their own and sent to the client as they arrive, so no
+    ORM objects are built and the result is never held in memory.
+    """
+
+    # The replica's engine, if the view reads from it
+    engine = db.session.get_bind()
+    connection = engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+
+        compiled = statement.compile(dialect=engine.dialect)
+        select_sql = cursor.mogrify(str(compiled), compiled.params).decode()
+        copy_sql = f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+        writer = _CopyWriter()
+
+        def copy():
+            try:
+                cursor.copy_expert(copy_sql, writer)
+                writer.flush()
+                writer.put(None)
+            except Exception as e:
+                if not writer.cancelled.is_set():
+                    writer.put(e)
+
+        thread = threading.Thread(target=copy, daemon=True)
+        thread.start()
+    except Exception:
+        # Nothing ran on it: return it to the pool rather than leak it
+        connection.close()
+        raise
+
+    def generate():
+        while True:
+            chunk = writer.chunks.get()
+            if chunk is None:
+                writer.finished = True
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def close():
+        writer.cancelled.set()
+        thread.join()
+        if writer.finished:
+            connection.close()
+        else:
+            # COPY was interrupted; don't return the connection to the pool
+            connection.invalidate()
+
+    response = current_app.response_class(
+        generate(),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+    # Called once the response is sent, or the client goes away
+    response.call_on_close(close)
+
+    return response